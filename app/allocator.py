@@ -0,0 +1,141 @@
+import hashlib
+from typing import Optional
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+from app.models import CodeSequence
+from app.utils import BASE62_CHARS
+
+FEISTEL_ROUNDS = 4
+
+
+class CodePermutation:
+    """Keyed bijection between integers and fixed-length Base62 codes.
+
+    A balanced Feistel network over the smallest even bit width covering
+    62**length, with cycle walking to stay inside the code space, so
+    consecutive IDs map to unrelated-looking codes and back.
+    """
+
+    def __init__(self, length: int, secret: str):
+        self.length = length
+        self.size = len(BASE62_CHARS) ** length
+        self.half_bits = ((self.size - 1).bit_length() + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self._key = hashlib.sha256(secret.encode()).digest()[:32]
+
+    def _round(self, value: int, round_number: int) -> int:
+        digest = hashlib.blake2b(
+            value.to_bytes(16, "big"), key=self._key, digest_size=16, person=bytes([round_number]) * 16
+        ).digest()
+        return int.from_bytes(digest, "big") & self.half_mask
+
+    def _feistel(self, x: int) -> int:
+        left, right = x >> self.half_bits, x & self.half_mask
+        for i in range(FEISTEL_ROUNDS):
+            left, right = right, left ^ self._round(right, i)
+        return (left << self.half_bits) | right
+
+    def _feistel_inverse(self, x: int) -> int:
+        left, right = x >> self.half_bits, x & self.half_mask
+        for i in reversed(range(FEISTEL_ROUNDS)):
+            left, right = right ^ self._round(left, i), left
+        return (left << self.half_bits) | right
+
+    def permute(self, n: int) -> int:
+        if not 0 <= n < self.size:
+            raise ValueError("ID outside the code space")
+        n = self._feistel(n)
+        while n >= self.size:
+            n = self._feistel(n)
+        return n
+
+    def unpermute(self, n: int) -> int:
+        n = self._feistel_inverse(n)
+        while n >= self.size:
+            n = self._feistel_inverse(n)
+        return n
+
+    def encode(self, n: int) -> str:
+        """Map an ID to its short code."""
+        value = self.permute(n)
+        chars = []
+        for _ in range(self.length):
+            value, digit = divmod(value, len(BASE62_CHARS))
+            chars.append(BASE62_CHARS[digit])
+        return "".join(reversed(chars))
+
+    def decode(self, code: str) -> int:
+        """Map a short code produced by encode back to its ID."""
+        value = 0
+        for char in code:
+            value = value * len(BASE62_CHARS) + BASE62_CHARS.index(char)
+        return self.unpermute(value)
+
+
+class ShortCodeAllocator:
+    """Hands out unique short codes from ID blocks reserved in the database.
+
+    Each worker reserves ``block_size`` IDs at a time with one atomic
+    upsert, so codes never collide between workers and creating a link
+    needs no uniqueness query.
+    """
+
+    SEQUENCE_NAME = "short_code"
+
+    def __init__(self, block_size: int, length: int, secret: str):
+        self.block_size = block_size
+        self.permutation = CodePermutation(length, secret)
+        self._next: Optional[int] = None
+        self._end = 0
+
+    async def _reserve(self, engine: AsyncEngine, count: int) -> int:
+        """Reserve count IDs and return the first one."""
+        stmt = insert(CodeSequence).values(name=self.SEQUENCE_NAME, next_value=count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"next_value": CodeSequence.next_value + count},
+        ).returning(CodeSequence.next_value)
+        # Committed on its own so a rolled back request never hands the block out twice
+        async with engine.begin() as conn:
+            end = (await conn.execute(stmt)).scalar_one()
+        return end - count
+
+    async def allocate(self, engine: AsyncEngine) -> str:
+        """Return a short code no other allocator sharing the database will produce.
+
+        Call it before the request's session checks out a connection: the
+        reservation runs in its own transaction on the same engine.
+        """
+        if self._next is None or self._next >= self._end:
+            self._next = await self._reserve(engine, self.block_size)
+            self._end = self._next + self.block_size
+        n = self._next
+        self._next += 1
+        return self.permutation.encode(n)
+
+    async def allocate_many(self, engine: AsyncEngine, count: int) -> list[str]:
+        """Return count codes, taking what is left of the current block first."""
+        codes = []
+        while count > 0 and self._next is not None and self._next < self._end:
+            codes.append(self.permutation.encode(self._next))
+            self._next += 1
+            count -= 1
+        if count > 0:
+            start = await self._reserve(engine, count)
+            codes.extend(self.permutation.encode(n) for n in range(start, start + count))
+        return codes
+
+    def reset(self) -> None:
+        """Discard the current block. Useful for testing."""
+        self._next = None
+        self._end = 0
+
+
+short_code_allocator = ShortCodeAllocator(
+    block_size=settings.SHORT_CODE_BLOCK_SIZE,
+    length=settings.SHORT_CODE_LENGTH,
+    secret=settings.SHORT_CODE_SECRET,
+)
@@ -1,4 +1,8 @@
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
@@ -16,23 +20,96 @@ def create_access_token(subject: str) -> str:
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
 
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
-    """Dependency: verify JWT and return the subject."""
-    token = credentials.credentials
+class TokenCache:
+    """Bounded LRU of verified tokens, so repeat requests skip signature checks.
+
+    Keyed by the token's SHA-256 digest. Entries expire with the token's
+    ``exp`` claim, and the whole cache is dropped when JWT_SECRET or
+    JWT_ALGORITHM changes. Only valid tokens are cached.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[bytes, tuple[str, float]] = OrderedDict()
+        self._key_fingerprint: Optional[bytes] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_signing_key(self) -> None:
+        fingerprint = hashlib.sha256(f"{settings.JWT_ALGORITHM}:{settings.JWT_SECRET}".encode()).digest()
+        if fingerprint != self._key_fingerprint:
+            self._entries.clear()
+            self._key_fingerprint = fingerprint
+
+    def get(self, token: str) -> Optional[str]:
+        """Return the cached subject for a token, or None on a miss."""
+        self._check_signing_key()
+        key = hashlib.sha256(token.encode()).digest()
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, token: str, subject: str, expires_at: float) -> None:
+        if self.max_size <= 0:
+            return
+        self._check_signing_key()
+        key = hashlib.sha256(token.encode()).digest()
+        self._entries[key] = (subject, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all entries and reset counters. Useful for testing."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_MAX_SIZE)
+
+
+def decode_token(token: str) -> Optional[str]:
+    """Return the subject of a valid JWT, or None."""
+    subject = token_cache.get(token)
+    if subject is not None:
+        return subject
     try:
         payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        subject: str = payload.get("sub")
-        if subject is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token",
-            )
-        return subject
     except JWTError:
+        return None
+    subject = payload.get("sub")
+    # Tokens without an expiry are never cached: there is nothing to bound the entry by
+    if subject is not None and isinstance(payload.get("exp"), (int, float)):
+        token_cache.set(token, subject, payload["exp"])
+    return subject
+
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """Dependency: verify JWT and return the subject."""
+    subject = decode_token(credentials.credentials)
+    if subject is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
         )
+    return subject
 
 
 def verify_admin_credentials(username: str, password: str) -> bool:
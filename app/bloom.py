@@ -0,0 +1,161 @@
+"""Bloom filter of existing short codes, so unknown codes 404 without a link lookup."""
+import hashlib
+import math
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Link
+from app.tasks import BackgroundTask
+
+BUILD_BATCH_SIZE = 10000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for a capacity and false-positive rate."""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = max(capacity, 1)
+        self.fp_rate = fp_rate
+        self.num_bits = max(8, math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def estimated_fp_rate(self) -> float:
+        """False-positive rate expected at the current number of items."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class ShortCodeFilter(BackgroundTask):
+    """Bloom filter over links.short_code, kept in step with the table.
+
+    Until ``build`` has run the filter is not ready and every code is
+    treated as possibly present. Codes created in this process are added
+    directly; codes created by other workers are picked up by ``refresh``,
+    which loads rows with a higher id than any seen so far. A background
+    task refreshes every ``refresh_interval`` seconds, so a code created on
+    another worker may 404 here for up to that long, and rebuilds a larger
+    filter once it holds more codes than it was sized for. Misses never
+    query the database. Codes already in the filter, e.g. added locally
+    and then loaded by a refresh, are not counted again. Deleted links
+    stay in the filter and only cost the usual database lookup.
+    """
+
+    failure_message = "Short code filter refresh failed"
+    read_only = True
+    # The lifespan builds the filter before starting the task
+    run_on_start = False
+
+    def __init__(self, capacity: int, fp_rate: float, refresh_interval: float, session_factory=None):
+        super().__init__(refresh_interval, session_factory)
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self._bloom: Optional[BloomFilter] = None
+        self._max_id = 0
+        self.rejected = 0
+        self.passed = 0
+        self.rebuilds = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._bloom is not None
+
+    async def build(self, session: AsyncSession) -> None:
+        """(Re)build the filter from the links table."""
+        rows = (await session.execute(select(func.count()).select_from(Link))).scalar_one()
+        bloom = BloomFilter(max(self.capacity, rows * 2), self.fp_rate)
+        max_id = 0
+        result = await session.stream(
+            select(Link.id, Link.short_code).execution_options(yield_per=BUILD_BATCH_SIZE)
+        )
+        async for link_id, short_code in result:
+            bloom.add(short_code)
+            max_id = max(max_id, link_id)
+        self._bloom = bloom
+        self._max_id = max_id
+
+    async def refresh(self, session: AsyncSession) -> None:
+        """Add links created since the last build or refresh."""
+        if self._bloom is None:
+            return
+        result = await session.execute(
+            select(Link.id, Link.short_code).where(Link.id > self._max_id)
+        )
+        for link_id, short_code in result.all():
+            self.add(short_code)
+            self._max_id = max(self._max_id, link_id)
+
+    @property
+    def over_capacity(self) -> bool:
+        return self._bloom is not None and self._bloom.count > self._bloom.capacity
+
+    async def run_once(self) -> None:
+        """Catch up with new links, and rebuild if the filter has outgrown its size."""
+        async with self._get_session_factory()() as session:
+            await self.refresh(session)
+            if self.over_capacity:
+                await self.build(session)
+                self.rebuilds += 1
+
+    def add(self, short_code: str) -> None:
+        if self._bloom is not None and short_code not in self._bloom:
+            self._bloom.add(short_code)
+
+    def might_exist(self, short_code: str) -> bool:
+        """False only if the code is not in the links table as of the last refresh."""
+        if self._bloom is None or short_code in self._bloom:
+            self.passed += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def reset(self) -> None:
+        """Drop the filter and counters. Useful for testing."""
+        self._bloom = None
+        self._max_id = 0
+        self.rejected = 0
+        self.passed = 0
+        self.rebuilds = 0
+
+    def stats(self) -> dict:
+        """Return size, memory footprint and rejection counters."""
+        bloom = self._bloom
+        return {
+            "ready": bloom is not None,
+            "running": self.running,
+            "items": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else self.capacity,
+            "fp_rate": self.fp_rate,
+            "estimated_fp_rate": round(bloom.estimated_fp_rate(), 6) if bloom else 0.0,
+            "memory_bytes": len(bloom.bits) if bloom else 0,
+            "hashes": bloom.num_hashes if bloom else 0,
+            "rejected": self.rejected,
+            "passed": self.passed,
+            "rebuilds": self.rebuilds,
+        }
+
+
+short_code_filter = ShortCodeFilter(
+    capacity=settings.BLOOM_FILTER_CAPACITY,
+    fp_rate=settings.BLOOM_FILTER_FP_RATE,
+    refresh_interval=settings.BLOOM_FILTER_REFRESH_INTERVAL_SECONDS,
+)
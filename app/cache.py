@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from app.config import settings
+from app.models import Link
+
+
+@dataclass
+class CachedLink:
+    """The subset of a Link needed to resolve a redirect."""
+
+    id: int
+    short_code: str
+    original_url: str
+    is_active: bool
+    expires_at: Optional[datetime]
+    max_clicks: Optional[int]
+    total_clicks: int
+    deactivated_reason: Optional[str] = None
+
+    @classmethod
+    def from_link(cls, link: Link) -> "CachedLink":
+        return cls(
+            id=link.id,
+            short_code=link.short_code,
+            original_url=link.original_url,
+            is_active=link.is_active,
+            expires_at=link.expires_at,
+            max_clicks=link.max_clicks,
+            total_clicks=link.total_clicks,
+            deactivated_reason=link.deactivated_reason,
+        )
+
+
+class LinkCache:
+    """Bounded LRU cache of resolved links with a per-entry TTL."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, CachedLink]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, short_code: str) -> Optional[CachedLink]:
+        """Return the cached link, or None on a miss or expired entry."""
+        entry = self._entries.get(short_code)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, link = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[short_code]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(short_code)
+        self.hits += 1
+        return link
+
+    def set(self, link: CachedLink) -> None:
+        """Store a link, evicting the least recently used entry if full."""
+        if self.max_size <= 0:
+            return
+        self._entries[link.short_code] = (time.monotonic(), link)
+        self._entries.move_to_end(link.short_code)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, short_code: str) -> None:
+        """Drop a link so the next lookup reloads it from the database."""
+        self._entries.pop(short_code, None)
+
+    def invalidate_all(self) -> None:
+        """Drop every entry, keeping the counters."""
+        self._entries.clear()
+
+    def clear(self) -> None:
+        """Drop all entries and reset counters. Useful for testing."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict:
+        """Return size and hit/miss/eviction counters."""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+link_cache = LinkCache(
+    max_size=settings.LINK_CACHE_MAX_SIZE,
+    ttl_seconds=settings.LINK_CACHE_TTL_SECONDS,
+)
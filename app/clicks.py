@@ -0,0 +1,196 @@
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import insert, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.metrics import clicks_written
+from app.models import Click, Link
+from app.rollups import apply_rollups
+from app.tasks import BackgroundTask
+from app.utils import insert_chunks
+from app.visitors import apply_visitor_sketches
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ClickEvent:
+    """A click waiting to be written to the database."""
+
+    link_id: int
+    ip_hash: str
+    referrer: Optional[str]
+    country: str
+    clicked_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    # Already added to Link.total_clicks by claim_click
+    counted: bool = False
+
+
+async def claim_click(session: AsyncSession, short_code: str) -> Optional[tuple[int, str, int]]:
+    """Count a click against a link if it can still be followed, in one statement.
+
+    Returns (link id, original URL, total clicks after this one), or None if
+    the link is missing, inactive, expired or at its click limit, in which
+    case nothing is changed. Concurrent claims can't exceed max_clicks. The
+    caller commits.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    result = await session.execute(
+        update(Link)
+        .where(
+            Link.short_code == short_code,
+            Link.is_active,
+            or_(Link.expires_at.is_(None), Link.expires_at > now),
+            or_(Link.max_clicks.is_(None), Link.total_clicks < Link.max_clicks),
+        )
+        .values(total_clicks=Link.total_clicks + 1)
+        .returning(Link.id, Link.original_url, Link.total_clicks)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    return tuple(row) if row is not None else None
+
+
+async def write_clicks(session: AsyncSession, events: list[ClickEvent]) -> None:
+    """Insert click rows, bump Link.total_clicks and update rollups and sketches.
+
+    The caller commits.
+    """
+    if not events:
+        return
+    rows = [asdict(e) for e in events]
+    for row in rows:
+        del row["counted"]
+    for chunk in insert_chunks(rows):
+        await session.execute(insert(Click).values(chunk))
+    for link_id, count in Counter(e.link_id for e in events if not e.counted).items():
+        await session.execute(
+            update(Link).where(Link.id == link_id).values(total_clicks=Link.total_clicks + count)
+        )
+    await apply_rollups(session, events)
+    await apply_visitor_sketches(session, events)
+    clicks_written.inc(amount=len(events))
+
+
+class ClickBuffer(BackgroundTask):
+    """Collects click events in memory and writes them to the database in batches.
+
+    Events are flushed when ``flush_size`` are pending or every
+    ``flush_interval`` seconds. When ``max_size`` events are pending, the
+    ``overflow`` policy decides: ``"block"`` makes the caller wait for a
+    flush, ``"drop"`` discards the event. Unlike the other background
+    tasks, ``stop`` lets the flush loop finish and drains the buffer.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        max_size: int = settings.CLICK_BUFFER_MAX_SIZE,
+        flush_size: int = settings.CLICK_BUFFER_FLUSH_SIZE,
+        flush_interval: float = settings.CLICK_BUFFER_FLUSH_INTERVAL_SECONDS,
+        overflow: str = settings.CLICK_BUFFER_OVERFLOW,
+    ):
+        if overflow not in ("block", "drop"):
+            raise ValueError(f"Unknown click buffer overflow policy: {overflow}")
+        super().__init__(flush_interval, session_factory)
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.overflow = overflow
+        self._pending: list[ClickEvent] = []
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        """Start the background flush loop."""
+        if self._task is None:
+            # Bind the synchronisation primitives to the running loop
+            self._flush_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+        super().start()
+
+    async def stop(self) -> None:
+        """Stop the flush loop and drain all pending events."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        while self._pending:
+            if not await self.flush():
+                logger.error("Discarding %d clicks that could not be written", len(self._pending))
+                self.dropped += len(self._pending)
+                self._pending.clear()
+
+    async def add(self, event: ClickEvent) -> bool:
+        """Queue a click. Returns False if it was dropped due to backpressure."""
+        if len(self._pending) >= self.max_size:
+            if self.overflow == "drop":
+                self.dropped += 1
+                return False
+            await self.flush()
+            if len(self._pending) >= self.max_size:
+                self.dropped += 1
+                return False
+        self._pending.append(event)
+        if len(self._pending) >= self.flush_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self) -> bool:
+        """Write all pending events in one transaction. Returns False on failure."""
+        async with self._flush_lock:
+            if not self._pending:
+                return True
+            batch, self._pending = self._pending, []
+            try:
+                async with self._get_session_factory()() as session:
+                    await write_clicks(session, batch)
+                    await session.commit()
+            except asyncio.CancelledError:
+                self._pending = batch + self._pending
+                raise
+            except Exception:
+                logger.exception("Failed to flush %d clicks", len(batch))
+                # Put the batch back in front of anything queued meanwhile
+                requeued = batch + self._pending
+                if len(requeued) > self.max_size:
+                    logger.error("Discarding %d clicks over the buffer limit", len(requeued) - self.max_size)
+                    self.dropped += len(requeued) - self.max_size
+                self._pending = requeued[: self.max_size]
+                return False
+            self.written += len(batch)
+            return True
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+
+click_buffer = ClickBuffer()
@@ -6,6 +6,13 @@ class Settings(BaseSettings):
     BASE_URL: str = "http://localhost:8000"
     DATABASE_URL: str = "sqlite+aiosqlite:///data/db.sqlite3"
 
+    # SQLite tuning (WAL, single writer + read-only reader pool)
+    SQLITE_TUNING: bool = True
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MiB
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_READ_POOL_SIZE: int = 4
+
     # Admin
     ADMIN_USERNAME: str = "admin"
     ADMIN_PASSWORD: str = "changeme"
@@ -14,15 +21,101 @@ class Settings(BaseSettings):
     JWT_SECRET: str = "change-this-to-a-random-secret"
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRE_MINUTES: int = 60
+    TOKEN_CACHE_MAX_SIZE: int = 1024  # verified tokens kept in memory
 
     # Rate limiting
     RATE_LIMIT_REQUESTS: int = 5
     RATE_LIMIT_WINDOW_SECONDS: int = 60
+    RATE_LIMIT_ROUTES: dict[str, str] = {}  # scope -> "requests/seconds"
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" or "sqlite" (shared across workers)
+    RATE_LIMIT_SQLITE_PATH: str = "data/rate_limits.sqlite3"
+    RATE_LIMIT_MAX_KEYS: int = 100000
 
     # Short codes
     SHORT_CODE_LENGTH: int = 8
+    SHORT_CODE_BLOCK_SIZE: int = 100
+    # Keys the ID -> code permutation; changing it reshuffles future codes.
+    # With the public default anyone can compute every code ever issued.
+    SHORT_CODE_SECRET: str = "change-this-to-a-random-secret"
+
+    # Bulk link creation
+    BULK_CREATE_MAX_ITEMS: int = 10000
+    BULK_CREATE_MAX_BYTES: int = 16777216  # 16 MiB
+    BULK_CREATE_BATCH_SIZE: int = 500
+
+    # Prometheus metrics at /metrics
+    METRICS_ENABLED: bool = True
+
+    # Slow-query log (0 disables) and Server-Timing profiling
+    SLOW_QUERY_THRESHOLD_MS: float = 100.0
+    PROFILING_SAMPLE_RATE: float = 0.0  # share of requests profiled
+    PROFILING_HEADER: str = "X-Profile"  # "X-Profile: 1" from an admin profiles one request
+
+    # Static HTML pages (served from memory; reload re-reads changed files, for development)
+    STATIC_MAX_AGE_SECONDS: int = 3600
+    STATIC_RELOAD: bool = False
+
+    # Bloom filter of existing short codes (unknown codes 404 without a link lookup)
+    BLOOM_FILTER_ENABLED: bool = True
+    BLOOM_FILTER_CAPACITY: int = 1000000
+    BLOOM_FILTER_FP_RATE: float = 0.01
+    BLOOM_FILTER_REFRESH_INTERVAL_SECONDS: float = 1.0  # background catch-up and resize
+
+    # Link cache invalidation across workers:
+    # "changelog" (link_changes table, SQLite file databases only) or "local"
+    INVALIDATION_CHANNEL: str = "changelog"
+    INVALIDATION_POLL_INTERVAL_SECONDS: float = 0.5
+    INVALIDATION_RETENTION_SECONDS: int = 3600
+
+    # Memory-mapped index of active links shared by all workers (redirect lookups)
+    LINK_INDEX_ENABLED: bool = True
+    LINK_INDEX_PATH: str = "data/link_index.bin"
+    LINK_INDEX_REFRESH_SECONDS: float = 5.0
+
+    # Link cache (redirect lookups)
+    LINK_CACHE_MAX_SIZE: int = 10000
+    LINK_CACHE_TTL_SECONDS: int = 60
+
+    # QR code cache ("" disables the on-disk layer)
+    QR_CACHE_MAX_ENTRIES: int = 1000
+    QR_CACHE_DIR: str = "data/qr_cache"
+    QR_CACHE_MAX_AGE_SECONDS: int = 86400
+
+    # QR rendering process pool (0 workers = one per CPU)
+    QR_POOL_ENABLED: bool = True
+    QR_POOL_WORKERS: int = 0
+
+    # Raw ASGI fast path for GET /{short_code} (needs the click buffer)
+    FAST_REDIRECT_ENABLED: bool = False
+
+    # Expiry sweeper: deactivates expired and click-exhausted links in the background
+    EXPIRY_SWEEP_ENABLED: bool = True
+    EXPIRY_SWEEP_INTERVAL_SECONDS: float = 60.0
+    EXPIRY_SWEEP_BATCH_SIZE: int = 1000
+
+    # Click retention: clicks older than this move to monthly archives (0 keeps them forever)
+    CLICK_RETENTION_DAYS: int = 0
+    CLICK_ARCHIVE_DIR: str = "data/click_archive"
+    CLICK_RETENTION_INTERVAL_SECONDS: int = 3600
+    CLICK_RETENTION_BATCH_SIZE: int = 50000
+
+    # Click buffer (write-behind click recording)
+    CLICK_BUFFER_ENABLED: bool = True
+    CLICK_BUFFER_MAX_SIZE: int = 10000
+    CLICK_BUFFER_FLUSH_SIZE: int = 500
+    CLICK_BUFFER_FLUSH_INTERVAL_SECONDS: float = 1.0
+    CLICK_BUFFER_OVERFLOW: str = "block"  # "block" or "drop"
 
     model_config = {"env_file": ".env", "env_file_encoding": "utf-8"}
 
 
+# Secrets whose defaults are public in the repository
+SECRETS = ("ADMIN_PASSWORD", "JWT_SECRET", "SHORT_CODE_SECRET")
+
+
+def default_secrets(settings: Settings) -> list[str]:
+    """Names of secrets still set to their public defaults."""
+    return [name for name in SECRETS if getattr(settings, name) == Settings.model_fields[name].default]
+
+
 settings = Settings()
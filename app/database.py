@@ -1,24 +1,165 @@
 import os
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import bindparam, event, inspect, select, text, update
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import SQLModel
 
 from app.config import settings
+from app.models import LINK_SEARCH_DDL, Link
+from app.profiling import instrument_engine
+from app.utils import link_domain
 
 # Ensure data directory exists
 os.makedirs("data", exist_ok=True)
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False)
+
+def _is_sqlite_file(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _tuning_pragmas() -> list[str]:
+    """Pragmas applied to every pooled SQLite connection."""
+    return [
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def _on_connect(pragmas: list[str]):
+    def apply(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return apply
+
+
+def _create_engines() -> tuple[AsyncEngine, AsyncEngine]:
+    """Create the writer and reader engines.
+
+    With SQLITE_TUNING on a file database, writes go through a single
+    pooled connection in WAL mode and reads through a pool of read-only
+    connections. Otherwise both names point at one default engine.
+    """
+    url = make_url(settings.DATABASE_URL)
+    if not settings.SQLITE_TUNING or not _is_sqlite_file(url):
+        default_engine = create_async_engine(url, echo=False)
+        return default_engine, default_engine
+
+    writer = create_async_engine(
+        url,
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+    )
+    event.listen(
+        writer.sync_engine,
+        "connect",
+        _on_connect(["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL", *_tuning_pragmas()]),
+    )
+
+    reader_url = url.set(
+        database=f"file:{url.database}",
+        query={**url.query, "mode": "ro", "uri": "true"},
+    )
+    reader = create_async_engine(
+        reader_url,
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.SQLITE_READ_POOL_SIZE,
+        max_overflow=0,
+    )
+    event.listen(
+        reader.sync_engine,
+        "connect",
+        _on_connect(["PRAGMA query_only=ON", *_tuning_pragmas()]),
+    )
+    return writer, reader
+
+
+engine, read_engine = _create_engines()
+instrument_engine(engine, "writer")
+if read_engine is not engine:
+    instrument_engine(read_engine, "reader")
 
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+read_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def _add_missing_columns(connection) -> None:
+    """create_all skips existing tables, so add nullable columns introduced since they were created."""
+    inspector = inspect(connection)
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+
+
+def _create_missing_indexes(connection) -> None:
+    """create_all skips existing tables, so add indexes introduced since they were created."""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _create_link_search(connection) -> None:
+    """Create the links_fts search index on databases that predate it, and fill it."""
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'links_fts'")
+    ).first()
+    for statement in LINK_SEARCH_DDL:
+        connection.execute(text(statement))
+    if not exists:
+        connection.execute(text("INSERT INTO links_fts(links_fts) VALUES ('rebuild')"))
+
+
+async def _backfill_link_domains(connection, batch_size: int = 1000) -> None:
+    """Fill Link.domain for links created before it existed."""
+    while True:
+        result = await connection.execute(
+            select(Link.id, Link.original_url).where(Link.domain.is_(None)).limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            return
+        await connection.execute(
+            update(Link).where(Link.id == bindparam("link_id")).values(domain=bindparam("link_domain")),
+            [{"link_id": link_id, "link_domain": link_domain(url)} for link_id, url in rows],
+        )
 
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
+        await conn.run_sync(_create_link_search)
+        await _backfill_link_domains(conn)
 
 
 async def get_session():
     async with async_session() as session:
         yield session
+
+
+async def get_read_session():
+    """Session for read-only routes, served from the reader pool."""
+    async with read_session() as session:
+        yield session
+
+
+def get_read_session_factory():
+    """Reader session factory for work that outlives the request, e.g. streamed responses."""
+    return read_session
@@ -0,0 +1,105 @@
+"""Background sweeper deactivating expired and click-exhausted links.
+
+Every EXPIRY_SWEEP_INTERVAL_SECONDS it sets ``is_active`` to False, with
+``deactivated_reason`` "expired" or "click_limit", on links past their
+``expires_at`` or ``max_clicks``. Both conditions are found through
+indexes, and links are updated in batches of EXPIRY_SWEEP_BATCH_SIZE so
+the writer is never held for long. Deactivated codes are published on
+the invalidation channel so every worker drops its cached copy.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.invalidation import invalidation_channel
+from app.metrics import links_deactivated
+from app.models import Link
+from app.tasks import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+
+def _conditions(now: datetime) -> dict[str, tuple]:
+    return {
+        "expired": (Link.expires_at.is_not(None), Link.expires_at <= now),
+        "click_limit": (Link.max_clicks.is_not(None), Link.total_clicks >= Link.max_clicks),
+    }
+
+
+async def sweep_expired(
+    session: AsyncSession,
+    now: Optional[datetime] = None,
+    batch_size: int = settings.EXPIRY_SWEEP_BATCH_SIZE,
+) -> dict[str, int]:
+    """Deactivate links past their expiry or click limit. Returns links deactivated per reason.
+
+    Commits after each batch.
+    """
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).replace(tzinfo=None)
+    counts = {}
+    for reason, conditions in _conditions(now).items():
+        counts[reason] = 0
+        while True:
+            ids = select(Link.id).where(Link.is_active, *conditions).limit(batch_size)
+            result = await session.execute(
+                update(Link)
+                .where(Link.id.in_(ids.scalar_subquery()))
+                .values(is_active=False, deactivated_reason=reason, updated_at=now)
+                .returning(Link.short_code)
+                .execution_options(synchronize_session=False)
+            )
+            codes = list(result.scalars())
+            await session.commit()
+            if not codes:
+                break
+            await invalidation_channel.publish(codes)
+            counts[reason] += len(codes)
+            links_deactivated.inc(reason, amount=len(codes))
+    return counts
+
+
+class ExpirySweeper(BackgroundTask):
+    """Background task running ``sweep_expired`` every ``interval`` seconds."""
+
+    failure_message = "Expiry sweep failed"
+
+    def __init__(self, interval: float, batch_size: int, session_factory=None):
+        super().__init__(interval, session_factory)
+        self.batch_size = batch_size
+        self.deactivated = {"expired": 0, "click_limit": 0}
+        self.last_sweep: Optional[dict[str, int]] = None
+        self.last_run_at: Optional[datetime] = None
+
+    async def run_once(self) -> dict[str, int]:
+        """Sweep once. Returns links deactivated per reason."""
+        async with self._get_session_factory()() as session:
+            counts = await sweep_expired(session, batch_size=self.batch_size)
+        for reason, count in counts.items():
+            self.deactivated[reason] += count
+        self.last_sweep = counts
+        self.last_run_at = datetime.now(timezone.utc)
+        if any(counts.values()):
+            logger.info(
+                "Deactivated %d expired and %d click-exhausted links",
+                counts["expired"],
+                counts["click_limit"],
+            )
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "deactivated": dict(self.deactivated),
+            "last_sweep": self.last_sweep,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
+
+
+expiry_sweeper = ExpirySweeper(
+    interval=settings.EXPIRY_SWEEP_INTERVAL_SECONDS,
+    batch_size=settings.EXPIRY_SWEEP_BATCH_SIZE,
+)
@@ -0,0 +1,139 @@
+"""Raw ASGI fast path for ``GET /{short_code}``.
+
+Redirects are most of the traffic, and FastAPI's routing, dependency
+injection and response classes dominate their CPU cost. With
+FAST_REDIRECT_ENABLED, this middleware answers them before the router:
+it resolves the link via the link index, the link cache or one Core select, and sends a
+prebuilt 302. It hands the click to the click buffer. Anything else falls
+through to the app, as do links with a click limit, whose clicks the
+router claims atomically, and everything while the click buffer isn't
+running, since that is what lets clicks be deferred. Status codes and
+error bodies match the routed handler. Lookups use the session factory in
+``app.state.read_session_factory``, which the app sets to the read-only pool.
+"""
+import json
+import time
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import quote
+
+from sqlalchemy import bindparam, select
+
+from app.bloom import short_code_filter
+from app.cache import CachedLink, link_cache
+from app.clicks import click_buffer
+from app.config import settings
+from app.link_index import link_index
+from app.metrics import http_request_duration, http_requests
+from app.models import Link
+from app.routes.redirect import NOT_FOUND, click_event, link_error
+
+ROUTE = "/{short_code}"
+
+_LOOKUP = select(
+    Link.id,
+    Link.short_code,
+    Link.original_url,
+    Link.is_active,
+    Link.expires_at,
+    Link.max_clicks,
+    Link.total_clicks,
+    Link.deactivated_reason,
+).where(Link.short_code == bindparam("short_code"))
+
+# Headers the click needs; everything else is skipped while scanning
+_CLICK_HEADERS = {b"referer", b"cf-ipcountry", b"x-country"}
+
+
+@lru_cache(maxsize=settings.LINK_CACHE_MAX_SIZE or 1)
+def _redirect_headers(url: str) -> list[tuple[bytes, bytes]]:
+    # Same quoting as starlette's RedirectResponse
+    location = quote(url, safe=":/%#?=@[]!$&'()*+,;")
+    return [(b"content-length", b"0"), (b"location", location.encode("latin-1"))]
+
+
+@lru_cache(maxsize=8)
+def _error_response(status_code: int, detail: str) -> tuple[dict, dict]:
+    body = json.dumps({"detail": detail}, ensure_ascii=False, separators=(",", ":")).encode()
+    start = {
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-length", str(len(body)).encode()), (b"content-type", b"application/json")],
+    }
+    return start, {"type": "http.response.body", "body": body}
+
+
+class FastRedirectMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._reserved: Optional[frozenset[str]] = None
+
+    def _reserved_paths(self, app) -> frozenset[str]:
+        """Single-segment paths served by other routes, e.g. /health or /links."""
+        if self._reserved is None:
+            self._reserved = frozenset(
+                route.path
+                for route in app.routes
+                if "{" not in route.path and route.path.count("/") == 1
+            )
+        return self._reserved
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not settings.FAST_REDIRECT_ENABLED
+            or not click_buffer.running
+        ):
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        if len(path) < 2 or path.count("/") != 1 or path in self._reserved_paths(scope["app"]):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        link = await self._resolve(scope, path[1:])
+        if link is not None and link.max_clicks is not None:
+            # Click-limited links need the routed handler's atomic claim
+            await self.app(scope, receive, send)
+            return
+        status_code = await self._redirect(scope, link, send)
+        if settings.METRICS_ENABLED:
+            http_requests.inc("GET", ROUTE, str(status_code))
+            http_request_duration.observe(time.perf_counter() - started, "GET", ROUTE)
+
+    async def _resolve(self, scope, short_code: str) -> Optional[CachedLink]:
+        link = link_index.get(short_code) or link_cache.get(short_code)
+        if link is not None:
+            return link
+        if not short_code_filter.might_exist(short_code):
+            return None
+        async with scope["app"].state.read_session_factory() as session:
+            row = (await session.execute(_LOOKUP, {"short_code": short_code})).first()
+        if row is None:
+            return None
+        link = CachedLink(*row)
+        link_cache.set(link)
+        return link
+
+    async def _redirect(self, scope, link: Optional[CachedLink], send) -> int:
+        error = NOT_FOUND if link is None else link_error(link)
+        if error:
+            start, body = _error_response(*error)
+            await send(start)
+            await send(body)
+            return error[0]
+
+        headers = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+            if name in _CLICK_HEADERS
+        }
+        client = scope.get("client")
+        await click_buffer.add(click_event(link.id, client[0] if client else "unknown", headers))
+        link.total_clicks += 1
+
+        await send({"type": "http.response.start", "status": 302, "headers": _redirect_headers(link.original_url)})
+        await send({"type": "http.response.body", "body": b""})
+        return 302
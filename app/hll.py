@@ -0,0 +1,47 @@
+import math
+from typing import Optional
+
+# 2**PRECISION one-byte registers per sketch: 1 KiB, ~3.25% standard error
+PRECISION = 10
+NUM_REGISTERS = 1 << PRECISION
+_HASH_BITS = 64
+_ALPHA = 0.7213 / (1 + 1.079 / NUM_REGISTERS)
+
+
+class HyperLogLog:
+    """Fixed-size HyperLogLog sketch over hex digests such as ``hash_ip`` output."""
+
+    def __init__(self, registers: Optional[bytes] = None):
+        if registers is None:
+            self.registers = bytearray(NUM_REGISTERS)
+        elif len(registers) != NUM_REGISTERS:
+            raise ValueError(f"Expected {NUM_REGISTERS} registers, got {len(registers)}")
+        else:
+            self.registers = bytearray(registers)
+
+    def add(self, hex_digest: str) -> None:
+        """Add an item given as a uniformly distributed hex digest."""
+        x = int(hex_digest[:16], 16)
+        index = x >> (_HASH_BITS - PRECISION)
+        rest = x & ((1 << (_HASH_BITS - PRECISION)) - 1)
+        rank = (_HASH_BITS - PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """Merge another sketch into this one (union of the counted sets)."""
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        """Estimate the number of distinct items added."""
+        total = sum(2.0 ** -r for r in self.registers)
+        estimate = _ALPHA * NUM_REGISTERS * NUM_REGISTERS / total
+        if estimate <= 2.5 * NUM_REGISTERS:
+            zeros = self.registers.count(0)
+            if zeros:
+                # Linear counting is more accurate for small cardinalities
+                estimate = NUM_REGISTERS * math.log(NUM_REGISTERS / zeros)
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
@@ -0,0 +1,191 @@
+"""Cross-worker invalidation of per-worker link caches.
+
+Routes that change a link publish its short code after committing. Every
+subscriber in this process (the link cache, and anything else holding
+copies of links) hears about it straight away. With the change-log
+channel, the code is also appended to ``link_changes``, and a poller in
+every worker picks it up within INVALIDATION_POLL_INTERVAL_SECONDS.
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import delete, insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.cache import link_cache
+from app.config import settings
+from app.database import _is_sqlite_file, engine
+from app.models import LinkChange
+
+logger = logging.getLogger(__name__)
+
+# Called with the changed short codes, or None when any link may have changed
+Subscriber = Callable[[Optional[list[str]]], None]
+
+
+class InvalidationChannel(ABC):
+    """Pub/sub of changed short codes."""
+
+    def __init__(self):
+        self._subscribers: list[Subscriber] = []
+
+    def subscribe(self, callback: Subscriber) -> None:
+        self._subscribers.append(callback)
+
+    def _deliver(self, short_codes: Optional[list[str]]) -> None:
+        for callback in self._subscribers:
+            callback(short_codes)
+
+    @abstractmethod
+    async def publish(self, short_codes: Iterable[str]) -> None:
+        """Announce that links changed. Call after the change is committed."""
+
+    def start(self) -> None:
+        """Start listening for changes published by other workers."""
+
+    async def stop(self) -> None:
+        """Stop listening."""
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__}
+
+
+class LocalChannel(InvalidationChannel):
+    """Delivers to this process only: enough for a single worker, and for tests."""
+
+    async def publish(self, short_codes: Iterable[str]) -> None:
+        self._deliver(list(short_codes))
+
+
+class ChangeLogChannel(InvalidationChannel):
+    """Publishes through the ``link_changes`` table of a SQLite file database.
+
+    The poller keeps one read-only connection open and checks
+    ``PRAGMA data_version``, which changes whenever another connection
+    commits, so an idle poll costs no table read. Until ``start`` runs,
+    changes are only delivered locally and nothing is written.
+    """
+
+    # Purge rows older than the retention once every this many publishes
+    PURGE_EVERY = 100
+
+    def __init__(self, engine: AsyncEngine, poll_interval: float, retention_seconds: int):
+        super().__init__()
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._data_version: Optional[int] = None
+        self._version = 0
+        self._published = 0
+        self.received = 0
+        self.resyncs = 0
+        self.last_poll_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def publish(self, short_codes: Iterable[str]) -> None:
+        short_codes = list(short_codes)
+        self._deliver(short_codes)
+        if not short_codes or not self.running:
+            return
+        async with self.engine.begin() as conn:
+            await conn.execute(insert(LinkChange), [{"short_code": code} for code in short_codes])
+            self._published += 1
+            if self._published % self.PURGE_EVERY == 0:
+                cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.retention_seconds)
+                await conn.execute(delete(LinkChange).where(LinkChange.changed_at < cutoff))
+
+    def start(self) -> None:
+        if self.running:
+            return
+        path = make_url(str(self.engine.url)).database
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._data_version = None
+        self._version = self._conn.execute("SELECT coalesce(max(id), 0) FROM link_changes").fetchone()[0]
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                changed = await asyncio.to_thread(self._poll)
+            except sqlite3.Error:
+                logger.exception("Polling link_changes failed")
+                continue
+            if changed != []:
+                self._deliver(changed)
+
+    def _poll(self) -> Optional[list[str]]:
+        """Return codes changed since the last poll, or None if some changes were missed."""
+        self.last_poll_at = time.time()
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return []
+        self._data_version = data_version
+        rows = self._conn.execute(
+            "SELECT id, short_code FROM link_changes WHERE id > ? ORDER BY id", (self._version,)
+        ).fetchall()
+        if not rows:
+            return []
+        seen, self._version = self._version, rows[-1][0]
+        self.received += len(rows)
+        if rows[0][0] > seen + 1:
+            # Rows we never saw were purged: drop everything rather than miss a change
+            self.resyncs += 1
+            return None
+        return [code for _, code in rows]
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "running": self.running,
+            "version": self._version,
+            "received": self.received,
+            "resyncs": self.resyncs,
+        }
+
+
+def _create_channel() -> InvalidationChannel:
+    if settings.INVALIDATION_CHANNEL == "changelog" and _is_sqlite_file(engine.url):
+        return ChangeLogChannel(
+            engine,
+            poll_interval=settings.INVALIDATION_POLL_INTERVAL_SECONDS,
+            retention_seconds=settings.INVALIDATION_RETENTION_SECONDS,
+        )
+    if settings.INVALIDATION_CHANNEL in ("changelog", "local"):
+        return LocalChannel()
+    raise ValueError(f"Unknown invalidation channel: {settings.INVALIDATION_CHANNEL}")
+
+
+def _evict_links(short_codes: Optional[list[str]]) -> None:
+    if short_codes is None:
+        link_cache.invalidate_all()
+    else:
+        for code in short_codes:
+            link_cache.invalidate(code)
+
+
+invalidation_channel = _create_channel()
+invalidation_channel.subscribe(_evict_links)
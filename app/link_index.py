@@ -0,0 +1,440 @@
+"""Memory-mapped index of active links, shared by every worker.
+
+Redirect lookups for active links are served from compact files that
+every worker maps read-only, so the page cache holds a single copy no
+matter how many workers run, instead of per-worker link objects. Each
+file holds a header, fixed-width records sorted by short code, an
+open-addressing hash table of record numbers keyed by CRC-32 of the short
+code, and a blob of the code and URL bytes::
+
+    header   magic, version, records, slots, built_at, rebuilt_at, base, watermark
+    records  id, code offset/length, URL offset/length, expires_at
+    slots    record number + 1 per slot, 0 when empty
+    blob     short codes and original URLs, UTF-8
+
+Links with a click limit are left out, since their click count changes
+with every redirect. The index is a positive cache only: a miss falls
+back to the link cache and the database.
+
+The index is a base file plus a delta file (``<path>.delta``) holding
+the links changed since the base was written, with tombstones for those
+removed. One worker at a time refreshes them every
+LINK_INDEX_REFRESH_SECONDS, loading only links whose ``updated_at`` moved
+since the last refresh and rewriting just the delta. Once the delta
+outgrows COMPACT_RATIO of the base it is merged into a new base. Files
+are swapped in with a rename and the other workers remap them when they
+see a new one; a delta is only used with the base it was written for.
+Each process rebuilds the base from scratch on its first refresh unless
+another worker already did since it started, so a restored backup or a
+different database never serves codes from an old file. Codes published
+on the invalidation channel are skipped until files built after the
+change are mapped.
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import CachedLink
+from app.config import settings
+from app.invalidation import invalidation_channel
+from app.models import Link
+from app.tasks import BackgroundTask
+from app.utils import file_lock
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LIDX"
+VERSION = 2
+HEADER = struct.Struct("<4sIIIdddq")
+RECORD = struct.Struct("<qQHQIq")
+SLOT = struct.Struct("<I")
+NO_EXPIRY = -1
+# expires_at of a delta record for a link that is no longer indexed
+TOMBSTONE = -2
+
+EPOCH = datetime(1970, 1, 1)
+# Re-read rows updated this long before the watermark, in case their transaction committed late
+WATERMARK_OVERLAP = timedelta(seconds=60)
+# Merge the delta into the base once it holds this share of the base's entries, or COMPACT_MIN
+COMPACT_RATIO = 0.1
+COMPACT_MIN = 1000
+
+# short_code -> (id, original_url, expires_at in microseconds since the epoch, NO_EXPIRY or TOMBSTONE)
+Entries = dict[str, tuple[int, str, int]]
+# short_code -> entry, or None if the link is no longer indexed
+Changes = dict[str, Optional[tuple[int, str, int]]]
+
+
+def _micros(dt: datetime) -> int:
+    """Naive UTC datetime to microseconds since the epoch."""
+    return (dt.replace(tzinfo=None) - EPOCH) // timedelta(microseconds=1)
+
+
+def delta_path(path: Path) -> Path:
+    return path.with_name(path.name + ".delta")
+
+
+def write_index(
+    path: Path,
+    entries: Entries,
+    built_at: float,
+    watermark: int,
+    rebuilt_at: Optional[float] = None,
+    base: float = 0.0,
+) -> None:
+    """Write entries to ``path`` atomically.
+
+    ``rebuilt_at`` is when the base was last built from scratch, ``built_at``
+    by default; ``base`` is the built_at of the base a delta applies to.
+    """
+    codes = sorted(entries)
+    slots = 1 << max(4, (2 * len(codes)).bit_length())
+    table = bytearray(slots * SLOT.size)
+    records = bytearray(len(codes) * RECORD.size)
+    blob = bytearray()
+    for number, code in enumerate(codes):
+        link_id, url, expires = entries[code]
+        code_bytes, url_bytes = code.encode(), url.encode()
+        code_offset = len(blob)
+        blob += code_bytes
+        url_offset = len(blob)
+        blob += url_bytes
+        RECORD.pack_into(
+            records, number * RECORD.size,
+            link_id, code_offset, len(code_bytes), url_offset, len(url_bytes), expires,
+        )
+        slot = zlib.crc32(code_bytes) & (slots - 1)
+        while SLOT.unpack_from(table, slot * SLOT.size)[0]:
+            slot = (slot + 1) & (slots - 1)
+        SLOT.pack_into(table, slot * SLOT.size, number + 1)
+
+    header = HEADER.pack(
+        MAGIC, VERSION, len(codes), slots, built_at,
+        built_at if rebuilt_at is None else rebuilt_at, base, watermark,
+    )
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(records)
+        f.write(table)
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class IndexFile:
+    """A mapped index file."""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            self.mm.close()
+            raise ValueError(f"{path} is not a version {VERSION} link index")
+        (magic, version, self.count, self.slots, self.built_at,
+         self.rebuilt_at, self.base, self.watermark) = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError(f"{path} is not a version {VERSION} link index")
+        self._records = HEADER.size
+        self._table = self._records + self.count * RECORD.size
+        self._blob = self._table + self.slots * SLOT.size
+
+    def _record(self, number: int) -> tuple:
+        return RECORD.unpack_from(self.mm, self._records + number * RECORD.size)
+
+    def get(self, short_code: str) -> Optional[tuple[int, str, int]]:
+        """Look a code up in the hash table. Returns (id, original_url, expires_at) or None."""
+        code_bytes = short_code.encode()
+        mask = self.slots - 1
+        slot = zlib.crc32(code_bytes) & mask
+        while True:
+            number = SLOT.unpack_from(self.mm, self._table + slot * SLOT.size)[0]
+            if not number:
+                return None
+            link_id, code_offset, code_length, url_offset, url_length, expires = self._record(number - 1)
+            start = self._blob + code_offset
+            if code_length == len(code_bytes) and self.mm[start:start + code_length] == code_bytes:
+                start = self._blob + url_offset
+                return link_id, self.mm[start:start + url_length].decode(), expires
+            slot = (slot + 1) & mask
+
+    def entries(self) -> Entries:
+        """Every entry, for merging."""
+        entries = {}
+        for number in range(self.count):
+            link_id, code_offset, code_length, url_offset, url_length, expires = self._record(number)
+            code = self.mm[self._blob + code_offset:self._blob + code_offset + code_length].decode()
+            url = self.mm[self._blob + url_offset:self._blob + url_offset + url_length].decode()
+            entries[code] = (link_id, url, expires)
+        return entries
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+def _open(path: Path) -> Optional[IndexFile]:
+    try:
+        return IndexFile(path)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("Ignoring unreadable link index %s", path)
+        return None
+
+
+def _open_delta(path: Path, base: IndexFile) -> Optional[IndexFile]:
+    """The delta for ``base``, if there is one."""
+    delta = _open(delta_path(path))
+    if delta is not None and delta.base != base.built_at:
+        delta.close()
+        return None
+    return delta
+
+
+def _unlink(path: Path) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _read_state(path: Path, full_before: float) -> Optional[int]:
+    """The watermark to refresh from, or None if the base must be rebuilt from scratch."""
+    base = _open(path)
+    if base is None:
+        return None
+    try:
+        if base.rebuilt_at < full_before:
+            return None
+        delta = _open_delta(path, base)
+        if delta is None:
+            return base.watermark
+        delta.close()
+        return delta.watermark
+    finally:
+        base.close()
+
+
+def _apply_changes(path: Path, changes: Changes, built_at: float, watermark: int) -> int:
+    """Fold changes into the delta, compacting it into the base once it is large. Returns entries changed."""
+    base = IndexFile(path)
+    delta = _open_delta(path, base)
+    try:
+        pending = delta.entries() if delta is not None else {}
+        changed = 0
+        for code, entry in changes.items():
+            indexed = base.get(code)
+            current = pending.get(code, indexed)
+            if current is not None and current[2] == TOMBSTONE:
+                current = None
+            if entry == current:
+                continue
+            changed += 1
+            if entry == indexed:
+                pending.pop(code, None)
+            else:
+                pending[code] = entry if entry is not None else (0, "", TOMBSTONE)
+        if not changed:
+            return 0
+
+        if len(pending) < max(COMPACT_MIN, base.count * COMPACT_RATIO):
+            write_index(delta_path(path), pending, built_at, watermark, rebuilt_at=base.rebuilt_at, base=base.built_at)
+            return changed
+        entries = base.entries()
+        for code, entry in pending.items():
+            if entry[2] == TOMBSTONE:
+                entries.pop(code, None)
+            else:
+                entries[code] = entry
+        rebuilt_at = base.rebuilt_at
+    finally:
+        base.close()
+        if delta is not None:
+            delta.close()
+    write_index(path, entries, built_at, watermark, rebuilt_at=rebuilt_at)
+    _unlink(delta_path(path))
+    return changed
+
+
+def _write_full(path: Path, entries: Entries, built_at: float, watermark: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_index(path, entries, built_at, watermark)
+    _unlink(delta_path(path))
+
+
+async def rebuild_index(session: AsyncSession, path: Path, full_before: float = 0.0) -> int:
+    """Bring the index files up to date with the links table. Returns entries changed.
+
+    Rebuilds the base from scratch without a readable one, or if it was
+    last rebuilt before ``full_before``. Otherwise loads only links updated
+    since the watermark and folds them into the delta, leaving the files
+    alone if nothing changed. Decoding, merging and writing files run in
+    a worker thread. Only one process may rebuild at a time.
+    """
+    built_at = time.time()
+    since_watermark = await asyncio.to_thread(_read_state, path, full_before)
+    query = select(Link.short_code, Link.id, Link.original_url, Link.is_active, Link.max_clicks,
+                   Link.expires_at, Link.updated_at)
+    if since_watermark is None:
+        query = query.where(Link.is_active, Link.max_clicks.is_(None))
+        watermark = 0
+    else:
+        since = EPOCH + timedelta(microseconds=since_watermark) - WATERMARK_OVERLAP
+        query = query.where(Link.updated_at >= since)
+        watermark = since_watermark
+
+    changes: Changes = {}
+    result = await session.stream(query.execution_options(yield_per=10000))
+    async for code, link_id, url, is_active, max_clicks, expires_at, updated_at in result:
+        watermark = max(watermark, _micros(updated_at))
+        if is_active and max_clicks is None:
+            changes[code] = (link_id, url, _micros(expires_at) if expires_at else NO_EXPIRY)
+        else:
+            changes[code] = None
+    await session.commit()
+
+    if since_watermark is None:
+        entries = {code: entry for code, entry in changes.items() if entry is not None}
+        await asyncio.to_thread(_write_full, path, entries, built_at, watermark)
+        return len(entries)
+    if not changes:
+        return 0
+    return await asyncio.to_thread(_apply_changes, path, changes, built_at, watermark)
+
+
+class LinkIndex(BackgroundTask):
+    """This worker's view of the shared index files, and the task keeping them fresh."""
+
+    failure_message = "Link index refresh failed"
+    read_only = True
+
+    def __init__(self, path: Path, refresh_interval: float, session_factory=None):
+        super().__init__(refresh_interval, session_factory)
+        self.path = path
+        self._file: Optional[IndexFile] = None
+        self._delta: Optional[IndexFile] = None
+        # Files rebuilt from scratch before this are not trusted
+        self._started = time.time()
+        # Codes changed since they were indexed -> when we heard about it
+        self._dirty: dict[str, float] = {}
+        # Set when changes were missed: no file built before then may be used
+        self._stale_before = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    def get(self, short_code: str) -> Optional[CachedLink]:
+        """The link if it is indexed and unchanged since, else None."""
+        if self._file is None or short_code in self._dirty:
+            return None
+        found = self._delta.get(short_code) if self._delta is not None else None
+        if found is None:
+            found = self._file.get(short_code)
+        if found is None or found[2] == TOMBSTONE:
+            self.misses += 1
+            return None
+        self.hits += 1
+        link_id, original_url, expires = found
+        expires_at = None if expires == NO_EXPIRY else EPOCH + timedelta(microseconds=expires)
+        return CachedLink(
+            id=link_id,
+            short_code=short_code,
+            original_url=original_url,
+            is_active=True,
+            expires_at=expires_at,
+            max_clicks=None,
+            total_clicks=0,
+        )
+
+    def mark_dirty(self, short_codes: Optional[list[str]]) -> None:
+        """Invalidation channel subscriber."""
+        now = time.time()
+        if short_codes is None:
+            self._stale_before = now
+            self._unmap()
+            return
+        for code in short_codes:
+            self._dirty[code] = now
+
+    def _unmap(self) -> None:
+        for mapped in (self._file, self._delta):
+            if mapped is not None:
+                mapped.close()
+        self._file = self._delta = None
+
+    @staticmethod
+    def _replaced(mapped: Optional[IndexFile], path: Path) -> bool:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return mapped is not None
+        return mapped is None or (stat.st_ino, stat.st_mtime_ns) != (mapped.stat.st_ino, mapped.stat.st_mtime_ns)
+
+    def reload(self) -> None:
+        """Map the index files if they were replaced since they were last mapped."""
+        if not self._replaced(self._file, self.path) and not self._replaced(self._delta, delta_path(self.path)):
+            return
+        self._unmap()
+        base = _open(self.path)
+        if base is None:
+            return
+        delta = _open_delta(self.path, base)
+        # Together they reflect the links table as of the newer one
+        built_at = delta.built_at if delta is not None else base.built_at
+        if built_at < self._stale_before:
+            base.close()
+            if delta is not None:
+                delta.close()
+            return
+        self._file, self._delta = base, delta
+        # The files already reflect changes heard about before they were built
+        self._dirty = {code: at for code, at in self._dirty.items() if at >= built_at}
+
+    async def run_once(self) -> None:
+        """Refresh the files if no other worker is doing so, then remap them."""
+        with file_lock(self.path.with_name(self.path.name + ".lock")) as lock:
+            if lock.acquired:
+                async with self._get_session_factory()() as session:
+                    if await rebuild_index(session, self.path, full_before=self._started):
+                        self.rebuilds += 1
+        self.reload()
+
+    async def stop(self) -> None:
+        await super().stop()
+        self._unmap()
+
+    def reset(self) -> None:
+        """Unmap the files and forget all state. Useful for testing."""
+        self._unmap()
+        self._dirty.clear()
+        self._started = time.time()
+        self._stale_before = 0.0
+        self.hits = self.misses = self.rebuilds = 0
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "entries": self._file.count if self._file is not None else 0,
+            "delta_entries": self._delta.count if self._delta is not None else 0,
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+        }
+
+
+link_index = LinkIndex(Path(settings.LINK_INDEX_PATH), refresh_interval=settings.LINK_INDEX_REFRESH_SECONDS)
+invalidation_channel.subscribe(link_index.mark_dirty)
@@ -1,19 +1,59 @@
+import logging
 from contextlib import asynccontextmanager
-from pathlib import Path
 
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse
 
-from app.database import init_db
+from app.auth import token_cache
+from app.bloom import short_code_filter
+from app.cache import link_cache
+from app.clicks import click_buffer
+from app.config import default_secrets, settings
+from app.database import engine, init_db, read_engine, read_session
+from app.expiry import expiry_sweeper
+from app.fast_redirect import FastRedirectMiddleware
+from app.invalidation import invalidation_channel
+from app.link_index import link_index
+from app.metrics import CallbackMetric, registry
+from app.profiling import RequestTimingMiddleware
+from app.qr_cache import qr_cache
+from app.qr_render import start_qr_pool, stop_qr_pool
+from app.retention import click_archiver
 from app.routes import auth, links, redirect, stats
+from app.static_pages import static_pages
 
-STATIC_DIR = Path(__file__).parent / "static"
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    for name in default_secrets(settings):
+        logger.warning("%s is still the public default from .env.example; set your own", name)
     await init_db()
+    static_pages.load_all()
+    invalidation_channel.start()
+    if settings.BLOOM_FILTER_ENABLED:
+        async with read_session() as session:
+            await short_code_filter.build(session)
+        short_code_filter.start()
+    if settings.LINK_INDEX_ENABLED:
+        link_index.start()
+    if settings.CLICK_BUFFER_ENABLED:
+        click_buffer.start()
+    if settings.QR_POOL_ENABLED:
+        start_qr_pool(settings.QR_POOL_WORKERS)
+    if settings.EXPIRY_SWEEP_ENABLED:
+        expiry_sweeper.start()
+    if settings.CLICK_RETENTION_DAYS > 0:
+        click_archiver.start()
     yield
+    await click_archiver.stop()
+    await expiry_sweeper.stop()
+    await link_index.stop()
+    await click_buffer.stop()
+    await short_code_filter.stop()
+    await invalidation_channel.stop()
+    stop_qr_pool()
 
 
 app = FastAPI(
@@ -22,21 +62,78 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan,
 )
+app.add_middleware(RequestTimingMiddleware)
+# Outermost, so redirects it answers skip the rest of the stack
+app.add_middleware(FastRedirectMiddleware)
+app.state.read_session_factory = read_session
+
+
+def _pool_in_use() -> dict[tuple[str, ...], float]:
+    engines = {"writer": engine} if read_engine is engine else {"writer": engine, "reader": read_engine}
+    return {
+        (name,): e.pool.checkedout()
+        for name, e in engines.items()
+        if hasattr(e.pool, "checkedout")
+    }
+
+
+def _register_metrics() -> None:
+    """Expose counters that other components already keep."""
+    for name, help, labels, collect, metric_type in (
+        ("db_pool_connections_in_use", "Pooled database connections checked out.", ("engine",),
+         _pool_in_use, "gauge"),
+        ("click_buffer_pending", "Clicks waiting in the write-behind buffer.", (),
+         lambda: {(): click_buffer.pending}, "gauge"),
+        ("click_buffer_dropped_total", "Clicks dropped by the buffer's overflow policy.", (),
+         lambda: {(): click_buffer.dropped}, "counter"),
+        ("cache_hits_total", "Cache hits.", ("cache",),
+         lambda: {("index",): link_index.hits, ("links",): link_cache.hits, ("qr",): qr_cache.hits,
+                  ("tokens",): token_cache.hits},
+         "counter"),
+        ("cache_misses_total", "Cache misses.", ("cache",),
+         lambda: {("index",): link_index.misses, ("links",): link_cache.misses, ("qr",): qr_cache.misses,
+                  ("tokens",): token_cache.misses},
+         "counter"),
+        ("short_code_filter_rejections_total", "Unknown short codes rejected without a query.", (),
+         lambda: {(): short_code_filter.rejected}, "counter"),
+    ):
+        registry.register(CallbackMetric(name, help, labels, collect, metric_type))
+
+
+if settings.METRICS_ENABLED:
+    _register_metrics()
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/", response_class=HTMLResponse, include_in_schema=False)
-async def landing_page():
-    return (STATIC_DIR / "index.html").read_text()
+async def landing_page(request: Request):
+    return static_pages.response("index.html", request)
 
 
 @app.get("/admin", response_class=HTMLResponse, include_in_schema=False)
-async def admin_dashboard():
-    return (STATIC_DIR / "admin.html").read_text()
+async def admin_dashboard(request: Request):
+    return static_pages.response("admin.html", request)
 
 
 @app.get("/health", tags=["Health"])
 async def health_check():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "caches": {
+            "index": link_index.stats(),
+            "links": link_cache.stats(),
+            "qr": qr_cache.stats(),
+            "short_codes": short_code_filter.stats(),
+            "tokens": token_cache.stats(),
+        },
+        "click_buffer": click_buffer.stats(),
+        "expiry": expiry_sweeper.stats(),
+        "invalidation": invalidation_channel.stats(),
+        "retention": click_archiver.stats(),
+    }
 
 
 # Include routers - order matters: specific paths before catch-all /{short_code}
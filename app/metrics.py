@@ -0,0 +1,187 @@
+"""Prometheus metrics in the text exposition format.
+
+A deliberately small registry rather than a client library: counters and
+histograms are plain dicts keyed by label values, updated without locks
+from the event loop, and gauges are callbacks read at scrape time so
+they cost nothing between scrapes.
+"""
+from bisect import bisect_left
+from typing import Callable
+
+# Latency buckets in seconds, tuned for a service whose hot path is sub-millisecond
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self._values: dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+class CallbackMetric:
+    """Gauge or counter whose samples are read from a callback at scrape time.
+
+    For values other components already track, such as cache hit counts.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...],
+        collect: Callable[[], dict[LabelValues, float]],
+        metric_type: str = "gauge",
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.collect = collect
+        self.metric_type = metric_type
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in self.collect().items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+    def clear(self) -> None:
+        pass
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        """Reset counters and histograms. Useful for testing."""
+        for metric in self._metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")
+))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route")
+))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Duration of individual SQL statements.", ("engine",)
+))
+db_queries_per_request = registry.register(Histogram(
+    "db_queries_per_request", "SQL statements executed while serving a request.", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100),
+))
+db_time_per_request = registry.register(Histogram(
+    "db_time_per_request_seconds", "Total SQL time while serving a request.", ("route",)
+))
+clicks_written = registry.register(Counter(
+    "clicks_written_total", "Click rows written to the database."
+))
+rate_limit_rejections = registry.register(Counter(
+    "rate_limit_rejections_total", "Requests rejected by the rate limiter.", ("scope",)
+))
+links_deactivated = registry.register(Counter(
+    "links_deactivated_total", "Links deactivated by the expiry sweeper.", ("reason",)
+))
+qr_render_duration = registry.register(Histogram(
+    "qr_render_duration_seconds", "Time to render a QR code, including pool dispatch.", ("format",)
+))
+
+
+def observe_request(method: str, route: str, status: int, seconds: float, queries: int, db_seconds: float) -> None:
+    """Record one served request."""
+    http_requests.inc(method, route, str(status))
+    http_request_duration.observe(seconds, method, route)
+    db_queries_per_request.observe(queries, route)
+    db_time_per_request.observe(db_seconds, route)
@@ -1,28 +1,69 @@
 from datetime import datetime, timezone
 from typing import Optional
 
+from sqlalchemy import DDL, Index, UniqueConstraint, event, text
 from sqlmodel import Field, SQLModel, Relationship
 
 
 class Link(SQLModel, table=True):
     __tablename__ = "links"
+    __table_args__ = (
+        Index("ix_links_created_at_id", "created_at", "id"),
+        # Only links with a click limit can run out of clicks
+        Index("ix_links_max_clicks", "max_clicks", sqlite_where=text("max_clicks IS NOT NULL")),
+        # Admin listing filters and sort keys
+        Index("ix_links_domain_created_at_id", "domain", "created_at", "id"),
+        Index("ix_links_is_active_created_at_id", "is_active", "created_at", "id"),
+        Index("ix_links_is_vanity_created_at_id", "is_vanity", "created_at", "id"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     short_code: str = Field(max_length=30, unique=True, index=True)
     original_url: str
+    # Host of original_url without "www.", for filtering by destination
+    domain: Optional[str] = Field(default=None, max_length=255)
     is_vanity: bool = Field(default=False)
     is_active: bool = Field(default=True)
-    expires_at: Optional[datetime] = Field(default=None)
+    # Why an inactive link was deactivated: "deleted", "expired" or "click_limit"
+    deactivated_reason: Optional[str] = Field(default=None, max_length=20)
+    expires_at: Optional[datetime] = Field(default=None, index=True)
     max_clicks: Optional[int] = Field(default=None)
     total_clicks: int = Field(default=0)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
 
     clicks: list["Click"] = Relationship(back_populates="link")
 
 
+# Trigram full-text index over short codes and destinations, for substring
+# search in the admin listing. It is external content: triggers keep it in
+# step with the links table and it stores no copy of the text.
+LINK_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS links_fts USING fts5("
+    "short_code, original_url, content='links', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS links_fts_insert AFTER INSERT ON links BEGIN"
+    " INSERT INTO links_fts(rowid, short_code, original_url) VALUES (new.id, new.short_code, new.original_url);"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS links_fts_delete AFTER DELETE ON links BEGIN"
+    " INSERT INTO links_fts(links_fts, rowid, short_code, original_url)"
+    " VALUES ('delete', old.id, old.short_code, old.original_url);"
+    " END",
+    # Only when the indexed text changes, not on every click count update
+    "CREATE TRIGGER IF NOT EXISTS links_fts_update AFTER UPDATE OF short_code, original_url ON links BEGIN"
+    " INSERT INTO links_fts(links_fts, rowid, short_code, original_url)"
+    " VALUES ('delete', old.id, old.short_code, old.original_url);"
+    " INSERT INTO links_fts(rowid, short_code, original_url) VALUES (new.id, new.short_code, new.original_url);"
+    " END",
+)
+
+for _statement in LINK_SEARCH_DDL:
+    event.listen(Link.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(Link.__table__, "before_drop", DDL("DROP TABLE IF EXISTS links_fts").execute_if(dialect="sqlite"))
+
+
 class Click(SQLModel, table=True):
     __tablename__ = "clicks"
+    __table_args__ = (Index("ix_clicks_link_id_clicked_at_id", "link_id", "clicked_at", "id"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     link_id: int = Field(foreign_key="links.id", index=True)
@@ -32,3 +73,60 @@ class Click(SQLModel, table=True):
     clicked_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
     link: Optional[Link] = Relationship(back_populates="clicks")
+
+
+class ClickRollup(SQLModel, table=True):
+    """Pre-aggregated click counts per link, maintained as clicks are recorded.
+
+    ``dimension`` is one of "hour", "day", "country" or "referrer" and
+    ``bucket`` the hour/day timestamp, country code or referrer domain.
+    """
+
+    __tablename__ = "click_rollups"
+    __table_args__ = (UniqueConstraint("link_id", "dimension", "bucket"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    link_id: int = Field(foreign_key="links.id", index=True)
+    dimension: str = Field(max_length=10)
+    bucket: str = Field(max_length=255)
+    clicks: int = Field(default=0)
+
+
+class VisitorSketch(SQLModel, table=True):
+    """HyperLogLog registers estimating unique visitors of a link.
+
+    ``bucket`` is "all" for the lifetime sketch or a "YYYY-MM-DD" day, so
+    day sketches can be merged into arbitrary windows.
+    """
+
+    __tablename__ = "visitor_sketches"
+    __table_args__ = (UniqueConstraint("link_id", "bucket"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    link_id: int = Field(foreign_key="links.id", index=True)
+    bucket: str = Field(max_length=10)
+    registers: bytes
+
+
+class CodeSequence(SQLModel, table=True):
+    """Monotonic counters from which workers reserve blocks of IDs."""
+
+    __tablename__ = "code_sequences"
+
+    name: str = Field(primary_key=True, max_length=30)
+    next_value: int = Field(default=0)
+
+
+class LinkChange(SQLModel, table=True):
+    """Change log of short codes whose cached copies are stale.
+
+    ``id`` doubles as a monotonically increasing version; AUTOINCREMENT
+    keeps it from being reused after old rows are purged.
+    """
+
+    __tablename__ = "link_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    short_code: str = Field(max_length=30)
+    changed_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
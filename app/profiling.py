@@ -0,0 +1,189 @@
+"""Per-request timing: SQL instrumentation, the slow-query log and Server-Timing.
+
+Every request gets a ``RequestTimings`` in a contextvar. Engine hooks add
+SQL time to it, QR rendering adds render time, and ``TimedRoute`` marks
+when the endpoint returned so the rest until the response starts counts
+as serialization. The middleware feeds the totals to the metrics and, for
+profiled requests, reports them in a ``Server-Timing`` header.
+"""
+import functools
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.auth import decode_token
+from app.config import settings
+from app.metrics import db_query_duration, observe_request
+
+slow_query_logger = logging.getLogger("app.slow_queries")
+
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class RequestTimings:
+    __slots__ = ("started", "endpoint_done", "queries", "db_seconds", "qr_seconds")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.endpoint_done: Optional[float] = None
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.qr_seconds = 0.0
+
+    def server_timing(self, now: float) -> str:
+        """Render the Server-Timing header value, durations in milliseconds."""
+        serialize = now - self.endpoint_done if self.endpoint_done is not None else 0.0
+        return ", ".join([
+            f'db;dur={self.db_seconds * 1000:.3f};desc="{self.queries} queries"',
+            f"qr;dur={self.qr_seconds * 1000:.3f}",
+            f"serialize;dur={serialize * 1000:.3f}",
+            f"total;dur={(now - self.started) * 1000:.3f}",
+        ])
+
+
+# Timings of the request being served, if any
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    """EXPLAIN QUERY PLAN for a statement on the connection that ran it."""
+    if conn.dialect.name != "sqlite" or not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return ""
+    if isinstance(parameters, list):
+        parameters = parameters[0] if parameters else ()
+    # A fresh DBAPI cursor: no SQLAlchemy events, and the original cursor's results stay intact
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return "; ".join(str(row[-1]) for row in cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def _log_slow_query(conn, statement: str, parameters, elapsed: float) -> None:
+    try:
+        plan = _explain(conn, statement, parameters)
+    except Exception as exc:  # the plan is a diagnostic, never fail the query over it
+        plan = f"unavailable ({exc})"
+    slow_query_logger.warning(
+        "Slow query (%.1f ms): %s | plan: %s", elapsed * 1000, " ".join(statement.split()), plan or "n/a"
+    )
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """Time every statement on an engine, attribute it to the current request
+    and log statements slower than SLOW_QUERY_THRESHOLD_MS with their plan."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        db_query_duration.observe(elapsed, name)
+        current = request_timings.get()
+        if current is not None:
+            current.queries += 1
+            current.db_seconds += elapsed
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if threshold and elapsed * 1000 >= threshold:
+            _log_slow_query(conn, statement, parameters, elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+def _timed_endpoint(endpoint):
+    # include_router builds a new route from the already wrapped endpoint
+    if getattr(endpoint, "timed", False):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def timed(*args, **kwargs):
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            current = request_timings.get()
+            if current is not None:
+                current.endpoint_done = time.perf_counter()
+
+    timed.timed = True
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that records when its endpoint returns."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+
+def _wants_profile(scope) -> bool:
+    if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+        return True
+    headers = dict(scope["headers"])
+    if headers.get(settings.PROFILING_HEADER.lower().encode()) != b"1":
+        return False
+    # Only admins may ask for a profile, it exposes internals
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    return scheme.lower() == "bearer" and decode_token(token) is not None
+
+
+class RequestTimingMiddleware:
+    """ASGI middleware timing each request.
+
+    Records per-route metrics when METRICS_ENABLED, and adds a
+    Server-Timing header to sampled requests and to admin requests that
+    send ``PROFILING_HEADER: 1``. Requests that match no route are
+    labelled "unmatched" so scanners can't inflate the number of series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        profile = _wants_profile(scope)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if profile:
+                    header = timings.server_timing(time.perf_counter())
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - timings.started
+            request_timings.reset(token)
+            if settings.METRICS_ENABLED:
+                route = scope.get("route")
+                observe_request(
+                    scope["method"],
+                    getattr(route, "path", None) or "unmatched",
+                    status_code,
+                    elapsed,
+                    timings.queries,
+                    timings.db_seconds,
+                )
@@ -0,0 +1,99 @@
+import base64
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+from app.qr_render import render_qr_async
+
+
+class QRCache:
+    """Content-addressed cache of rendered QR PNGs.
+
+    Images are keyed by a hash of the URL and render options, held in a
+    bounded in-memory LRU and, when ``directory`` is set, persisted on disk
+    so they survive restarts and are shared between workers.
+    """
+
+    def __init__(self, max_entries: int, directory: Optional[str]):
+        self.max_entries = max_entries
+        self.directory = Path(directory) if directory else None
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(url: str, box_size: int = 10, border: int = 4) -> str:
+        return hashlib.sha256(f"png|{box_size}|{border}|{url}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.png"
+
+    def _remember(self, key: str, png: bytes) -> None:
+        self._entries[key] = png
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _write_to_disk(self, key: str, png: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial image
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(png)
+        os.replace(tmp, path)
+
+    async def get(self, url: str, box_size: int = 10, border: int = 4) -> tuple[bytes, str]:
+        """Return the PNG bytes and a strong ETag, rendering off the event loop on a miss."""
+        key = self.key(url, box_size, border)
+        etag = f'"{key}"'
+        png = self._entries.get(key)
+        if png is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return png, etag
+
+        if self.directory is not None:
+            try:
+                png = self._path(key).read_bytes()
+                self.disk_hits += 1
+            except FileNotFoundError:
+                pass
+
+        if png is None:
+            self.misses += 1
+            png = await render_qr_async(url, "png", box_size, border)
+            if self.directory is not None:
+                self._write_to_disk(key, png)
+
+        self._remember(key, png)
+        return png, etag
+
+    async def get_base64(self, url: str) -> str:
+        """Return the PNG as a base64 string, as embedded in link responses."""
+        png, _ = await self.get(url)
+        return base64.b64encode(png).decode("utf-8")
+
+    def clear(self) -> None:
+        """Drop in-memory entries and reset counters. Useful for testing."""
+        self._entries.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+qr_cache = QRCache(settings.QR_CACHE_MAX_ENTRIES, settings.QR_CACHE_DIR)
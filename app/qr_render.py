@@ -0,0 +1,46 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from app.metrics import qr_render_duration
+from app.profiling import request_timings
+from app.utils import render_qr
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def start_qr_pool(workers: int = 0) -> None:
+    """Start the QR render process pool. ``workers=0`` uses one process per CPU."""
+    global _executor
+    if _executor is None:
+        # spawn rather than fork: the parent runs an event loop and database threads
+        _executor = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+
+def stop_qr_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+async def render_qr_async(url: str, fmt: str = "png", box_size: int = 10, border: int = 4) -> bytes:
+    """Render a QR code off the event loop.
+
+    Uses the process pool when started, otherwise the default thread pool.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    image = await loop.run_in_executor(_executor, render_qr, url, fmt, box_size, border)
+    elapsed = time.perf_counter() - started
+    qr_render_duration.observe(elapsed, fmt)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.qr_seconds += elapsed
+    return image
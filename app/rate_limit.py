@@ -1,34 +1,196 @@
+import asyncio
+import sqlite3
+import threading
 import time
-from collections import defaultdict
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
 
 from fastapi import HTTPException, Request, status
 
 from app.config import settings
+from app.metrics import rate_limit_rejections
 
-# In-memory store: IP -> list of request timestamps
-_requests: dict[str, list[float]] = defaultdict(list)
+# Sliding window counter state: (window index, count in that window, count in the previous one)
+WindowState = tuple[int, int, int]
 
 
-def check_rate_limit(request: Request) -> None:
-    """Dependency: enforce rate limit on the caller's IP."""
-    client_ip = request.client.host if request.client else "unknown"
-    now = time.time()
-    window = settings.RATE_LIMIT_WINDOW_SECONDS
+def _slide(state: Optional[WindowState], now: float, limit: int, window: int) -> tuple[bool, WindowState]:
+    """Apply one request to a sliding window counter.
 
-    # Prune old timestamps
-    _requests[client_ip] = [
-        ts for ts in _requests[client_ip] if now - ts < window
-    ]
+    The previous window's count is weighted by how much of it still overlaps
+    the sliding window, which approximates a true sliding log in O(1) memory.
+    """
+    index = int(now // window)
+    current, previous = 0, 0
+    if state is not None:
+        if state[0] == index:
+            current, previous = state[1], state[2]
+        elif state[0] == index - 1:
+            previous = state[1]
+    elapsed = (now % window) / window
+    if previous * (1 - elapsed) + current >= limit:
+        return False, (index, current, previous)
+    return True, (index, current + 1, previous)
 
-    if len(_requests[client_ip]) >= settings.RATE_LIMIT_REQUESTS:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Rate limit exceeded. Try again later.",
-        )
 
-    _requests[client_ip].append(now)
+class RateLimitBackend(ABC):
+    """Storage for rate limit counters."""
+
+    @abstractmethod
+    def hit(self, key: str, limit: int, window: int) -> bool:
+        """Record a request for key. Returns False if it exceeds the limit."""
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Forget all counters."""
+
+
+class MemoryBackend(RateLimitBackend):
+    """Per-process counters with LRU eviction of idle keys."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._state: OrderedDict[str, tuple[WindowState, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: int) -> bool:
+        now = time.time()
+        with self._lock:
+            entry = self._state.get(key)
+            allowed, state = _slide(entry[0] if entry else None, now, limit, window)
+            self._state[key] = (state, window)
+            self._state.move_to_end(key)
+            self._evict(now)
+        return allowed
+
+    def _evict(self, now: float) -> None:
+        # Least recently used keys are at the front; drop them once idle for two windows
+        while self._state:
+            key, ((index, _, _), window) = next(iter(self._state.items()))
+            if len(self._state) <= self.max_keys and (index + 2) * window > now:
+                break
+            del self._state[key]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state.clear()
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+
+class SQLiteBackend(RateLimitBackend):
+    """Counters in a SQLite file, shared by every worker process on the host."""
+
+    # Purge expired rows once every this many hits
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                " key TEXT PRIMARY KEY,"
+                " window_index INTEGER NOT NULL,"
+                " current INTEGER NOT NULL,"
+                " previous INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def hit(self, key: str, limit: int, window: int) -> bool:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT window_index, current, previous FROM rate_limits WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                allowed, (index, current, previous) = _slide(row, now, limit, window)
+                conn.execute(
+                    "INSERT INTO rate_limits (key, window_index, current, previous, expires_at)"
+                    " VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET window_index = excluded.window_index,"
+                    " current = excluded.current, previous = excluded.previous,"
+                    " expires_at = excluded.expires_at",
+                    (key, index, current, previous, (index + 2) * window),
+                )
+                self._hits += 1
+                if self._hits % self.PURGE_EVERY == 0:
+                    conn.execute("DELETE FROM rate_limits WHERE expires_at < ?", (now,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return allowed
+
+    def reset(self) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM rate_limits")
+
+
+def _create_backend() -> RateLimitBackend:
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteBackend(settings.RATE_LIMIT_SQLITE_PATH)
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return MemoryBackend(settings.RATE_LIMIT_MAX_KEYS)
+    raise ValueError(f"Unknown rate limit backend: {settings.RATE_LIMIT_BACKEND}")
+
+
+backend = _create_backend()
+
+
+class RateLimiter:
+    """Dependency: enforce a per-route rate limit on the caller's IP.
+
+    Limits come from the arguments, then RATE_LIMIT_ROUTES[scope]
+    (e.g. "10/60" for 10 requests per 60 seconds), then the global
+    RATE_LIMIT_REQUESTS / RATE_LIMIT_WINDOW_SECONDS.
+    """
+
+    def __init__(self, scope: str, requests: Optional[int] = None, window_seconds: Optional[int] = None):
+        self.scope = scope
+        self.requests = requests
+        self.window_seconds = window_seconds
+
+    def limits(self) -> tuple[int, int]:
+        if self.requests is not None and self.window_seconds is not None:
+            return self.requests, self.window_seconds
+        override = settings.RATE_LIMIT_ROUTES.get(self.scope)
+        if override:
+            requests, window = override.split("/")
+            return int(requests), int(window)
+        return settings.RATE_LIMIT_REQUESTS, settings.RATE_LIMIT_WINDOW_SECONDS
+
+    async def __call__(self, request: Request) -> None:
+        client_ip = request.client.host if request.client else "unknown"
+        limit, window = self.limits()
+        # The SQLite backend blocks; count rejections back on the event loop, as metrics require
+        if not await asyncio.to_thread(backend.hit, f"{self.scope}:{client_ip}", limit, window):
+            rate_limit_rejections.inc(self.scope)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded. Try again later.",
+            )
+
+
+check_rate_limit = RateLimiter("create_link")
 
 
 def reset_rate_limits() -> None:
     """Reset all rate limit data. Useful for testing."""
-    _requests.clear()
+    backend.reset()
@@ -0,0 +1,450 @@
+"""Click retention: roll old clicks out of the hot table into monthly archives.
+
+Clicks older than CLICK_RETENTION_DAYS are moved, oldest id first and in
+batches, into gzip-compressed NDJSON files under CLICK_ARCHIVE_DIR, one
+file per calendar month. Each batch appends one gzip member per link to
+the month's file, so it stays a plain gzip stream, and a sorted index per
+month (``clicks-YYYY-MM.idx``) maps link ids to their members, so reading
+one link's clicks decompresses only those. ``manifest.json`` holds each
+month's committed size and row count, plus the id range, cutoff and byte
+ranges of batches whose rows are not yet deleted from the clicks table.
+Per-link aggregates (``Link.total_clicks``, rollups and visitor sketches)
+live in their own tables and are not touched; the rollup backfill reads
+the archives too.
+
+Each batch is written and listed in the manifest before its rows are
+deleted, and batches not yet marked deleted have their delete repeated
+at the start of the next run, so a crash in between neither loses nor
+duplicates clicks. Bytes and index entries past a month's committed size
+come from an interrupted batch; readers ignore them and the next batch
+overwrites them.
+
+Run ``python -m app.retention archive`` to archive once, or
+``python -m app.retention list`` to show the archived months. With
+CLICK_RETENTION_DAYS set, the app also archives in the background every
+CLICK_RETENTION_INTERVAL_SECONDS.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Click
+from app.tasks import BackgroundTask
+from app.utils import as_naive_utc, file_lock
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# link_id, member offset and length, rows, first and last clicked_at in microseconds since the epoch
+INDEX = struct.Struct("<qQIIqq")
+EPOCH = datetime(1970, 1, 1)
+
+
+class ArchivedClick(NamedTuple):
+    id: int
+    link_id: int
+    ip_hash: str
+    referrer: Optional[str]
+    country: str
+    clicked_at: datetime
+
+
+class Member(NamedTuple):
+    """Index entry: one link's clicks from one batch, stored as one gzip member."""
+    link_id: int
+    offset: int
+    length: int
+    rows: int
+    first: int
+    last: int
+
+
+def _month(dt: datetime) -> str:
+    return dt.strftime("%Y-%m")
+
+
+def _micros(dt: datetime) -> int:
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def _data_file(month: str) -> str:
+    return f"clicks-{month}.ndjson.gz"
+
+
+def _index_file(month: str) -> str:
+    return f"clicks-{month}.idx"
+
+
+def load_manifest(directory: Path) -> dict:
+    path = directory / MANIFEST
+    if not path.exists():
+        return {"version": 1, "batches": 0, "months": {}, "pending": []}
+    return json.loads(path.read_text())
+
+
+def _save_manifest(directory: Path, manifest: dict) -> None:
+    _write_atomic(directory / MANIFEST, json.dumps(manifest, indent=2).encode())
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _committed_sizes(manifest: dict) -> dict[str, int]:
+    """Bytes of each month's file covered by the manifest."""
+    return {month: info["size"] for month, info in manifest["months"].items()}
+
+
+def _read_index(path: Path) -> list[Member]:
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return []
+    return [Member(*fields) for fields in INDEX.iter_unpack(data)]
+
+
+def _link_members(path: Path, size: int, link_id: int) -> list[Member]:
+    """A link's members within the first ``size`` bytes, by binary search of a month's index."""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+    with f:
+        if not os.fstat(f.fileno()).st_size:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            count = len(mm) // INDEX.size
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if INDEX.unpack_from(mm, mid * INDEX.size)[0] < link_id:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            members = []
+            for number in range(lo, count):
+                member = Member(*INDEX.unpack_from(mm, number * INDEX.size))
+                if member.link_id != link_id:
+                    break
+                if member.offset + member.length <= size:
+                    members.append(member)
+            return members
+
+
+def _dumps(row: ArchivedClick) -> str:
+    return json.dumps({**row._asdict(), "clicked_at": row.clicked_at.isoformat()}) + "\n"
+
+
+def _write_batch(directory: Path, rows: list[ArchivedClick], cutoff: datetime) -> dict:
+    """Append a batch to the monthly archives and their indexes, and record it in the manifest."""
+    by_month: dict[str, dict[int, list[ArchivedClick]]] = defaultdict(lambda: defaultdict(list))
+    for row in rows:
+        by_month[_month(row.clicked_at)][row.link_id].append(row)
+
+    manifest = load_manifest(directory)
+    sizes = _committed_sizes(manifest)
+    number = manifest["batches"] + 1
+    parts = []
+    for month, links in sorted(by_month.items()):
+        name = _data_file(month)
+        offset = sizes.get(month, 0)
+        index_path = directory / _index_file(month)
+        members = [m for m in _read_index(index_path) if m.offset + m.length <= offset]
+        digest = hashlib.sha256()
+        position = offset
+        with open(directory / name, "ab") as f:
+            # Drop anything an interrupted batch appended
+            f.truncate(offset)
+            for link_id, link_rows in sorted(links.items()):
+                link_rows.sort(key=lambda r: (r.clicked_at, r.id))
+                data = gzip.compress("".join(_dumps(row) for row in link_rows).encode(), mtime=0)
+                f.write(data)
+                digest.update(data)
+                members.append(Member(
+                    link_id, position, len(data), len(link_rows),
+                    _micros(link_rows[0].clicked_at), _micros(link_rows[-1].clicked_at),
+                ))
+                position += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        members.sort(key=lambda m: (m.link_id, m.offset))
+        _write_atomic(index_path, b"".join(INDEX.pack(*m) for m in members))
+        month_rows = sum(len(link_rows) for link_rows in links.values())
+        parts.append({
+            "month": month,
+            "file": name,
+            "offset": offset,
+            "length": position - offset,
+            "rows": month_rows,
+            "sha256": digest.hexdigest(),
+        })
+        info = manifest["months"].setdefault(month, {"file": name, "size": 0, "rows": 0})
+        info["size"] = position
+        info["rows"] += month_rows
+
+    batch = {
+        "number": number,
+        "min_id": rows[0].id,
+        "max_id": rows[-1].id,
+        "cutoff": cutoff.isoformat(),
+        "rows": len(rows),
+        "archived_at": datetime.now(timezone.utc).isoformat(),
+        "parts": parts,
+    }
+    manifest["batches"] = number
+    manifest["pending"].append(batch)
+    _save_manifest(directory, manifest)
+    return batch
+
+
+def _mark_deleted(directory: Path, numbers: set[int]) -> None:
+    """Drop batches whose rows are deleted from the manifest; their months keep the totals."""
+    manifest = load_manifest(directory)
+    manifest["pending"] = [b for b in manifest["pending"] if b["number"] not in numbers]
+    _save_manifest(directory, manifest)
+
+
+def _pending_batches(directory: Path) -> list[dict]:
+    return load_manifest(directory)["pending"]
+
+
+def _batch_filter(batch: dict):
+    return (
+        Click.id.between(batch["min_id"], batch["max_id"]),
+        Click.clicked_at < datetime.fromisoformat(batch["cutoff"]),
+    )
+
+
+async def archive_clicks(
+    session: AsyncSession,
+    directory: Path,
+    older_than: datetime,
+    batch_size: int = settings.CLICK_RETENTION_BATCH_SIZE,
+) -> int:
+    """Move clicks older than ``older_than`` into the archive. Returns clicks moved.
+
+    Commits after each batch. Callers must make sure only one archiver runs
+    per directory, e.g. via ``file_lock``.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    cutoff = as_naive_utc(older_than)
+
+    # Finish batches whose rows were archived but not yet deleted
+    unfinished = await asyncio.to_thread(_pending_batches, directory)
+    if unfinished:
+        for batch in unfinished:
+            await session.execute(delete(Click).where(*_batch_filter(batch)))
+        await session.commit()
+        await asyncio.to_thread(_mark_deleted, directory, {b["number"] for b in unfinished})
+
+    moved = 0
+    while True:
+        result = await session.execute(
+            select(Click.id, Click.link_id, Click.ip_hash, Click.referrer, Click.country, Click.clicked_at)
+            .where(Click.clicked_at < cutoff)
+            .order_by(Click.id)
+            .limit(batch_size)
+        )
+        rows = [ArchivedClick(*row) for row in result.all()]
+        # End the read transaction so the writer connection is free while the files are written
+        await session.commit()
+        if not rows:
+            return moved
+        # Every row in the id range older than the cutoff is in this batch, so the
+        # range plus cutoff identifies exactly these rows for the delete
+        batch = await asyncio.to_thread(_write_batch, directory, rows, cutoff)
+        await session.execute(delete(Click).where(*_batch_filter(batch)))
+        await session.commit()
+        await asyncio.to_thread(_mark_deleted, directory, {batch["number"]})
+        moved += len(rows)
+
+
+def archived_months(directory: Path) -> dict[str, int]:
+    """Archived click counts by month, oldest first."""
+    months = load_manifest(directory)["months"]
+    return {month: months[month]["rows"] for month in sorted(months)}
+
+
+def _read_ranges(path: Path, ranges: list[tuple[int, int]]) -> Iterator[ArchivedClick]:
+    with open(path, "rb") as f:
+        for offset, length in ranges:
+            f.seek(offset)
+            # gzip.decompress reads every member in the range
+            for line in gzip.decompress(f.read(length)).decode().splitlines():
+                data = json.loads(line)
+                yield ArchivedClick(**{**data, "clicked_at": datetime.fromisoformat(data["clicked_at"])})
+
+
+def read_archived_clicks(
+    directory: Path,
+    link_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    newest_first: bool = False,
+) -> Iterator[list[ArchivedClick]]:
+    """Yield archived clicks a month at a time.
+
+    With ``link_id``, each list is the link's clicks in one month, sorted by
+    (clicked_at, id), read through the month's index. Without, each list is
+    about a batch's worth of one month's clicks, in no particular order, so
+    memory stays bounded by the batch size. ``since`` is inclusive and ``until``
+    exclusive, both naive UTC.
+    """
+    manifest = load_manifest(directory)
+    sizes = _committed_sizes(manifest)
+    since_us = _micros(since) if since is not None else None
+    until_us = _micros(until) if until is not None else None
+
+    def wanted(row: ArchivedClick) -> bool:
+        return (since is None or row.clicked_at >= since) and (until is None or row.clicked_at < until)
+
+    for month in sorted(sizes, reverse=newest_first):
+        if since is not None and month < _month(since):
+            continue
+        if until is not None and month > _month(until):
+            continue
+        if link_id is None:
+            members = sorted(
+                (m for m in _read_index(directory / _index_file(month)) if m.offset + m.length <= sizes[month]),
+                key=lambda m: m.offset,
+            )
+        else:
+            members = _link_members(directory / _index_file(month), sizes[month], link_id)
+        members = [
+            m for m in members
+            if (since_us is None or m.last >= since_us) and (until_us is None or m.first < until_us)
+        ]
+        if link_id is None:
+            # Yield about a batch of rows at a time, in file order
+            chunk: list[tuple[int, int]] = []
+            chunk_rows = 0
+            for m in members:
+                chunk.append((m.offset, m.length))
+                chunk_rows += m.rows
+                if chunk_rows >= settings.CLICK_RETENTION_BATCH_SIZE or m is members[-1]:
+                    rows = [row for row in _read_ranges(directory / _data_file(month), chunk) if wanted(row)]
+                    if rows:
+                        yield rows
+                    chunk, chunk_rows = [], 0
+            continue
+        ranges = [(m.offset, m.length) for m in members]
+        if not ranges:
+            continue
+        rows = [row for row in _read_ranges(directory / _data_file(month), ranges) if wanted(row)]
+        rows.sort(key=lambda r: (r.clicked_at, r.id), reverse=newest_first)
+        if rows:
+            yield rows
+
+
+def archived_ip_hashes(directory: Path, link_id: int) -> set[str]:
+    return {row.ip_hash for rows in read_archived_clicks(directory, link_id) for row in rows}
+
+
+def archived_page(
+    directory: Path,
+    link_id: int,
+    before: Optional[tuple[datetime, int]],
+    limit: int,
+) -> list[ArchivedClick]:
+    """Up to ``limit`` archived clicks of a link, newest first, older than the (clicked_at, id) key."""
+    until = before[0] + timedelta(microseconds=1) if before else None
+    page: list[ArchivedClick] = []
+    for rows in read_archived_clicks(directory, link_id, until=until, newest_first=True):
+        for row in rows:
+            if before is None or (row.clicked_at, row.id) < before:
+                page.append(row)
+                if len(page) == limit:
+                    return page
+    return page
+
+
+class ClickArchiver(BackgroundTask):
+    """Background task archiving old clicks every ``interval`` seconds.
+
+    Every worker may run one; the directory lock makes sure only one of
+    them archives at a time.
+    """
+
+    failure_message = "Click archival failed"
+
+    def __init__(self, directory: Path, retention_days: int, interval: float, session_factory=None):
+        super().__init__(interval, session_factory)
+        self.directory = directory
+        self.retention_days = retention_days
+        self.archived = 0
+        self.last_run_at: Optional[datetime] = None
+
+    async def run_once(self) -> int:
+        """Archive clicks past the retention period. Returns clicks moved."""
+        with file_lock(self.directory / ".lock") as lock:
+            if not lock.acquired:
+                return 0
+            older_than = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+            async with self._get_session_factory()() as session:
+                moved = await archive_clicks(session, self.directory, older_than)
+        self.archived += moved
+        self.last_run_at = datetime.now(timezone.utc)
+        if moved:
+            logger.info("Archived %d clicks", moved)
+        return moved
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "retention_days": self.retention_days,
+            "archived": self.archived,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
+
+
+click_archiver = ClickArchiver(
+    Path(settings.CLICK_ARCHIVE_DIR),
+    retention_days=settings.CLICK_RETENTION_DAYS,
+    interval=settings.CLICK_RETENTION_INTERVAL_SECONDS,
+)
+
+
+async def _main(argv: list[str]) -> int:
+    if not argv or argv[0] not in ("archive", "list"):
+        print("usage: python -m app.retention archive [DAYS] | list", file=sys.stderr)
+        return 2
+    directory = Path(settings.CLICK_ARCHIVE_DIR)
+    if argv[0] == "list":
+        for month, rows in archived_months(directory).items():
+            print(f"{month}  {rows} clicks")
+        return 0
+
+    days = int(argv[1]) if len(argv) > 1 else settings.CLICK_RETENTION_DAYS
+    if days <= 0:
+        print("Set CLICK_RETENTION_DAYS or pass the number of days to keep", file=sys.stderr)
+        return 2
+    from app.database import init_db
+
+    await init_db()
+    archiver = ClickArchiver(directory, retention_days=days, interval=0)
+    moved = await archiver.run_once()
+    print(f"Archived {moved} clicks older than {days} days to {directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,138 @@
+"""Incrementally maintained click rollups.
+
+Run ``python -m app.rollups backfill`` to rebuild the rollups and visitor
+sketches from the raw clicks table and the click archive, e.g. after upgrading an existing
+database. Stop the app first, otherwise clicks flushed during the rebuild may be counted twice.
+"""
+import asyncio
+import sys
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Click, ClickRollup
+from app.utils import insert_chunks
+
+DIMENSIONS = ("hour", "day", "country", "referrer")
+
+# Hourly buckets returned by the stats endpoints
+RECENT_HOURS = 48
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def referrer_domain(referrer: Optional[str]) -> str:
+    """Reduce a referrer URL to its host name."""
+    if not referrer:
+        return "direct"
+    host = urlparse(referrer).hostname
+    return host or "unknown"
+
+
+def _as_utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def _hour_bucket(dt: datetime) -> str:
+    return _as_utc(dt).strftime("%Y-%m-%dT%H:00")
+
+
+def rollup_counts(clicks: Iterable) -> Counter:
+    """Count clicks per (link_id, dimension, bucket).
+
+    Accepts anything with link_id, referrer, country and clicked_at
+    attributes, i.e. Click rows or buffered click events.
+    """
+    counts: Counter = Counter()
+    for click in clicks:
+        clicked_at = _as_utc(click.clicked_at)
+        counts[(click.link_id, "hour", _hour_bucket(clicked_at))] += 1
+        counts[(click.link_id, "day", clicked_at.strftime("%Y-%m-%d"))] += 1
+        counts[(click.link_id, "country", click.country)] += 1
+        counts[(click.link_id, "referrer", referrer_domain(click.referrer))] += 1
+    return counts
+
+
+def _rollup_rows(counts: Counter) -> list[dict]:
+    return [
+        {"link_id": link_id, "dimension": dimension, "bucket": bucket, "clicks": n}
+        for (link_id, dimension, bucket), n in counts.items()
+    ]
+
+
+async def apply_rollups(session: AsyncSession, clicks: Iterable) -> None:
+    """Add clicks to the rollup tables. The caller commits."""
+    rows = _rollup_rows(rollup_counts(clicks))
+    for chunk in insert_chunks(rows):
+        stmt = insert(ClickRollup).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["link_id", "dimension", "bucket"],
+            set_={"clicks": ClickRollup.clicks + stmt.excluded.clicks},
+        )
+        await session.execute(stmt)
+
+
+async def get_rollups(session: AsyncSession, link_id: int) -> dict[str, dict[str, int]]:
+    """Return rollups for a link as {dimension: {bucket: clicks}}.
+
+    Hourly buckets are limited to the last RECENT_HOURS hours.
+    """
+    since = _hour_bucket(datetime.now(timezone.utc) - timedelta(hours=RECENT_HOURS))
+    result = await session.execute(
+        select(ClickRollup.dimension, ClickRollup.bucket, ClickRollup.clicks)
+        .where(ClickRollup.link_id == link_id)
+        .where(or_(ClickRollup.dimension != "hour", ClickRollup.bucket >= since))
+    )
+    rollups: dict[str, dict[str, int]] = {dimension: {} for dimension in DIMENSIONS}
+    for dimension, bucket, clicks in result.all():
+        rollups[dimension][bucket] = clicks
+    return rollups
+
+
+async def backfill_rollups(session: AsyncSession, archived: Iterable[list] = ()) -> int:
+    """Rebuild all rollups from the raw clicks table plus any ``archived``
+    click batches. Returns clicks processed."""
+    await session.execute(delete(ClickRollup))
+    totals: Counter = Counter()
+    processed = 0
+    for partition in archived:
+        totals.update(rollup_counts(partition))
+        processed += len(partition)
+    result = await session.stream(select(Click).execution_options(yield_per=BACKFILL_BATCH_SIZE))
+    async for partition in result.scalars().partitions():
+        totals.update(rollup_counts(partition))
+        processed += len(partition)
+
+    rows = _rollup_rows(totals)
+    for chunk in insert_chunks(rows):
+        await session.execute(insert(ClickRollup).values(chunk))
+    await session.commit()
+    return processed
+
+
+async def _main(argv: list[str]) -> int:
+    if argv != ["backfill"]:
+        print("usage: python -m app.rollups backfill", file=sys.stderr)
+        return 2
+    from app.config import settings
+    from app.database import async_session, init_db
+    from app.retention import read_archived_clicks
+    from app.visitors import backfill_visitor_sketches
+
+    await init_db()
+    archive = Path(settings.CLICK_ARCHIVE_DIR)
+    async with async_session() as session:
+        processed = await backfill_rollups(session, read_archived_clicks(archive))
+        await backfill_visitor_sketches(session, read_archived_clicks(archive))
+    print(f"Rebuilt rollups and visitor sketches from {processed} clicks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException, status
 
 from app.auth import create_access_token, verify_admin_credentials
+from app.profiling import TimedRoute
 from app.schemas import LoginRequest, TokenResponse
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+router = APIRouter(prefix="/auth", tags=["Authentication"], route_class=TimedRoute)
 
 
 @router.post("/login", response_model=TokenResponse)
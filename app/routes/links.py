@@ -1,30 +1,54 @@
+import asyncio
+import io
+import json
+import zipfile
 from datetime import datetime, timezone
+from typing import AsyncIterator, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, select
+from pydantic import ValidationError
+from sqlalchemy import Integer, column, func, insert, or_, select, text, tuple_
+from sqlalchemy.exc import IntegrityError
 
+from app.allocator import short_code_allocator
 from app.auth import verify_token
-from app.database import get_session
+from app.bloom import short_code_filter
+from app.config import settings
+from app.database import get_read_session, get_session
+from app.invalidation import invalidation_channel
 from app.models import Link
+from app.profiling import TimedRoute
+from app.qr_cache import qr_cache
+from app.qr_render import render_qr_async
 from app.rate_limit import check_rate_limit
 from app.schemas import (
+    BulkLinkResponse,
+    BulkLinkResult,
     LinkCreateRequest,
     LinkListResponse,
     LinkResponse,
     LinkUpdateRequest,
     MessageResponse,
+    QRBulkRequest,
 )
-from app.utils import build_short_url, generate_qr_code_base64, generate_short_code
+from app.utils import (
+    as_naive_utc,
+    build_short_url,
+    decode_cursor,
+    encode_cursor,
+    link_domain,
+)
+
+router = APIRouter(tags=["Links"], route_class=TimedRoute)
 
-router = APIRouter(tags=["Links"])
+# Placeholder for NDJSON lines that failed to parse
+_INVALID_JSON = object()
 
 
-def _link_to_response(link: Link, include_qr: bool = False) -> LinkResponse:
+def _link_to_response(link: Link, qr: Optional[str] = None) -> LinkResponse:
     """Convert a Link model to a LinkResponse schema."""
-    qr = None
-    if include_qr:
-        qr = generate_qr_code_base64(build_short_url(link.short_code))
     return LinkResponse(
         id=link.id,
         short_code=link.short_code,
@@ -32,6 +56,7 @@ def _link_to_response(link: Link, include_qr: bool = False) -> LinkResponse:
         original_url=link.original_url,
         is_vanity=link.is_vanity,
         is_active=link.is_active,
+        deactivated_reason=link.deactivated_reason,
         expires_at=link.expires_at,
         max_clicks=link.max_clicks,
         total_clicks=link.total_clicks,
@@ -52,71 +77,416 @@ async def create_link(
     session: AsyncSession = Depends(get_session),
 ):
     """Create a new short link. Rate-limited for unauthenticated users."""
-    if request.custom_slug:
-        short_code = request.custom_slug
-        is_vanity = True
-    else:
-        short_code = generate_short_code()
-        is_vanity = False
+    is_vanity = request.custom_slug is not None
 
-    # Check uniqueness
-    result = await session.execute(select(Link).where(Link.short_code == short_code))
-    existing = result.scalars().first()
-    if existing:
+    # The unique index on short_code is the only uniqueness check: vanity
+    # slugs fail with 409, while an allocated code only collides with an
+    # existing vanity slug, in which case we move on to the next one.
+    for _ in range(5):
         if is_vanity:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail=f"Slug '{short_code}' is already taken",
-            )
-        # Retry for generated codes (extremely unlikely collision)
-        for _ in range(5):
-            short_code = generate_short_code()
-            result = await session.execute(select(Link).where(Link.short_code == short_code))
-            if not result.scalars().first():
-                break
+            short_code = request.custom_slug
         else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to generate unique short code",
-            )
-
-    link = Link(
-        short_code=short_code,
-        original_url=str(request.url),
-        is_vanity=is_vanity,
-        expires_at=request.expires_at,
-        max_clicks=request.max_clicks,
-    )
-    session.add(link)
-    await session.commit()
+            short_code = await short_code_allocator.allocate(session.bind)
+        link = Link(
+            short_code=short_code,
+            original_url=str(request.url),
+            domain=link_domain(str(request.url)),
+            is_vanity=is_vanity,
+            expires_at=request.expires_at,
+            max_clicks=request.max_clicks,
+        )
+        session.add(link)
+        try:
+            await session.commit()
+            break
+        except IntegrityError:
+            await session.rollback()
+            if is_vanity:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Slug '{short_code}' is already taken",
+                )
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to generate unique short code",
+        )
     await session.refresh(link)
+    short_code_filter.add(link.short_code)
+
+    qr = await qr_cache.get_base64(build_short_url(link.short_code))
+    return _link_to_response(link, qr=qr)
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'item'}: {err['msg']}"
+        for err in exc.errors()
+    )
+
+
+def _bulk_error(index: int, message: str) -> BulkLinkResult:
+    return BulkLinkResult(index=index, status="error", error=message)
+
+
+async def _insert_individually(
+    session: AsyncSession,
+    batch: list[tuple[int, Link]],
+    results: list[Optional[BulkLinkResult]],
+) -> list[tuple[int, Link]]:
+    """Slow path after a batch hit the unique index: find out which items conflict."""
+    created = []
+    for index, link in batch:
+        for attempt in range(2):
+            try:
+                await session.execute(insert(Link).values(**link.model_dump(exclude={"id"})))
+                await session.commit()
+                created.append((index, link))
+                break
+            except IntegrityError:
+                await session.rollback()
+                if link.is_vanity or attempt:
+                    results[index] = _bulk_error(index, f"Slug '{link.short_code}' is already taken")
+                    break
+                # An allocated code only collides with a vanity slug; take the next one
+                link.short_code = await short_code_allocator.allocate(session.bind)
+    return created
+
+
+def _too_many_items() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"At most {settings.BULK_CREATE_MAX_ITEMS} links per request",
+    )
+
+
+def _parse_ndjson_lines(lines: list, raw_items: list) -> None:
+    for line in lines:
+        if line.strip():
+            try:
+                raw_items.append(json.loads(line))
+            except ValueError:
+                raw_items.append(_INVALID_JSON)
+
+
+async def _read_bulk_items(request: Request) -> list:
+    """Read a JSON array or NDJSON body, giving up as soon as it is over the size or item limits."""
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Body larger than {settings.BULK_CREATE_MAX_BYTES} bytes",
+    )
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > settings.BULK_CREATE_MAX_BYTES:
+        raise too_large
+
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+    raw_items: list = []
+    body = bytearray()
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > settings.BULK_CREATE_MAX_BYTES:
+            raise too_large
+        body += chunk
+        if ndjson:
+            *lines, rest = body.split(b"\n")
+            _parse_ndjson_lines(lines, raw_items)
+            body = bytearray(rest)
+            if len(raw_items) > settings.BULK_CREATE_MAX_ITEMS:
+                raise _too_many_items()
+    if ndjson:
+        _parse_ndjson_lines([body], raw_items)
+        return raw_items
+
+    try:
+        raw_items = json.loads(body)
+    except ValueError:
+        raw_items = None
+    if not isinstance(raw_items, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Body must be a JSON array or NDJSON",
+        )
+    return raw_items
+
+
+@router.post("/links/bulk", response_model=BulkLinkResponse)
+async def bulk_create_links(
+    request: Request,
+    include_qr: bool = Query(False, description="Embed a QR code in each created item"),
+    _admin: str = Depends(verify_token),
+    session: AsyncSession = Depends(get_session),
+):
+    """Create many links from a JSON array or an NDJSON body. Admin only.
+
+    Items are validated in one pass and inserted in batched transactions.
+    Every item gets its own result, so a bad item doesn't fail the rest.
+    """
+    raw_items = await _read_bulk_items(request)
+    if len(raw_items) > settings.BULK_CREATE_MAX_ITEMS:
+        raise _too_many_items()
+
+    results: list[Optional[BulkLinkResult]] = [None] * len(raw_items)
+    valid: list[tuple[int, LinkCreateRequest]] = []
+    seen_slugs: set[str] = set()
+    for index, raw in enumerate(raw_items):
+        if raw is _INVALID_JSON:
+            results[index] = _bulk_error(index, "Invalid JSON")
+            continue
+        try:
+            item = LinkCreateRequest.model_validate(raw)
+        except ValidationError as e:
+            results[index] = _bulk_error(index, _validation_message(e))
+            continue
+        if item.custom_slug is not None:
+            if item.custom_slug in seen_slugs:
+                results[index] = _bulk_error(index, f"Slug '{item.custom_slug}' appears more than once")
+                continue
+            seen_slugs.add(item.custom_slug)
+        valid.append((index, item))
+
+    # Reserve codes before the session checks out a connection
+    generated = iter(await short_code_allocator.allocate_many(
+        session.bind, sum(1 for _, item in valid if item.custom_slug is None)
+    ))
 
-    return _link_to_response(link, include_qr=True)
+    taken: set[str] = set()
+    if seen_slugs:
+        result = await session.execute(select(Link.short_code).where(Link.short_code.in_(seen_slugs)))
+        taken = set(result.scalars().all())
+
+    pending: list[tuple[int, Link]] = []
+    for index, item in valid:
+        if item.custom_slug in taken:
+            results[index] = _bulk_error(index, f"Slug '{item.custom_slug}' is already taken")
+            continue
+        pending.append((index, Link(
+            short_code=item.custom_slug or next(generated),
+            original_url=str(item.url),
+            domain=link_domain(str(item.url)),
+            is_vanity=item.custom_slug is not None,
+            expires_at=item.expires_at,
+            max_clicks=item.max_clicks,
+        )))
+
+    created: list[tuple[int, Link]] = []
+    batch_size = settings.BULK_CREATE_BATCH_SIZE
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        try:
+            await session.execute(insert(Link), [link.model_dump(exclude={"id"}) for _, link in batch])
+            await session.commit()
+            created.extend(batch)
+        except IntegrityError:
+            await session.rollback()
+            created.extend(await _insert_individually(session, batch, results))
+    for _, link in created:
+        short_code_filter.add(link.short_code)
+
+    qr_codes: list[Optional[str]] = [None] * len(created)
+    if include_qr:
+        qr_codes = await asyncio.gather(*(
+            qr_cache.get_base64(build_short_url(link.short_code)) for _, link in created
+        ))
+    for (index, link), qr in zip(created, qr_codes):
+        results[index] = BulkLinkResult(
+            index=index,
+            status="created",
+            short_code=link.short_code,
+            short_url=build_short_url(link.short_code),
+            qr_code_base64=qr,
+        )
+
+    return BulkLinkResponse(
+        created=len(created),
+        failed=len(results) - len(created),
+        results=results,
+    )
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Unseekable sink that lets zipfile write an archive in pieces."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _stream_qr_zip(
+    short_codes: list[str], missing: list[str], request: QRBulkRequest
+) -> AsyncIterator[bytes]:
+    """Render QR codes in parallel and yield the ZIP as each image is added."""
+    # PNGs are already compressed; SVGs shrink a lot
+    compression = zipfile.ZIP_DEFLATED if request.format == "svg" else zipfile.ZIP_STORED
+
+    async def render(code: str) -> tuple[str, bytes]:
+        url = build_short_url(code)
+        return code, await render_qr_async(url, request.format, request.box_size, request.border)
+
+    tasks = [asyncio.ensure_future(render(code)) for code in short_codes]
+    sink = _ChunkWriter()
+    try:
+        with zipfile.ZipFile(sink, "w", compression=compression) as archive:
+            for future in asyncio.as_completed(tasks):
+                code, data = await future
+                archive.writestr(f"{code}.{request.format}", data)
+                yield sink.drain()
+            if missing:
+                archive.writestr("missing.txt", "\n".join(missing) + "\n")
+        yield sink.drain()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@router.post("/links/qr")
+async def bulk_qr_codes(
+    request: QRBulkRequest,
+    _admin: str = Depends(verify_token),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Render QR codes for many links and stream them back as a ZIP. Admin only.
+
+    Codes that don't exist are listed in missing.txt inside the archive.
+    """
+    requested = list(dict.fromkeys(request.short_codes))
+    result = await session.execute(select(Link.short_code).where(Link.short_code.in_(requested)))
+    found = set(result.scalars().all())
+    short_codes = [code for code in requested if code in found]
+    missing = [code for code in requested if code not in found]
+
+    return StreamingResponse(
+        _stream_qr_zip(short_codes, missing, request),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="qr-codes.zip"'},
+    )
+
+
+# Sort keys for list_links: column, descending, and how to read its value back from a cursor.
+# The domain, active and is_vanity filters walk (filter, created_at, id) indexes. total_clicks is
+# deliberately unindexed: every counted click updates it, and an index there would add a b-tree
+# write to each redirect to speed up an admin-only listing, so its sorts and min_clicks scan.
+LINK_SORTS = {
+    "-created_at": (Link.created_at, True, datetime.fromisoformat),
+    "created_at": (Link.created_at, False, datetime.fromisoformat),
+    "-total_clicks": (Link.total_clicks, True, int),
+    "total_clicks": (Link.total_clicks, False, int),
+}
+
+# Shortest search the trigram index can answer; shorter ones scan the table
+MIN_INDEXED_SEARCH = 3
+
+
+def _search_condition(q: str):
+    """Match links whose short code or original URL contains ``q``, case-insensitively."""
+    if len(q) < MIN_INDEXED_SEARCH:
+        return or_(Link.short_code.icontains(q, autoescape=True), Link.original_url.icontains(q, autoescape=True))
+    # A quoted FTS5 string: the trigram tokenizer matches it as a substring
+    matches = text("SELECT rowid FROM links_fts WHERE links_fts MATCH :search").bindparams(
+        search='"' + q.replace('"', '""') + '"'
+    ).columns(column("rowid", Integer))
+    return Link.id.in_(matches)
+
+
+def _decode_link_cursor(cursor: str, sort: str) -> tuple:
+    try:
+        value, link_id = decode_cursor(cursor)
+        return LINK_SORTS[sort][2](value), int(link_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
 
 
 @router.get("/links", response_model=LinkListResponse)
 async def list_links(
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page; overrides page"),
+    include_total: Optional[bool] = Query(
+        None, description="Count matching links. Defaults to true without a cursor, false with one."
+    ),
+    q: Optional[str] = Query(None, min_length=1, max_length=200, description="Substring of the short code or URL"),
+    domain: Optional[str] = Query(None, description="Destination host, without www."),
+    is_vanity: Optional[bool] = Query(None),
+    active: Optional[bool] = Query(None),
+    expired: Optional[bool] = Query(None, description="Past expires_at"),
+    created_after: Optional[datetime] = Query(None, description="Inclusive"),
+    created_before: Optional[datetime] = Query(None, description="Exclusive"),
+    min_clicks: Optional[int] = Query(None, ge=0),
+    sort: Literal[tuple(LINK_SORTS)] = Query("-created_at", description="Sort key, - for descending"),
     _admin: str = Depends(verify_token),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
-    """List all links with pagination. Admin only."""
-    offset = (page - 1) * per_page
+    """List links, newest first unless sorted otherwise, optionally filtered. Admin only.
 
-    total_result = await session.execute(select(func.count(Link.id)))
-    total = total_result.scalar_one()
+    Follow next_cursor for pages that cost the same at any depth; page
+    numbers are still accepted but use OFFSET. A cursor only works with
+    the sort it was returned for.
+    """
+    conditions = []
+    if q is not None:
+        conditions.append(_search_condition(q))
+    if domain is not None:
+        conditions.append(Link.domain == link_domain(domain if "//" in domain else f"//{domain}"))
+    if is_vanity is not None:
+        conditions.append(Link.is_vanity == is_vanity)
+    if active is not None:
+        conditions.append(Link.is_active == active)
+    if expired is not None:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        conditions.append(
+            Link.expires_at <= now if expired else or_(Link.expires_at.is_(None), Link.expires_at > now)
+        )
+    if created_after is not None:
+        conditions.append(Link.created_at >= as_naive_utc(created_after))
+    if created_before is not None:
+        conditions.append(Link.created_at < as_naive_utc(created_before))
+    if min_clicks is not None:
+        conditions.append(Link.total_clicks >= min_clicks)
 
-    result = await session.execute(
-        select(Link).order_by(Link.created_at.desc()).offset(offset).limit(per_page)
-    )
+    sort_column, descending, _ = LINK_SORTS[sort]
+    query = select(Link).where(*conditions)
+    if descending:
+        query = query.order_by(sort_column.desc(), Link.id.desc())
+    else:
+        query = query.order_by(sort_column, Link.id)
+    if cursor is not None:
+        key = tuple_(sort_column, Link.id)
+        position = _decode_link_cursor(cursor, sort)
+        query = query.where(key < position if descending else key > position)
+    else:
+        query = query.offset((page - 1) * per_page)
+
+    total = None
+    if include_total if include_total is not None else cursor is None:
+        total_result = await session.execute(select(func.count(Link.id)).where(*conditions))
+        total = total_result.scalar_one()
+
+    # Fetch one extra row to learn whether there is a next page
+    result = await session.execute(query.limit(per_page + 1))
     links = result.scalars().all()
+    next_cursor = None
+    if len(links) > per_page:
+        links = links[:per_page]
+        value = getattr(links[-1], sort_column.key)
+        next_cursor = encode_cursor(value.isoformat() if isinstance(value, datetime) else value, links[-1].id)
 
     return LinkListResponse(
         links=[_link_to_response(link) for link in links],
         total=total,
         page=page,
         per_page=per_page,
+        next_cursor=next_cursor,
     )
 
 
@@ -124,14 +494,15 @@ async def list_links(
 async def get_link(
     short_code: str,
     _admin: str = Depends(verify_token),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
     """Get a single link by short code. Admin only."""
     result = await session.execute(select(Link).where(Link.short_code == short_code))
     link = result.scalars().first()
     if not link:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link not found")
-    return _link_to_response(link, include_qr=True)
+    qr = await qr_cache.get_base64(build_short_url(link.short_code))
+    return _link_to_response(link, qr=qr)
 
 
 @router.patch("/links/{short_code}", response_model=LinkResponse)
@@ -151,10 +522,16 @@ async def update_link(
         link.expires_at = request.expires_at
     if request.max_clicks is not None:
         link.max_clicks = request.max_clicks
+    # New limits revive a link the sweeper deactivated; it deactivates it again if they're already past
+    if link.deactivated_reason in ("expired", "click_limit"):
+        link.is_active = True
+        link.deactivated_reason = None
     link.updated_at = datetime.now(timezone.utc)
 
     session.add(link)
     await session.commit()
+    # Publish before refresh checks the writer connection out again: the change log needs it
+    await invalidation_channel.publish([short_code])
     await session.refresh(link)
 
     return _link_to_response(link)
@@ -173,8 +550,10 @@ async def delete_link(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link not found")
 
     link.is_active = False
+    link.deactivated_reason = "deleted"
     link.updated_at = datetime.now(timezone.utc)
     session.add(link)
     await session.commit()
+    await invalidation_channel.publish([short_code])
 
     return MessageResponse(message=f"Link '{short_code}' has been deleted")
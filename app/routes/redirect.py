@@ -1,61 +1,130 @@
 from datetime import datetime, timezone
-
-from pathlib import Path
+from typing import Mapping, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from app.database import get_session
-from app.models import Click, Link
-from app.utils import build_short_url, generate_qr_code_bytes, hash_ip
+from app.bloom import short_code_filter
+from app.cache import CachedLink, link_cache
+from app.clicks import ClickEvent, claim_click, click_buffer, write_clicks
+from app.config import settings
+from app.database import get_read_session, get_session
+from app.link_index import link_index
+from app.models import Link
+from app.profiling import TimedRoute
+from app.qr_cache import qr_cache
+from app.static_pages import static_pages
+from app.utils import build_short_url, etag_matches, hash_ip
 
-STATIC_DIR = Path(__file__).parent.parent / "static"
+router = APIRouter(tags=["Redirect"], route_class=TimedRoute)
 
-router = APIRouter(tags=["Redirect"])
 
+NOT_FOUND = (status.HTTP_404_NOT_FOUND, "Link not found")
 
-async def _get_active_link(short_code: str, session: AsyncSession) -> Link:
-    """Fetch a link and validate it's active and not expired."""
-    result = await session.execute(select(Link).where(Link.short_code == short_code))
-    link = result.scalars().first()
+GONE = {
+    "deleted": (status.HTTP_410_GONE, "This link has been deleted"),
+    "expired": (status.HTTP_410_GONE, "This link has expired"),
+    "click_limit": (status.HTTP_410_GONE, "This link has reached its click limit"),
+}
 
-    if not link:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link not found")
 
+def link_error(link: CachedLink) -> Optional[tuple[int, str]]:
+    """Return (status, detail) if the link can't be followed, else None."""
     if not link.is_active:
-        raise HTTPException(status_code=status.HTTP_410_GONE, detail="This link has been deleted")
+        return GONE.get(link.deactivated_reason, GONE["deleted"])
 
-    # Check date expiry
+    # The expiry sweeper deactivates these; until its next pass, check them here
     if link.expires_at:
         expires = link.expires_at if link.expires_at.tzinfo else link.expires_at.replace(tzinfo=timezone.utc)
         if datetime.now(timezone.utc) > expires:
-            raise HTTPException(status_code=status.HTTP_410_GONE, detail="This link has expired")
+            return GONE["expired"]
+    if link.max_clicks is not None and link.total_clicks >= link.max_clicks:
+        return GONE["click_limit"]
+
+    return None
+
 
-    # Check max clicks expiry
-    if link.max_clicks and link.total_clicks >= link.max_clicks:
-        raise HTTPException(status_code=status.HTTP_410_GONE, detail="This link has reached its click limit")
+def click_event(link_id: int, client_ip: str, headers: Mapping[str, str]) -> ClickEvent:
+    """Build the click for a redirect from the client address and request headers."""
+    return ClickEvent(
+        link_id=link_id,
+        ip_hash=hash_ip(client_ip),
+        referrer=headers.get("referer"),
+        country=headers.get("cf-ipcountry") or headers.get("x-country") or "unknown",
+    )
 
+
+async def _get_active_link(short_code: str, session: AsyncSession) -> CachedLink:
+    """Fetch a link (from the index or cache if possible) and validate it's active and not expired."""
+    link = link_index.get(short_code) or link_cache.get(short_code)
+    if link is None:
+        if not short_code_filter.might_exist(short_code):
+            raise HTTPException(status_code=NOT_FOUND[0], detail=NOT_FOUND[1])
+        result = await session.execute(select(Link).where(Link.short_code == short_code))
+        row = result.scalars().first()
+        if not row:
+            raise HTTPException(status_code=NOT_FOUND[0], detail=NOT_FOUND[1])
+        link = CachedLink.from_link(row)
+        link_cache.set(link)
+
+    error = link_error(link)
+    if error:
+        raise HTTPException(status_code=error[0], detail=error[1])
     return link
 
 
+async def _redirect_limited(link: CachedLink, session: AsyncSession, event: ClickEvent) -> RedirectResponse:
+    """Redirect a link with a click limit, claiming the click atomically so
+    concurrent redirects can't overshoot max_clicks."""
+    short_code = link.short_code
+    claimed = await claim_click(session, short_code)
+    if claimed is None:
+        # Work out why only now, from the current row, and refresh the cached copy
+        result = await session.execute(select(Link).where(Link.short_code == short_code))
+        row = result.scalars().first()
+        if row is None:
+            link_cache.invalidate(short_code)
+            raise HTTPException(status_code=NOT_FOUND[0], detail=NOT_FOUND[1])
+        link = CachedLink.from_link(row)
+        link_cache.set(link)
+        error = link_error(link) or GONE["click_limit"]
+        raise HTTPException(status_code=error[0], detail=error[1])
+
+    _, original_url, total_clicks = claimed
+    event.counted = True
+    if click_buffer.running:
+        await session.commit()
+        await click_buffer.add(event)
+    else:
+        await write_clicks(session, [event])
+        await session.commit()
+    link.total_clicks = total_clicks
+    return RedirectResponse(url=original_url, status_code=status.HTTP_302_FOUND)
+
+
 @router.get("/{short_code}/stats", response_class=HTMLResponse, include_in_schema=False)
-async def stats_page(short_code: str):
+async def stats_page(short_code: str, request: Request):
     """Serve the public stats page for a short link."""
-    return (STATIC_DIR / "stats.html").read_text()
+    return static_pages.response("stats.html", request)
 
 
 @router.get("/{short_code}/qr", response_class=Response)
 async def get_qr_code(
     short_code: str,
-    session: AsyncSession = Depends(get_session),
+    request: Request,
+    session: AsyncSession = Depends(get_read_session),
 ):
-    """Get QR code PNG image for a short link."""
+    """Get QR code PNG image for a short link. Supports If-None-Match."""
     await _get_active_link(short_code, session)
     url = build_short_url(short_code)
-    png_bytes = generate_qr_code_bytes(url)
-    return Response(content=png_bytes, media_type="image/png")
+    headers = {"Cache-Control": f"public, max-age={settings.QR_CACHE_MAX_AGE_SECONDS}"}
+    etag = f'"{qr_cache.key(url)}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={**headers, "ETag": etag})
+    png_bytes, etag = await qr_cache.get(url)
+    return Response(content=png_bytes, media_type="image/png", headers={**headers, "ETag": etag})
 
 
 @router.get("/{short_code}", response_class=RedirectResponse)
@@ -63,31 +132,21 @@ async def redirect_to_url(
     short_code: str,
     request: Request,
     session: AsyncSession = Depends(get_session),
+    read_session: AsyncSession = Depends(get_read_session),
 ):
     """Redirect to the original URL and record click analytics."""
-    link = await _get_active_link(short_code, session)
-
-    # Record click
+    link = await _get_active_link(short_code, read_session)
     client_ip = request.client.host if request.client else "unknown"
-    referrer = request.headers.get("referer")
-    country = (
-        request.headers.get("cf-ipcountry")
-        or request.headers.get("x-country")
-        or "unknown"
-    )
+    event = click_event(link.id, client_ip, request.headers)
+    if link.max_clicks is not None:
+        return await _redirect_limited(link, session, event)
 
-    click = Click(
-        link_id=link.id,
-        ip_hash=hash_ip(client_ip),
-        referrer=referrer,
-        country=country,
-    )
-    session.add(click)
-
-    # Increment counter
+    # Record click
+    if click_buffer.running:
+        await click_buffer.add(event)
+    else:
+        await write_clicks(session, [event])
+        await session.commit()
     link.total_clicks += 1
-    session.add(link)
-
-    await session.commit()
 
     return RedirectResponse(url=link.original_url, status_code=status.HTTP_302_FOUND)
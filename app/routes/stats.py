@@ -1,44 +1,105 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import csv
+import io
+import json
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, select
+from sqlalchemy import select, tuple_
 
 from app.auth import verify_token
-from app.database import get_session
+from app.config import settings
+from app.database import get_read_session, get_read_session_factory
 from app.models import Click, Link
+from app.profiling import TimedRoute
+from app.retention import archived_ip_hashes, archived_page, read_archived_clicks
+from app.rollups import get_rollups
 from app.schemas import ClickResponse, PublicClickResponse, PublicStatsResponse, StatsResponse
+from app.utils import as_naive_utc, decode_keyset_cursor, encode_cursor
+from app.visitors import estimate_unique, exact_unique
 
-router = APIRouter(tags=["Stats"])
+router = APIRouter(tags=["Stats"], route_class=TimedRoute)
 
 
 @router.get("/links/{short_code}/stats", response_model=StatsResponse)
 async def get_link_stats(
     short_code: str,
+    exact: bool = Query(False, description="Count unique clicks exactly instead of estimating"),
+    limit: int = Query(100, ge=1, le=1000, description="Clicks per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include_archived: bool = Query(
+        False, description="Continue the click history, and exact unique counts, into archived clicks"
+    ),
     _admin: str = Depends(verify_token),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
-    """Get click analytics for a link. Admin only."""
+    """Get click analytics for a link, with click history newest first. Admin only."""
+    if cursor is not None:
+        try:
+            clicked_at, click_id = decode_keyset_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
     result = await session.execute(select(Link).where(Link.short_code == short_code))
     link = result.scalars().first()
     if not link:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link not found")
 
+    archive = Path(settings.CLICK_ARCHIVE_DIR)
+
     # Unique clicks
-    unique_result = await session.execute(
-        select(func.count(func.distinct(Click.ip_hash))).where(Click.link_id == link.id)
-    )
-    unique_clicks = unique_result.scalar_one()
+    if exact and include_archived:
+        result = await session.execute(select(Click.ip_hash).distinct().where(Click.link_id == link.id))
+        hashes = set(result.scalars()) | await asyncio.to_thread(archived_ip_hashes, archive, link.id)
+        unique_clicks = len(hashes)
+    elif exact:
+        unique_clicks = await exact_unique(session, link.id)
+    else:
+        unique_clicks = await estimate_unique(session, link.id)
+    today = datetime.now(timezone.utc).date()
+    unique_clicks_7d = await estimate_unique(session, link.id, since=today - timedelta(days=6))
+    unique_clicks_30d = await estimate_unique(session, link.id, since=today - timedelta(days=29))
 
-    # All clicks
-    clicks_result = await session.execute(
-        select(Click).where(Click.link_id == link.id).order_by(Click.clicked_at.desc())
+    rollups = await get_rollups(session, link.id)
+
+    # One page of clicks, plus one extra row to learn whether there is a next page
+    query = (
+        select(Click)
+        .where(Click.link_id == link.id)
+        .order_by(Click.clicked_at.desc(), Click.id.desc())
+        .limit(limit + 1)
     )
-    clicks = clicks_result.scalars().all()
+    if cursor is not None:
+        query = query.where(tuple_(Click.clicked_at, Click.id) < (clicked_at, click_id))
+    clicks_result = await session.execute(query)
+    clicks = list(clicks_result.scalars().all())
+    if include_archived and len(clicks) <= limit:
+        # Archived clicks are all older than the hot ones, so they continue the page
+        before = (clicks[-1].clicked_at, clicks[-1].id) if clicks else (
+            (clicked_at, click_id) if cursor is not None else None
+        )
+        clicks += await asyncio.to_thread(archived_page, archive, link.id, before, limit + 1 - len(clicks))
+    next_cursor = None
+    if len(clicks) > limit:
+        clicks = clicks[:limit]
+        next_cursor = encode_cursor(clicks[-1].clicked_at.isoformat(), clicks[-1].id)
 
     return StatsResponse(
         short_code=link.short_code,
         original_url=link.original_url,
         total_clicks=link.total_clicks,
         unique_clicks=unique_clicks,
+        unique_clicks_estimated=not exact,
+        unique_clicks_7d=unique_clicks_7d,
+        unique_clicks_30d=unique_clicks_30d,
+        clicks_by_country=rollups["country"],
+        clicks_by_referrer=rollups["referrer"],
+        clicks_by_day=rollups["day"],
+        clicks_by_hour=rollups["hour"],
         clicks=[
             ClickResponse(
                 ip_hash=c.ip_hash,
@@ -48,6 +109,7 @@ async def get_link_stats(
             )
             for c in clicks
         ],
+        next_cursor=next_cursor,
     )
 
 
@@ -58,11 +120,9 @@ async def _fetch_public_stats(short_code: str, session: AsyncSession) -> PublicS
     if not link:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link not found")
 
-    # Unique clicks
-    unique_result = await session.execute(
-        select(func.count(func.distinct(Click.ip_hash))).where(Click.link_id == link.id)
-    )
-    unique_clicks = unique_result.scalar_one()
+    unique_clicks = await estimate_unique(session, link.id)
+
+    rollups = await get_rollups(session, link.id)
 
     # Recent clicks (last 100)
     clicks_result = await session.execute(
@@ -79,6 +139,10 @@ async def _fetch_public_stats(short_code: str, session: AsyncSession) -> PublicS
         total_clicks=link.total_clicks,
         unique_clicks=unique_clicks,
         created_at=link.created_at,
+        clicks_by_country=rollups["country"],
+        clicks_by_referrer=rollups["referrer"],
+        clicks_by_day=rollups["day"],
+        clicks_by_hour=rollups["hour"],
         clicks=[
             PublicClickResponse(
                 referrer=c.referrer,
@@ -93,7 +157,112 @@ async def _fetch_public_stats(short_code: str, session: AsyncSession) -> PublicS
 @router.get("/links/{short_code}/stats/public", response_model=PublicStatsResponse)
 async def get_public_link_stats(
     short_code: str,
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
     """Get public click analytics for a link. No authentication required, no IP hashes exposed."""
     return await _fetch_public_stats(short_code, session)
+
+
+EXPORT_FIELDS = ("clicked_at", "ip_hash", "referrer", "country")
+EXPORT_BATCH_SIZE = 1000
+
+
+def _format_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _format_rows(rows, fields: list[str], export_format: str) -> str:
+    if export_format == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerows([[_format_value(v) for v in row] for row in rows])
+        return buf.getvalue()
+    return "".join(
+        json.dumps({f: _format_value(v) for f, v in zip(fields, row)}) + "\n"
+        for row in rows
+    )
+
+
+async def _stream_clicks(
+    session_factory,
+    query,
+    fields: list[str],
+    export_format: str,
+    archived: Optional[Iterator[list]] = None,
+) -> AsyncIterator[str]:
+    """Yield one chunk of NDJSON or CSV per batch of rows read from a server-side cursor.
+
+    ``archived`` batches, read from the click archive, come first.
+    """
+    if export_format == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(fields)
+        yield buf.getvalue()
+
+    if archived is not None:
+        while (batch := await asyncio.to_thread(next, archived, None)) is not None:
+            rows = [[getattr(click, f) for f in fields] for click in batch]
+            yield _format_rows(rows, fields, export_format)
+
+    async with session_factory() as session:
+        result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield _format_rows(rows, fields, export_format)
+
+
+@router.get("/links/{short_code}/stats/export")
+async def export_link_clicks(
+    short_code: str,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    start: Optional[datetime] = Query(None, description="Only clicks at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only clicks before this time"),
+    fields: Optional[str] = Query(
+        None, description=f"Comma-separated subset of: {', '.join(EXPORT_FIELDS)}"
+    ),
+    include_archived: bool = Query(False, description="Include clicks from the click archive"),
+    _admin: str = Depends(verify_token),
+    session: AsyncSession = Depends(get_read_session),
+    session_factory=Depends(get_read_session_factory),
+):
+    """Stream every click of a link as NDJSON or CSV, oldest first. Admin only."""
+    selected = list(EXPORT_FIELDS)
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = set(selected) - set(EXPORT_FIELDS)
+        if unknown or not selected:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown export fields: {', '.join(sorted(unknown)) or '(none given)'}",
+            )
+
+    result = await session.execute(select(Link.id).where(Link.short_code == short_code))
+    link_id = result.scalar_one_or_none()
+    if link_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link not found")
+
+    query = (
+        select(*[getattr(Click, f) for f in selected])
+        .where(Click.link_id == link_id)
+        .order_by(Click.clicked_at, Click.id)
+    )
+    if start is not None:
+        query = query.where(Click.clicked_at >= as_naive_utc(start))
+    if end is not None:
+        query = query.where(Click.clicked_at < as_naive_utc(end))
+
+    archived = None
+    if include_archived:
+        archived = read_archived_clicks(
+            Path(settings.CLICK_ARCHIVE_DIR),
+            link_id,
+            since=as_naive_utc(start) if start else None,
+            until=as_naive_utc(end) if end else None,
+        )
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _stream_clicks(session_factory, query, selected, format, archived),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{short_code}-clicks.{format}"'},
+    )
@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 
-from pydantic import BaseModel, HttpUrl, field_validator
+from pydantic import BaseModel, Field, HttpUrl, field_validator
 
 
 class LoginRequest(BaseModel):
@@ -18,7 +18,7 @@ class LinkCreateRequest(BaseModel):
     url: HttpUrl
     custom_slug: Optional[str] = None
     expires_at: Optional[datetime] = None
-    max_clicks: Optional[int] = None
+    max_clicks: Optional[int] = Field(default=None, ge=1)
 
     @field_validator("custom_slug")
     @classmethod
@@ -38,7 +38,7 @@ class LinkCreateRequest(BaseModel):
 
 class LinkUpdateRequest(BaseModel):
     expires_at: Optional[datetime] = None
-    max_clicks: Optional[int] = None
+    max_clicks: Optional[int] = Field(default=None, ge=1)
 
 
 class LinkResponse(BaseModel):
@@ -48,6 +48,7 @@ class LinkResponse(BaseModel):
     original_url: str
     is_vanity: bool
     is_active: bool
+    deactivated_reason: Optional[str] = None
     expires_at: Optional[datetime]
     max_clicks: Optional[int]
     total_clicks: int
@@ -56,11 +57,34 @@ class LinkResponse(BaseModel):
     updated_at: datetime
 
 
+class BulkLinkResult(BaseModel):
+    index: int
+    status: Literal["created", "error"]
+    short_code: Optional[str] = None
+    short_url: Optional[str] = None
+    qr_code_base64: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkLinkResponse(BaseModel):
+    created: int
+    failed: int
+    results: list[BulkLinkResult]
+
+
+class QRBulkRequest(BaseModel):
+    short_codes: list[str] = Field(min_length=1, max_length=1000)
+    format: Literal["png", "svg"] = "png"
+    box_size: int = Field(10, ge=1, le=50)
+    border: int = Field(4, ge=0, le=20)
+
+
 class LinkListResponse(BaseModel):
     links: list[LinkResponse]
-    total: int
+    total: Optional[int]
     page: int
     per_page: int
+    next_cursor: Optional[str] = None
 
 
 class ClickResponse(BaseModel):
@@ -75,7 +99,15 @@ class StatsResponse(BaseModel):
     original_url: str
     total_clicks: int
     unique_clicks: int
+    unique_clicks_estimated: bool = True
+    unique_clicks_7d: int = 0
+    unique_clicks_30d: int = 0
+    clicks_by_country: dict[str, int] = {}
+    clicks_by_referrer: dict[str, int] = {}
+    clicks_by_day: dict[str, int] = {}
+    clicks_by_hour: dict[str, int] = {}
     clicks: list[ClickResponse]
+    next_cursor: Optional[str] = None
 
 
 class PublicClickResponse(BaseModel):
@@ -90,6 +122,10 @@ class PublicStatsResponse(BaseModel):
     total_clicks: int
     unique_clicks: int
     created_at: datetime
+    clicks_by_country: dict[str, int] = {}
+    clicks_by_referrer: dict[str, int] = {}
+    clicks_by_day: dict[str, int] = {}
+    clicks_by_hour: dict[str, int] = {}
     clicks: list[PublicClickResponse]
 
 
@@ -0,0 +1,125 @@
+"""HTML pages loaded into memory once, with precompressed variants."""
+import gzip
+import hashlib
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.config import settings
+from app.utils import etag_matches
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+STATIC_DIR = Path(__file__).parent / "static"
+
+
+@dataclass
+class StaticPage:
+    """One page and its encoded variants, keyed by content-encoding ("" = identity)."""
+
+    variants: dict[str, bytes]
+    etag: str
+    mtime: float
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(int(self.mtime), usegmt=True)
+
+    @classmethod
+    def load(cls, path: Path) -> "StaticPage":
+        body = path.read_bytes()
+        variants = {"": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, mode=brotli.MODE_TEXT)
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        return cls(variants=variants, etag=digest, mtime=path.stat().st_mtime)
+
+
+def _accepted_encodings(accept_encoding: Optional[str]) -> set[str]:
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        name, _, value = params.partition("=")
+        if name.strip() == "q":
+            try:
+                if float(value) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding.strip():
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticPages:
+    """Serve the pages in a directory from memory.
+
+    ``load_all`` reads and compresses every page at startup; a page missing
+    from memory is loaded on first use. With ``reload`` set, the file's mtime
+    is checked on each request and the page reloaded when it changes, which
+    is meant for development only.
+    """
+
+    def __init__(self, directory: Path, max_age: int, reload: bool = False):
+        self.directory = directory
+        self.max_age = max_age
+        self.reload = reload
+        self._pages: dict[str, StaticPage] = {}
+
+    def load_all(self) -> None:
+        for path in self.directory.glob("*.html"):
+            self._pages[path.name] = StaticPage.load(path)
+
+    def get(self, name: str) -> StaticPage:
+        page = self._pages.get(name)
+        if page is None or (self.reload and (self.directory / name).stat().st_mtime != page.mtime):
+            page = StaticPage.load(self.directory / name)
+            self._pages[name] = page
+        return page
+
+    def response(self, name: str, request: Request) -> Response:
+        page = self.get(name)
+        accepted = _accepted_encodings(request.headers.get("accept-encoding"))
+        encoding = next((e for e in ("br", "gzip") if e in page.variants and e in accepted), "")
+        # Each encoding is a different representation, so it gets its own strong ETag
+        etag = f'"{page.etag}-{encoding}"' if encoding else f'"{page.etag}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": page.last_modified,
+            "Cache-Control": f"public, max-age={self.max_age}",
+            "Vary": "Accept-Encoding",
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if etag_matches(if_none_match, etag) or (
+            if_none_match is None and self._not_modified_since(request, page)
+        ):
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=page.variants[encoding], media_type="text/html", headers=headers)
+
+    @staticmethod
+    def _not_modified_since(request: Request, page: StaticPage) -> bool:
+        value = request.headers.get("if-modified-since")
+        if not value:
+            return False
+        try:
+            since = parsedate_to_datetime(value).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(page.mtime) <= since
+
+    def clear(self) -> None:
+        self._pages.clear()
+
+
+static_pages = StaticPages(STATIC_DIR, settings.STATIC_MAX_AGE_SECONDS, settings.STATIC_RELOAD)
@@ -0,0 +1,61 @@
+"""Base class for the periodic background tasks started from the lifespan."""
+import asyncio
+import logging
+from typing import Optional
+
+
+class BackgroundTask:
+    """Calls ``run_once`` every ``interval`` seconds until stopped.
+
+    Failures are logged to the subclass's module logger and retried on the
+    next round. Sessions come from ``session_factory``, defaulting to the
+    writer pool, or the read pool when ``read_only`` is set.
+    """
+
+    failure_message = "Background task failed"
+    read_only = False
+    # Whether the first round runs on start rather than after one interval
+    run_on_start = True
+
+    def __init__(self, interval: float, session_factory=None):
+        self.interval = interval
+        self._session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from app.database import async_session, read_session
+
+            self._session_factory = read_session if self.read_only else async_session
+        return self._session_factory
+
+    async def run_once(self):
+        raise NotImplementedError
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        logger = logging.getLogger(type(self).__module__)
+        if not self.run_on_start:
+            await asyncio.sleep(self.interval)
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception(self.failure_message)
+            await asyncio.sleep(self.interval)
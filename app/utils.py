@@ -1,21 +1,23 @@
+import fcntl
 import hashlib
 import io
 import base64
-import random
+import json
 import string
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
 
 import qrcode
+from qrcode.image.svg import SvgPathImage
 
 from app.config import settings
 
 BASE62_CHARS = string.ascii_letters + string.digits  # A-Za-z0-9
 
-
-def generate_short_code(length: int = None) -> str:
-    """Generate a random Base62 short code."""
-    if length is None:
-        length = settings.SHORT_CODE_LENGTH
-    return "".join(random.choices(BASE62_CHARS, k=length))
+# Bound parameters per statement, SQLite's default limit since 3.32
+SQLITE_MAX_VARIABLES = 32766
 
 
 def hash_ip(ip: str) -> str:
@@ -23,25 +25,117 @@ def hash_ip(ip: str) -> str:
     return hashlib.sha256(ip.encode()).hexdigest()
 
 
-def generate_qr_code_bytes(url: str) -> bytes:
-    """Generate a QR code PNG as bytes."""
-    qr = qrcode.QRCode(version=1, box_size=10, border=4)
+def insert_chunks(rows: list[dict]) -> Iterator[list[dict]]:
+    """Split rows for multi-row INSERTs so no statement exceeds SQLITE_MAX_VARIABLES."""
+    if not rows:
+        return
+    size = max(1, SQLITE_MAX_VARIABLES // len(rows[0]))
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def render_qr(url: str, fmt: str = "png", box_size: int = 10, border: int = 4) -> bytes:
+    """Render a QR code as PNG or SVG bytes. Pure and picklable, so it can run in a process pool."""
+    image_factory = SvgPathImage if fmt == "svg" else None
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border, image_factory=image_factory)
     qr.add_data(url)
     qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
     buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
+    if fmt == "svg":
+        qr.make_image().save(buf)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(buf, format="PNG")
     return buf.getvalue()
 
 
+def generate_qr_code_bytes(url: str, box_size: int = 10, border: int = 4) -> bytes:
+    """Generate a QR code PNG as bytes."""
+    return render_qr(url, "png", box_size, border)
+
+
 def generate_qr_code_base64(url: str) -> str:
     """Generate a QR code as a base64-encoded PNG string."""
     png_bytes = generate_qr_code_bytes(url)
     return base64.b64encode(png_bytes).decode("utf-8")
 
 
+def link_domain(url: str) -> str:
+    """Host of a URL, lower-cased and without a leading "www.", or "" if it has none."""
+    host = urlsplit(url).hostname or ""
+    return host.removeprefix("www.")
+
+
 def build_short_url(short_code: str) -> str:
     """Build the full short URL from a code."""
     base = settings.BASE_URL.rstrip("/")
     return f"{base}/{short_code}"
+
+
+def encode_cursor(*values) -> str:
+    """Encode keyset pagination values as an opaque URL-safe token."""
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> list:
+    """Decode a token produced by encode_cursor. Raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def as_naive_utc(dt: datetime) -> datetime:
+    """Timestamps are stored as naive UTC, so compare against the same."""
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def decode_keyset_cursor(token: str) -> tuple[datetime, int]:
+    """Decode a (timestamp, id) cursor. Raises ValueError if malformed."""
+    values = decode_cursor(token)
+    try:
+        timestamp, row_id = values
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against a strong ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+class file_lock:
+    """Non-blocking exclusive lock on a file, shared across processes.
+
+    ``acquired`` is False if another process holds it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.acquired = False
+
+    def __enter__(self) -> "file_lock":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "w")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.acquired = True
+        except BlockingIOError:
+            self.acquired = False
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.acquired:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
@@ -0,0 +1,122 @@
+"""Unique visitor estimation backed by per-link HyperLogLog sketches."""
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.hll import HyperLogLog
+from app.models import Click, VisitorSketch
+from app.utils import insert_chunks
+
+ALL_TIME = "all"
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def _day_bucket(dt: datetime) -> str:
+    dt = dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%d")
+
+
+def _build_sketches(clicks: Iterable) -> dict[tuple[int, str], HyperLogLog]:
+    sketches: dict[tuple[int, str], HyperLogLog] = defaultdict(HyperLogLog)
+    for click in clicks:
+        sketches[(click.link_id, ALL_TIME)].add(click.ip_hash)
+        sketches[(click.link_id, _day_bucket(click.clicked_at))].add(click.ip_hash)
+    return sketches
+
+
+async def _merge_into_db(
+    session: AsyncSession,
+    sketches: dict[tuple[int, str], HyperLogLog],
+    merge_existing: bool = True,
+) -> None:
+    if not sketches:
+        return
+    if merge_existing:
+        await _merge_existing(session, sketches)
+
+    rows = [
+        {"link_id": link_id, "bucket": bucket, "registers": sketch.to_bytes()}
+        for (link_id, bucket), sketch in sketches.items()
+    ]
+    for chunk in insert_chunks(rows):
+        stmt = insert(VisitorSketch).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["link_id", "bucket"],
+            set_={"registers": stmt.excluded.registers},
+        )
+        await session.execute(stmt)
+
+
+async def _merge_existing(session: AsyncSession, sketches: dict[tuple[int, str], HyperLogLog]) -> None:
+    """Fold the stored registers into the in-memory sketches."""
+    link_ids = {link_id for link_id, _ in sketches}
+    buckets = {bucket for _, bucket in sketches}
+    result = await session.execute(
+        select(VisitorSketch.link_id, VisitorSketch.bucket, VisitorSketch.registers)
+        .where(VisitorSketch.link_id.in_(link_ids))
+        .where(VisitorSketch.bucket.in_(buckets))
+    )
+    for link_id, bucket, registers in result.all():
+        if (link_id, bucket) in sketches:
+            sketches[(link_id, bucket)].merge(HyperLogLog(registers))
+
+
+async def apply_visitor_sketches(session: AsyncSession, clicks: Iterable) -> None:
+    """Add the clicks' ip hashes to the lifetime and daily sketches. The caller commits."""
+    await _merge_into_db(session, _build_sketches(clicks))
+
+
+async def estimate_unique(
+    session: AsyncSession,
+    link_id: int,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+) -> int:
+    """Estimate unique visitors, over the link's lifetime or a day window (inclusive)."""
+    query = select(VisitorSketch.registers).where(VisitorSketch.link_id == link_id)
+    if since is None and until is None:
+        query = query.where(VisitorSketch.bucket == ALL_TIME)
+    else:
+        query = query.where(VisitorSketch.bucket != ALL_TIME)
+        if since is not None:
+            query = query.where(VisitorSketch.bucket >= since.isoformat())
+        if until is not None:
+            query = query.where(VisitorSketch.bucket <= until.isoformat())
+
+    sketch = HyperLogLog()
+    for (registers,) in (await session.execute(query)).all():
+        sketch.merge(HyperLogLog(registers))
+    return sketch.count()
+
+
+async def exact_unique(session: AsyncSession, link_id: int) -> int:
+    """Count distinct ip hashes in the raw clicks table."""
+    result = await session.execute(
+        select(func.count(func.distinct(Click.ip_hash))).where(Click.link_id == link_id)
+    )
+    return result.scalar_one()
+
+
+async def backfill_visitor_sketches(session: AsyncSession, archived: Iterable[list] = ()) -> int:
+    """Rebuild all sketches from the raw clicks table plus any ``archived``
+    click batches. Returns clicks processed."""
+    await session.execute(delete(VisitorSketch))
+    sketches: dict[tuple[int, str], HyperLogLog] = defaultdict(HyperLogLog)
+    processed = 0
+    for partition in archived:
+        for key, sketch in _build_sketches(partition).items():
+            sketches[key].merge(sketch)
+        processed += len(partition)
+    result = await session.stream(select(Click).execution_options(yield_per=BACKFILL_BATCH_SIZE))
+    async for partition in result.scalars().partitions():
+        for key, sketch in _build_sketches(partition).items():
+            sketches[key].merge(sketch)
+        processed += len(partition)
+    await _merge_into_db(session, sketches, merge_existing=False)
+    await session.commit()
+    return processed
@@ -0,0 +1,321 @@
+"""End-to-end load benchmark.
+
+Seeds a fresh SQLite database, boots ``app.main:app`` under uvicorn
+against it, drives a weighted mix of requests from concurrent clients and
+writes requests/sec and p50/p95/p99 latency per operation to a JSON file::
+
+    python -m benchmarks.run --requests 20000 --concurrency 64 \\
+        --mix redirect=80,create=5,stats=10,qr=5 --output bench.json
+
+Pass ``--baseline`` with an earlier output file to print the change against
+it; ``--max-regression`` makes the run fail when throughput drops or p99
+latency rises by more than that percentage.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+OPERATIONS = ("redirect", "create", "stats", "qr")
+DEFAULT_MIX = "redirect=80,create=5,stats=10,qr=5"
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    """Parse "redirect=80,create=5" into operation weights."""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}', expected one of {OPERATIONS}")
+        mix[name] = int(weight)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("The mix needs at least one positive weight")
+    return mix
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    """Throughput and latency percentiles (in milliseconds) for one operation."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+    }
+
+
+def compare(results: dict, baseline: dict) -> dict[str, dict[str, float]]:
+    """Percentage change in rps and p99 per operation present in both runs."""
+    changes = {}
+    for name, current in results["operations"].items():
+        previous = baseline.get("operations", {}).get(name)
+        if not previous:
+            continue
+        changes[name] = {
+            metric: round((current[metric] - previous[metric]) / previous[metric] * 100, 1)
+            for metric in ("rps", "p99_ms")
+            if previous[metric]
+        }
+    return changes
+
+
+def regressions(changes: dict[str, dict[str, float]], max_regression: float) -> list[str]:
+    found = []
+    for name, change in changes.items():
+        if change.get("rps", 0) < -max_regression:
+            found.append(f"{name}: rps {change['rps']}%")
+        if change.get("p99_ms", 0) > max_regression:
+            found.append(f"{name}: p99 +{change['p99_ms']}%")
+    return found
+
+
+async def seed(links: int, clicks_per_link: int) -> list[str]:
+    """Create links and clicks in the database named by DATABASE_URL. Returns the codes."""
+    from app.allocator import short_code_allocator
+    from app.clicks import ClickEvent, write_clicks
+    from app.database import async_session, engine, init_db
+    from app.models import Link
+    from sqlalchemy import insert
+
+    await init_db()
+    rng = random.Random(0)
+    codes = await short_code_allocator.allocate_many(engine, links)
+    now = datetime.now(timezone.utc)
+    async with async_session() as session:
+        for start in range(0, links, 500):
+            rows = [
+                Link(short_code=code, original_url=f"https://example.com/{code}").model_dump(exclude={"id"})
+                for code in codes[start:start + 500]
+            ]
+            await session.execute(insert(Link), rows)
+        await session.commit()
+
+        events = [
+            ClickEvent(
+                link_id=link_id,
+                ip_hash=f"{rng.getrandbits(256):064x}",
+                referrer=rng.choice([None, "https://news.example.org/", "https://social.example.com/"]),
+                country=rng.choice(["US", "DE", "SI", "unknown"]),
+                clicked_at=now - timedelta(minutes=rng.randrange(60 * 24 * 30)),
+            )
+            for link_id in range(1, links + 1)
+            for _ in range(clicks_per_link)
+        ]
+        for start in range(0, len(events), 5000):
+            await write_clicks(session, events[start:start + 5000])
+            await session.commit()
+    await engine.dispose()
+    return codes
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env: dict, port: int, workers: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+        ],
+        env=env,
+    )
+
+
+async def wait_until_healthy(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become healthy within {timeout}s")
+
+
+async def drive(
+    base_url: str,
+    codes: list[str],
+    mix: dict[str, int],
+    total: int,
+    concurrency: int,
+    warmup: int,
+    seed_value: int,
+) -> dict:
+    """Send ``total`` requests from ``concurrency`` clients and summarize them."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    rng = random.Random(seed_value)
+    plan = rng.choices(names, weights=weights, k=warmup + total)
+    targets = [rng.choice(codes) for _ in plan]
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    next_index = 0
+
+    def request(client: httpx.AsyncClient, name: str, code: str):
+        if name == "redirect":
+            return client.get(f"/{code}")
+        if name == "create":
+            return client.post("/links", json={"url": f"https://example.com/new/{code}"})
+        if name == "stats":
+            return client.get(f"/links/{code}/stats/public")
+        return client.get(f"/{code}/qr")
+
+    async def worker(client: httpx.AsyncClient, record: bool, stop: int) -> None:
+        nonlocal next_index
+        while next_index < stop:
+            index = next_index
+            next_index += 1
+            name = plan[index]
+            started = time.perf_counter()
+            try:
+                response = await request(client, name, targets[index])
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - started
+            if record:
+                latencies[name].append(elapsed)
+                if not ok:
+                    errors[name] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        if warmup:
+            await asyncio.gather(*(worker(client, False, warmup) for _ in range(concurrency)))
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, True, warmup + total) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    operations = {name: summarize(latencies[name], errors[name], elapsed) for name in names if latencies[name]}
+    every = [value for values in latencies.values() for value in values]
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "total": summarize(every, sum(errors.values()), elapsed),
+        "operations": operations,
+    }
+
+
+def print_report(results: dict, changes: Optional[dict]) -> None:
+    header = f"{'operation':<10} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    rows = list(results["operations"].items()) + [("total", results["total"])]
+    for name, row in rows:
+        line = (
+            f"{name:<10} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9} "
+            f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}"
+        )
+        if changes and name in changes:
+            change = changes[name]
+            line += f"   rps {change.get('rps', 0):+}%  p99 {change.get('p99_ms', 0):+}%"
+        print(line)
+
+
+async def _run(args: argparse.Namespace) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite+aiosqlite:///{Path(tmp) / 'bench.sqlite3'}",
+            "QR_CACHE_DIR": str(Path(tmp) / "qr_cache"),
+            "LINK_INDEX_PATH": str(Path(tmp) / "link_index.bin"),
+            "RATE_LIMIT_REQUESTS": str(10 ** 9),
+            "RATE_LIMIT_SQLITE_PATH": str(Path(tmp) / "rate_limits.sqlite3"),
+        }
+        # Seed through the app's own models, against the same database the server uses
+        os.environ.update(env)
+        print(f"Seeding {args.links} links with {args.clicks_per_link} clicks each...")
+        codes = await seed(args.links, args.clicks_per_link)
+
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(env, port, args.workers)
+        try:
+            await wait_until_healthy(base_url)
+            print(f"Driving {args.requests} requests with concurrency {args.concurrency}...")
+            results = await drive(
+                base_url, codes, args.mix, args.requests, args.concurrency, args.warmup, args.seed
+            )
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    results["config"] = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "mix": args.mix,
+        "links": args.links,
+        "clicks_per_link": args.clicks_per_link,
+        "workers": args.workers,
+        "seed": args.seed,
+    }
+    results["environment"] = {"python": platform.python_version(), "platform": platform.platform()}
+    results["started_at"] = datetime.now(timezone.utc).isoformat()
+
+    changes = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        changes = compare(results, baseline)
+        results["baseline_change_pct"] = changes
+
+    Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+    print_report(results, changes)
+    print(f"Results written to {args.output}")
+
+    if changes and args.max_regression is not None:
+        found = regressions(changes, args.max_regression)
+        if found:
+            print("Regressions over the threshold: " + "; ".join(found), file=sys.stderr)
+            return 1
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10000, help="measured requests")
+    parser.add_argument("--warmup", type=int, default=500, help="unmeasured requests sent first")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"default {DEFAULT_MIX}")
+    parser.add_argument("--links", type=int, default=1000, help="links to seed")
+    parser.add_argument("--clicks-per-link", type=int, default=20, help="clicks to seed per link")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the request plan")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", help="earlier output file to compare against")
+    parser.add_argument("--max-regression", type=float, help="fail if rps or p99 regress by more than this %%")
+    return asyncio.run(_run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
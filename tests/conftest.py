@@ -5,16 +5,26 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel
 
-from app.auth import create_access_token
+from app.allocator import short_code_allocator
+from app.auth import create_access_token, token_cache
+from app.bloom import short_code_filter
+from app.cache import link_cache
 from app.config import settings
-from app.database import get_session
+from app.database import get_read_session, get_read_session_factory, get_session
+from app.link_index import link_index
 from app.main import app
+from app.profiling import instrument_engine
+from app.qr_cache import qr_cache
 from app.rate_limit import reset_rate_limits
 
 # Use in-memory SQLite for tests
 TEST_DATABASE_URL = "sqlite+aiosqlite://"
 
+# Keep rendered QR codes in memory only
+qr_cache.directory = None
+
 engine = create_async_engine(TEST_DATABASE_URL, echo=False)
+instrument_engine(engine, "test")
 test_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -27,6 +37,12 @@ async def setup_db():
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.drop_all)
     reset_rate_limits()
+    link_cache.clear()
+    link_index.reset()
+    qr_cache.clear()
+    short_code_allocator.reset()
+    short_code_filter.reset()
+    token_cache.clear()
 
 
 async def override_get_session():
@@ -35,6 +51,16 @@ async def override_get_session():
 
 
 app.dependency_overrides[get_session] = override_get_session
+app.dependency_overrides[get_read_session] = override_get_session
+app.dependency_overrides[get_read_session_factory] = lambda: test_session
+# Used directly by the redirect fast path, which runs before dependency injection
+app.state.read_session_factory = test_session
+
+
+@pytest.fixture
+def session_factory():
+    """Session factory bound to the test database."""
+    return test_session
 
 
 @pytest_asyncio.fixture
@@ -0,0 +1,64 @@
+import pytest
+
+from app.allocator import CodePermutation, ShortCodeAllocator, short_code_allocator
+from app.config import Settings, default_secrets
+
+
+def test_permutation_is_bijective():
+    permutation = CodePermutation(length=2, secret="test")
+    codes = {permutation.encode(n) for n in range(62 ** 2)}
+    assert len(codes) == 62 ** 2
+
+
+def test_permutation_round_trip():
+    permutation = CodePermutation(length=8, secret="test")
+    for n in (0, 1, 2, 12345, 62 ** 8 - 1):
+        code = permutation.encode(n)
+        assert len(code) == 8
+        assert code.isalnum()
+        assert permutation.decode(code) == n
+
+
+def test_permutation_depends_on_secret():
+    assert CodePermutation(8, "a").encode(1) != CodePermutation(8, "b").encode(1)
+
+
+@pytest.mark.asyncio
+async def test_allocators_reserve_disjoint_blocks(session_factory):
+    async with session_factory() as session:
+        engine = session.bind
+    worker_a = ShortCodeAllocator(block_size=3, length=8, secret="test")
+    worker_b = ShortCodeAllocator(block_size=3, length=8, secret="test")
+
+    codes = []
+    for _ in range(5):
+        codes.append(await worker_a.allocate(engine))
+        codes.append(await worker_b.allocate(engine))
+
+    assert len(set(codes)) == 10
+    ids = sorted(worker_a.permutation.decode(code) for code in codes)
+    # Four blocks of three were reserved, two of them partly used
+    assert ids[-1] < 12
+
+
+@pytest.mark.asyncio
+async def test_create_link_skips_code_taken_by_vanity_slug(client):
+    next_code = short_code_allocator.permutation.encode(0)
+    vanity = await client.post(
+        "/links", json={"url": "https://example.com", "custom_slug": next_code}
+    )
+    assert vanity.status_code == 201
+
+    response = await client.post("/links", json={"url": "https://other.com"})
+    assert response.status_code == 201
+    assert response.json()["short_code"] != next_code
+
+
+def test_default_secrets_are_reported():
+    public = Settings.model_fields["SHORT_CODE_SECRET"].default
+    assert default_secrets(Settings(
+        _env_file=None, ADMIN_PASSWORD="a", JWT_SECRET=public, SHORT_CODE_SECRET=public
+    )) == ["JWT_SECRET", "SHORT_CODE_SECRET"]
+    assert default_secrets(Settings(
+        _env_file=None, ADMIN_PASSWORD="a", JWT_SECRET="b", SHORT_CODE_SECRET="c"
+    )) == []
@@ -1,5 +1,9 @@
+import time
+
 import pytest
 
+from app import auth
+from app.auth import TokenCache, create_access_token, decode_token, token_cache
 from app.config import settings
 
 
@@ -43,3 +47,37 @@ async def test_protected_route_no_token(client):
 async def test_protected_route_invalid_token(client):
     response = await client.get("/links", headers={"Authorization": "Bearer invalid"})
     assert response.status_code == 401
+
+
+def test_token_cache_skips_verification_on_repeat(monkeypatch):
+    token = create_access_token("admin")
+    assert decode_token(token) == "admin"
+    calls = []
+    monkeypatch.setattr(auth.jwt, "decode", lambda *a, **kw: calls.append(a))
+    assert decode_token(token) == "admin"
+    assert calls == []
+    assert token_cache.stats()["hit_ratio"] == 0.5
+
+
+def test_token_cache_honours_expiry():
+    cache = TokenCache(max_size=10)
+    cache.set("token", "admin", time.time() - 1)
+    assert cache.get("token") is None
+    cache.set("token", "admin", time.time() + 60)
+    assert cache.get("token") == "admin"
+
+
+def test_token_cache_cleared_when_secret_changes(monkeypatch):
+    token = create_access_token("admin")
+    assert decode_token(token) == "admin"
+    monkeypatch.setattr(settings, "JWT_SECRET", "rotated-secret")
+    assert decode_token(token) is None
+    assert token_cache.stats()["size"] == 0
+
+
+def test_token_cache_is_bounded():
+    cache = TokenCache(max_size=2)
+    for name in ("a", "b", "c"):
+        cache.set(name, name, time.time() + 60)
+    assert cache.get("a") is None
+    assert cache.get("c") == "c"
@@ -0,0 +1,31 @@
+import argparse
+
+import pytest
+
+from benchmarks.run import compare, parse_mix, percentile, regressions, summarize
+
+
+def test_parse_mix():
+    assert parse_mix("redirect=80, qr=20") == {"redirect": 80, "qr": 20}
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_mix("delete=1")
+
+
+def test_percentiles_use_nearest_rank():
+    values = [i / 1000 for i in range(1, 101)]
+    summary = summarize(values, errors=0, elapsed=2.0)
+    assert summary["rps"] == 50.0
+    assert (summary["p50_ms"], summary["p95_ms"], summary["p99_ms"]) == (50.0, 95.0, 99.0)
+    assert percentile([], 99) == 0.0
+
+
+def test_compare_against_baseline_flags_regressions():
+    baseline = {"operations": {"redirect": {"rps": 1000.0, "p99_ms": 10.0}}}
+    results = {"operations": {
+        "redirect": {"rps": 800.0, "p99_ms": 10.5},
+        "qr": {"rps": 10.0, "p99_ms": 50.0},
+    }}
+    changes = compare(results, baseline)
+    assert changes == {"redirect": {"rps": -20.0, "p99_ms": 5.0}}
+    assert regressions(changes, max_regression=10) == ["redirect: rps -20.0%"]
+    assert regressions(changes, max_regression=25) == []
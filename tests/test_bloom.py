@@ -0,0 +1,107 @@
+import pytest
+from sqlalchemy import event
+
+from app.bloom import BloomFilter, ShortCodeFilter, short_code_filter
+from app.models import Link
+from tests.conftest import engine
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, fp_rate=0.01)
+    codes = [f"code{i}" for i in range(1000)]
+    for code in codes:
+        bloom.add(code)
+    assert all(code in bloom for code in codes)
+
+
+def test_bloom_filter_false_positive_rate_near_target():
+    bloom = BloomFilter(capacity=2000, fp_rate=0.01)
+    for i in range(2000):
+        bloom.add(f"present{i}")
+    false_positives = sum(f"absent{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+    assert 0.005 < bloom.estimated_fp_rate() < 0.02
+
+
+@pytest.mark.asyncio
+async def test_short_code_filter_build_and_refresh(session_factory):
+    codes = ShortCodeFilter(capacity=100, fp_rate=0.01, refresh_interval=3600, session_factory=session_factory)
+    assert codes.might_exist("anything")  # not built yet
+
+    async with session_factory() as session:
+        session.add(Link(short_code="known", original_url="https://example.com"))
+        await session.commit()
+        await codes.build(session)
+    assert codes.ready
+    assert codes.might_exist("known")
+    assert not codes.might_exist("unknown1")
+
+    # Created by another worker: picked up by the next refresh
+    async with session_factory() as session:
+        session.add(Link(short_code="elsewhere", original_url="https://example.com"))
+        await session.commit()
+    assert not codes.might_exist("elsewhere")
+    await codes.run_once()
+    assert codes.might_exist("elsewhere")
+    assert codes.stats()["rejected"] == 2
+
+
+@pytest.mark.asyncio
+async def test_short_code_filter_counts_each_code_once(session_factory):
+    codes = ShortCodeFilter(capacity=100, fp_rate=0.01, refresh_interval=3600, session_factory=session_factory)
+    async with session_factory() as session:
+        await codes.build(session)
+        for code in ("one", "two"):
+            session.add(Link(short_code=code, original_url="https://example.com"))
+            await session.commit()
+            # Created in this process, then loaded again by the refresh
+            codes.add(code)
+    await codes.run_once()
+    await codes.run_once()
+    assert codes.stats()["items"] == 2
+
+
+@pytest.mark.asyncio
+async def test_short_code_filter_rebuilds_in_background(session_factory):
+    codes = ShortCodeFilter(capacity=3, fp_rate=0.01, refresh_interval=3600, session_factory=session_factory)
+    async with session_factory() as session:
+        await codes.build(session)
+        session.add_all(Link(short_code=f"code{i}", original_url="https://example.com") for i in range(5))
+        await session.commit()
+        await codes.refresh(session)
+    assert codes.stats()["items"] == 5 and codes.over_capacity
+    assert codes.stats()["rebuilds"] == 0
+
+    await codes.run_once()
+    assert codes.stats()["rebuilds"] == 1
+    assert codes.stats()["capacity"] == 10 and not codes.over_capacity
+    for i in range(5):
+        assert codes.might_exist(f"code{i}")
+
+
+@pytest.mark.asyncio
+async def test_redirect_rejects_unknown_code_without_a_query(client, session_factory):
+    response = await client.post("/links", json={"url": "https://example.com"})
+    code = response.json()["short_code"]
+    async with session_factory() as session:
+        await short_code_filter.build(session)
+
+    queries = []
+
+    def listener(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        assert (await client.get("/doesnotexist", follow_redirects=False)).status_code == 404
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+    assert queries == []
+    assert short_code_filter.stats()["rejected"] == 1
+
+    # Links created in this process are added straight away
+    created = await client.post("/links", json={"url": "https://example.org"})
+    new_code = created.json()["short_code"]
+    for path in (code, new_code):
+        assert (await client.get(f"/{path}", follow_redirects=False)).status_code == 302
+    assert short_code_filter.stats()["rejected"] == 1
@@ -0,0 +1,52 @@
+import time
+
+from app.cache import CachedLink, LinkCache
+
+
+def _link(code: str) -> CachedLink:
+    return CachedLink(
+        id=1,
+        short_code=code,
+        original_url="https://example.com/",
+        is_active=True,
+        expires_at=None,
+        max_clicks=None,
+        total_clicks=0,
+    )
+
+
+def test_cache_hit_and_miss():
+    cache = LinkCache(max_size=10, ttl_seconds=60)
+    assert cache.get("abc") is None
+    cache.set(_link("abc"))
+    assert cache.get("abc").short_code == "abc"
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = LinkCache(max_size=2, ttl_seconds=60)
+    cache.set(_link("a"))
+    cache.set(_link("b"))
+    cache.get("a")  # "b" is now least recently used
+    cache.set(_link("c"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_ttl_expiry(monkeypatch):
+    cache = LinkCache(max_size=10, ttl_seconds=5)
+    cache.set(_link("abc"))
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert cache.get("abc") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_invalidate():
+    cache = LinkCache(max_size=10, ttl_seconds=60)
+    cache.set(_link("abc"))
+    cache.invalidate("abc")
+    assert cache.get("abc") is None
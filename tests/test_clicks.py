@@ -0,0 +1,200 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+
+from app.clicks import ClickBuffer, ClickEvent, claim_click, write_clicks
+from app.models import Click, Link
+from app.utils import hash_ip
+
+
+async def _create_link(session_factory) -> int:
+    async with session_factory() as session:
+        link = Link(short_code="buffered", original_url="https://example.com/")
+        session.add(link)
+        await session.commit()
+        return link.id
+
+
+def _event(link_id: int) -> ClickEvent:
+    return ClickEvent(link_id=link_id, ip_hash=hash_ip("127.0.0.1"), referrer=None, country="unknown")
+
+
+async def _counts(session_factory, link_id: int) -> tuple[int, int]:
+    async with session_factory() as session:
+        clicks = (await session.execute(
+            select(func.count(Click.id)).where(Click.link_id == link_id)
+        )).scalar_one()
+        link = await session.get(Link, link_id)
+        return clicks, link.total_clicks
+
+
+@pytest.mark.asyncio
+async def test_click_buffer_flush_writes_batch(session_factory):
+    link_id = await _create_link(session_factory)
+    buffer = ClickBuffer(session_factory=session_factory, flush_size=100)
+
+    for _ in range(3):
+        assert await buffer.add(_event(link_id))
+    assert buffer.pending == 3
+    assert await _counts(session_factory, link_id) == (0, 0)
+
+    await buffer.flush()
+    assert buffer.pending == 0
+    assert await _counts(session_factory, link_id) == (3, 3)
+
+
+@pytest.mark.asyncio
+async def test_click_buffer_stop_drains(session_factory):
+    link_id = await _create_link(session_factory)
+    buffer = ClickBuffer(session_factory=session_factory, flush_interval=60)
+    buffer.start()
+    await buffer.add(_event(link_id))
+    await buffer.add(_event(link_id))
+    await buffer.stop()
+
+    assert not buffer.running
+    assert await _counts(session_factory, link_id) == (2, 2)
+
+
+@pytest.mark.asyncio
+async def test_click_buffer_stop_waits_for_batch_in_flight(session_factory, monkeypatch):
+    from app import clicks
+
+    link_id = await _create_link(session_factory)
+    writing, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_write(session, events):
+        writing.set()
+        await release.wait()
+        await write_clicks(session, events)
+
+    monkeypatch.setattr(clicks, "write_clicks", slow_write)
+    buffer = ClickBuffer(session_factory=session_factory, flush_size=2, flush_interval=60)
+    buffer.start()
+    await buffer.add(_event(link_id))
+    await buffer.add(_event(link_id))
+    await writing.wait()
+    # Queued while the first batch is being written
+    await buffer.add(_event(link_id))
+
+    stopping = asyncio.create_task(buffer.stop())
+    await asyncio.sleep(0)
+    assert not stopping.done()
+    release.set()
+    await stopping
+
+    assert buffer.pending == 0
+    assert buffer.stats()["dropped"] == 0
+    assert await _counts(session_factory, link_id) == (3, 3)
+
+
+@pytest.mark.asyncio
+async def test_click_buffer_counts_requeue_overflow_as_dropped(session_factory, monkeypatch):
+    from app import clicks
+
+    link_id = await _create_link(session_factory)
+    writing, release = asyncio.Event(), asyncio.Event()
+
+    async def failing_write(session, events):
+        writing.set()
+        await release.wait()
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(clicks, "write_clicks", failing_write)
+    buffer = ClickBuffer(session_factory=session_factory, max_size=3, overflow="drop")
+    for _ in range(3):
+        await buffer.add(_event(link_id))
+    flushing = asyncio.create_task(buffer.flush())
+    await writing.wait()
+    # Accepted while the buffer is empty, but there is no room to requeue them all
+    for _ in range(2):
+        assert await buffer.add(_event(link_id))
+    release.set()
+
+    assert not await flushing
+    assert buffer.pending == 3
+    assert buffer.stats()["dropped"] == 2
+
+
+@pytest.mark.asyncio
+async def test_click_buffer_drop_policy(session_factory):
+    link_id = await _create_link(session_factory)
+    buffer = ClickBuffer(session_factory=session_factory, max_size=2, overflow="drop")
+
+    assert await buffer.add(_event(link_id))
+    assert await buffer.add(_event(link_id))
+    assert not await buffer.add(_event(link_id))
+    assert buffer.stats()["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_click_buffer_block_policy_flushes(session_factory):
+    link_id = await _create_link(session_factory)
+    buffer = ClickBuffer(session_factory=session_factory, max_size=2, overflow="block")
+
+    for _ in range(3):
+        assert await buffer.add(_event(link_id))
+    assert buffer.pending == 1
+    assert await _counts(session_factory, link_id) == (2, 2)
+
+
+@pytest.mark.asyncio
+async def test_redirect_uses_running_buffer(client, session_factory, monkeypatch):
+    from app.routes import redirect
+
+    buffer = ClickBuffer(session_factory=session_factory, flush_interval=60)
+    monkeypatch.setattr(redirect, "click_buffer", buffer)
+    buffer.start()
+
+    create_resp = await client.post("/links", json={"url": "https://example.com"})
+    code = create_resp.json()["short_code"]
+    response = await client.get(f"/{code}", follow_redirects=False)
+    assert response.status_code == 302
+    assert buffer.pending == 1
+
+    await buffer.stop()
+    link_id = create_resp.json()["id"]
+    assert await _counts(session_factory, link_id) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_claims_never_exceed_max_clicks(tmp_path):
+    # Separate connections to a file database, so claims really race
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/claims.db", connect_args={"timeout": 30})
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with factory() as session:
+            session.add(Link(short_code="limited", original_url="https://example.com/", max_clicks=5))
+            await session.commit()
+
+        async def claim():
+            async with factory() as session:
+                claimed = await claim_click(session, "limited")
+                await session.commit()
+                return claimed
+
+        results = await asyncio.gather(*(claim() for _ in range(40)))
+        claimed = [r for r in results if r is not None]
+        assert sorted(r[2] for r in claimed) == [1, 2, 3, 4, 5]
+        async with factory() as session:
+            assert (await session.execute(select(Link.total_clicks))).scalar_one() == 5
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_claimed_clicks_are_counted_once(session_factory):
+    link_id = await _create_link(session_factory)
+    async with session_factory() as session:
+        assert await claim_click(session, "buffered") == (link_id, "https://example.com/", 1)
+        event = _event(link_id)
+        event.counted = True
+        await write_clicks(session, [event])
+        await session.commit()
+    assert await _counts(session_factory, link_id) == (1, 1)
@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import database
+from app.config import settings
+
+
+@pytest.mark.asyncio
+async def test_tuned_sqlite_engines(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path}/tuned.db")
+    monkeypatch.setattr(settings, "SQLITE_TUNING", True)
+    writer, reader = database._create_engines()
+    try:
+        async with writer.begin() as conn:
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1  # NORMAL
+            await conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            await conn.execute(text("INSERT INTO t VALUES (1)"))
+
+        async with reader.connect() as conn:
+            assert (await conn.execute(text("SELECT x FROM t"))).scalar() == 1
+            with pytest.raises(OperationalError):
+                await conn.execute(text("INSERT INTO t VALUES (2)"))
+    finally:
+        await writer.dispose()
+        await reader.dispose()
+
+
+def test_untuned_engines_are_shared(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_URL", "sqlite+aiosqlite://")
+    writer, reader = database._create_engines()
+    assert writer is reader
+
+
+@pytest.mark.asyncio
+async def test_init_db_adds_new_columns(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/old.db")
+    monkeypatch.setattr(database, "engine", engine)
+    try:
+        # A database created before deactivated_reason and the expiry index existed
+        await database.init_db()
+        async with engine.begin() as conn:
+            await conn.execute(text("DROP INDEX ix_links_expires_at"))
+            await conn.execute(text("ALTER TABLE links DROP COLUMN deactivated_reason"))
+        await database.init_db()
+        async with engine.connect() as conn:
+            columns = await conn.run_sync(lambda c: {col["name"] for col in inspect(c).get_columns("links")})
+            indexes = await conn.run_sync(lambda c: {ix["name"] for ix in inspect(c).get_indexes("links")})
+        assert "deactivated_reason" in columns
+        assert "ix_links_expires_at" in indexes
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_init_db_builds_link_search(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/old.db")
+    monkeypatch.setattr(database, "engine", engine)
+    try:
+        # A database with links from before the search index and Link.domain
+        await database.init_db()
+        async with engine.begin() as conn:
+            for name in ("links_fts_insert", "links_fts_update", "links_fts_delete"):
+                await conn.execute(text(f"DROP TRIGGER {name}"))
+            await conn.execute(text("DROP TABLE links_fts"))
+            await conn.execute(text("DROP INDEX ix_links_domain_created_at_id"))
+            await conn.execute(text("ALTER TABLE links DROP COLUMN domain"))
+            await conn.execute(text(
+                "INSERT INTO links (short_code, original_url, is_vanity, is_active, total_clicks,"
+                " created_at, updated_at) VALUES ('old', 'https://www.example.com/page', 0, 1, 0,"
+                " '2024-01-01 00:00:00', '2024-01-01 00:00:00')"
+            ))
+        await database.init_db()
+        async with engine.connect() as conn:
+            found = await conn.execute(text("SELECT rowid FROM links_fts WHERE links_fts MATCH '\"page\"'"))
+            assert found.scalar() == 1
+            assert (await conn.execute(text("SELECT domain FROM links"))).scalar() == "example.com"
+    finally:
+        await engine.dispose()
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+
+from app.cache import link_cache
+from app.expiry import ExpirySweeper, sweep_expired
+from app.models import Link
+
+
+async def _create(client, **fields) -> str:
+    response = await client.post("/links", json={"url": "https://example.com", **fields})
+    return response.json()["short_code"]
+
+
+@pytest.mark.asyncio
+async def test_sweep_deactivates_expired_and_exhausted_links(client, auth_headers, session_factory):
+    soon = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+    expired = await _create(client, expires_at="2020-01-01T00:00:00Z")
+    exhausted = await _create(client, max_clicks=1)
+    live = await _create(client, expires_at=soon, max_clicks=5)
+    assert (await client.get(f"/{exhausted}", follow_redirects=False)).status_code == 302
+    await client.get(f"/{live}", follow_redirects=False)
+
+    async with session_factory() as session:
+        assert await sweep_expired(session, batch_size=1) == {"expired": 1, "click_limit": 1}
+        # A second sweep finds nothing left to do
+        assert await sweep_expired(session) == {"expired": 0, "click_limit": 0}
+
+    for code, reason in ((expired, "expired"), (exhausted, "click_limit"), (live, None)):
+        data = (await client.get(f"/links/{code}", headers=auth_headers)).json()
+        assert data["is_active"] is (reason is None)
+        assert data["deactivated_reason"] == reason
+
+    response = await client.get(f"/{exhausted}", follow_redirects=False)
+    assert response.status_code == 410
+    assert response.json()["detail"] == "This link has reached its click limit"
+
+
+@pytest.mark.asyncio
+async def test_sweep_drops_cached_links(client, session_factory):
+    code = await _create(client)
+    assert (await client.get(f"/{code}", follow_redirects=False)).status_code == 302
+    assert link_cache.get(code) is not None
+
+    async with session_factory() as session:
+        await session.execute(update(Link).values(expires_at=datetime(2020, 1, 1)))
+        await session.commit()
+        await sweep_expired(session)
+    assert link_cache.get(code) is None
+
+
+@pytest.mark.asyncio
+async def test_new_limits_revive_swept_link(client, auth_headers, session_factory):
+    code = await _create(client, expires_at="2020-01-01T00:00:00Z")
+    async with session_factory() as session:
+        await sweep_expired(session)
+
+    later = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+    data = (await client.patch(f"/links/{code}", json={"expires_at": later}, headers=auth_headers)).json()
+    assert data["is_active"] is True
+    assert data["deactivated_reason"] is None
+    assert (await client.get(f"/{code}", follow_redirects=False)).status_code == 302
+
+    # Deleted links stay deleted
+    await client.delete(f"/links/{code}", headers=auth_headers)
+    data = (await client.patch(f"/links/{code}", json={"max_clicks": 10}, headers=auth_headers)).json()
+    assert data["is_active"] is False
+    assert data["deactivated_reason"] == "deleted"
+
+
+@pytest.mark.asyncio
+async def test_sweeper_stats(client, session_factory):
+    await _create(client, expires_at="2020-01-01T00:00:00Z")
+    sweeper = ExpirySweeper(interval=60, batch_size=100, session_factory=session_factory)
+    assert await sweeper.run_once() == {"expired": 1, "click_limit": 0}
+    stats = sweeper.stats()
+    assert stats["deactivated"] == {"expired": 1, "click_limit": 0}
+    assert stats["running"] is False
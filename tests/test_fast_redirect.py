@@ -0,0 +1,71 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from app import fast_redirect
+from app.cache import link_cache
+from app.clicks import ClickBuffer
+from app.config import settings
+from app.metrics import db_queries_per_request
+from app.models import Click
+
+
+@pytest_asyncio.fixture
+async def buffer(session_factory, monkeypatch):
+    buffer = ClickBuffer(session_factory=session_factory, flush_interval=60)
+    monkeypatch.setattr(fast_redirect, "click_buffer", buffer)
+    monkeypatch.setattr(settings, "FAST_REDIRECT_ENABLED", True)
+    buffer.start()
+    yield buffer
+    await buffer.stop()
+
+
+async def _create(client, **extra) -> str:
+    response = await client.post("/links", json={"url": "https://example.com/a b?q=1", **extra})
+    return response.json()["short_code"]
+
+
+@pytest.mark.asyncio
+async def test_fast_path_redirects_and_defers_click(client, buffer, session_factory):
+    code = await _create(client)
+    routed = db_queries_per_request.count("/{short_code}")
+
+    response = await client.get(f"/{code}", headers={"Referer": "https://ref.example/"})
+    assert response.status_code == 302
+    assert response.headers["location"] == "https://example.com/a%20b?q=1"
+    # Answered before the router, which would have recorded per-request SQL use
+    assert db_queries_per_request.count("/{short_code}") == routed
+    assert buffer.pending == 1
+
+    await buffer.flush()
+    async with session_factory() as session:
+        click = (await session.execute(select(Click))).scalars().one()
+    assert click.referrer == "https://ref.example/"
+
+
+@pytest.mark.asyncio
+async def test_fast_path_errors_match_router(client, buffer, auth_headers, monkeypatch):
+    deleted = await _create(client)
+    await client.delete(f"/links/{deleted}", headers=auth_headers)
+    limited = await _create(client, max_clicks=1)
+    await client.get(f"/{limited}")
+
+    fast = [await client.get(f"/{code}") for code in ("missing", deleted, limited)]
+    await buffer.flush()
+    monkeypatch.setattr(settings, "FAST_REDIRECT_ENABLED", False)
+    link_cache.clear()
+    routed = [await client.get(f"/{code}") for code in ("missing", deleted, limited)]
+
+    assert [r.status_code for r in fast] == [404, 410, 410]
+    for a, b in zip(fast, routed):
+        assert (a.status_code, a.content, a.headers["content-type"]) == (
+            b.status_code, b.content, b.headers["content-type"]
+        )
+
+
+@pytest.mark.asyncio
+async def test_fast_path_leaves_other_routes_alone(client, buffer):
+    assert (await client.get("/health")).json()["status"] == "ok"
+    assert (await client.get("/links")).status_code != 302
+    assert (await client.post("/links", json={"url": "https://example.com"})).status_code == 201
+    assert buffer.pending == 0
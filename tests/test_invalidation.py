@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+
+from app.config import settings
+from app.database import _create_engines, get_session
+from app.invalidation import ChangeLogChannel, LocalChannel
+from app.main import app
+from app.models import Link, LinkChange
+
+
+@pytest.mark.asyncio
+async def test_local_channel_delivers_to_subscribers():
+    channel = LocalChannel()
+    received = []
+    channel.subscribe(received.append)
+    await channel.publish(["abc"])
+    assert received == [["abc"]]
+
+
+@pytest_asyncio.fixture
+async def file_engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/changes.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_change_log_reaches_other_workers(file_engine):
+    publisher = ChangeLogChannel(file_engine, poll_interval=0.01, retention_seconds=3600)
+    listener = ChangeLogChannel(file_engine, poll_interval=0.01, retention_seconds=3600)
+    received = []
+    listener.subscribe(received.append)
+    publisher.start()
+    listener.start()
+    try:
+        await publisher.publish(["abc", "def"])
+        for _ in range(100):
+            if received:
+                break
+            await asyncio.sleep(0.01)
+        assert received == [["abc", "def"]]
+        assert listener.stats()["received"] == 2
+    finally:
+        await publisher.stop()
+        await listener.stop()
+
+
+@pytest.mark.asyncio
+async def test_change_log_resyncs_after_missed_changes(file_engine):
+    publisher = ChangeLogChannel(file_engine, poll_interval=3600, retention_seconds=3600)
+    listener = ChangeLogChannel(file_engine, poll_interval=3600, retention_seconds=3600)
+    publisher.start()
+    listener.start()
+    try:
+        await publisher.publish(["old"])
+        await publisher.publish(["new"])
+        # Simulate the purge removing a change the listener never saw
+        async with file_engine.begin() as conn:
+            await conn.execute(delete(LinkChange).where(LinkChange.short_code == "old"))
+        assert listener._poll() is None
+        assert listener.stats()["resyncs"] == 1
+        assert listener._poll() == []
+    finally:
+        await publisher.stop()
+        await listener.stop()
+
+
+@pytest.mark.asyncio
+async def test_update_publishes_with_single_writer_connection(client, auth_headers, tmp_path, monkeypatch):
+    from app.routes import links
+
+    # The tuned engines: one writer connection, shared by the route and the change log
+    monkeypatch.setattr(settings, "DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path}/tuned.db")
+    monkeypatch.setattr(settings, "SQLITE_TUNING", True)
+    writer, reader = _create_engines()
+    writer_session = sessionmaker(writer, class_=AsyncSession, expire_on_commit=False)
+    async with writer.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with writer_session() as session:
+        session.add(Link(short_code="tuned", original_url="https://example.com/"))
+        await session.commit()
+
+    async def override_get_session():
+        async with writer_session() as session:
+            yield session
+
+    channel = ChangeLogChannel(writer, poll_interval=3600, retention_seconds=3600)
+    monkeypatch.setitem(app.dependency_overrides, get_session, override_get_session)
+    monkeypatch.setattr(links, "invalidation_channel", channel)
+    channel.start()
+    try:
+        response = await asyncio.wait_for(
+            client.patch("/links/tuned", json={"max_clicks": 5}, headers=auth_headers), timeout=5
+        )
+        assert response.status_code == 200
+        assert response.json()["max_clicks"] == 5
+        async with writer_session() as session:
+            assert (await session.execute(select(LinkChange.short_code))).scalars().all() == ["tuned"]
+    finally:
+        await channel.stop()
+        await writer.dispose()
+        await reader.dispose()
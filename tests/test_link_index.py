@@ -0,0 +1,163 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.link_index import (
+    NO_EXPIRY,
+    TOMBSTONE,
+    IndexFile,
+    LinkIndex,
+    delta_path,
+    rebuild_index,
+    write_index,
+)
+
+
+def test_index_file_round_trip(tmp_path):
+    path = tmp_path / "index.bin"
+    entries = {f"code{i}": (i, f"https://example.com/{i}", NO_EXPIRY) for i in range(1000)}
+    entries["ünï"] = (5000, "https://例え.jp/パス", 1_700_000_000_000_000)
+    write_index(path, entries, built_at=1.0, watermark=42)
+
+    index = IndexFile(path)
+    try:
+        assert index.count == 1001
+        assert index.watermark == 42
+        assert index.get("code7") == (7, "https://example.com/7", NO_EXPIRY)
+        assert index.get("ünï") == (5000, "https://例え.jp/パス", 1_700_000_000_000_000)
+        assert index.get("missing") is None
+        assert index.get("code") is None
+        assert index.entries() == entries
+    finally:
+        index.close()
+
+
+def test_index_file_rejects_other_files(tmp_path):
+    path = tmp_path / "index.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        IndexFile(path)
+
+
+async def _create(client, **fields) -> str:
+    response = await client.post("/links", json={"url": "https://example.com/page", **fields})
+    return response.json()["short_code"]
+
+
+def _codes(path) -> set[str]:
+    index = IndexFile(path)
+    try:
+        return set(index.entries())
+    finally:
+        index.close()
+
+
+@pytest.mark.asyncio
+async def test_rebuild_is_incremental(client, auth_headers, session_factory, tmp_path, monkeypatch):
+    path = tmp_path / "index.bin"
+    kept = await _create(client)
+    deleted = await _create(client)
+    limited = await _create(client, max_clicks=5)
+    expiring = await _create(client, expires_at="2030-01-01T00:00:00Z")
+
+    async with session_factory() as session:
+        assert await rebuild_index(session, path) == 3
+    index = IndexFile(path)
+    assert index.get(limited) is None
+    assert index.get(expiring)[2] == (datetime(2030, 1, 1) - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+    index.close()
+
+    # Nothing changed: the files are left alone
+    before = os.stat(path).st_mtime_ns
+    async with session_factory() as session:
+        assert await rebuild_index(session, path) == 0
+    assert os.stat(path).st_mtime_ns == before
+    assert not delta_path(path).exists()
+
+    # Changes go to the delta, with a tombstone for the deleted link
+    await client.delete(f"/links/{deleted}", headers=auth_headers)
+    added = await _create(client)
+    async with session_factory() as session:
+        assert await rebuild_index(session, path) == 2
+    assert os.stat(path).st_mtime_ns == before
+    delta = IndexFile(delta_path(path))
+    try:
+        assert delta.get(added)[0] > 0
+        assert delta.get(deleted)[2] == TOMBSTONE
+        assert delta.get(kept) is None
+    finally:
+        delta.close()
+
+    # A large enough delta is merged into a new base
+    monkeypatch.setattr("app.link_index.COMPACT_MIN", 1)
+    await client.patch(f"/links/{kept}", json={"expires_at": "2031-01-01T00:00:00Z"}, headers=auth_headers)
+    async with session_factory() as session:
+        assert await rebuild_index(session, path) == 1
+    assert not delta_path(path).exists()
+    assert _codes(path) == {kept, expiring, added}
+
+
+@pytest.mark.asyncio
+async def test_rebuild_from_scratch_for_older_files(client, session_factory, tmp_path):
+    path = tmp_path / "index.bin"
+    code = await _create(client)
+    # Left behind by another database: a stale code, and a delta for some other base
+    write_index(path, {"stale": (99, "https://old.example/", NO_EXPIRY)}, built_at=1.0, watermark=2 ** 62)
+    write_index(delta_path(path), {}, built_at=2.0, watermark=2 ** 62, base=0.5)
+
+    index = LinkIndex(path, refresh_interval=60, session_factory=session_factory)
+    index.reload()
+    assert index.get("stale") is not None and index.stats()["delta_entries"] == 0
+
+    await index.run_once()
+    assert _codes(path) == {code}
+    assert index.get("stale") is None
+    assert index.get(code) is not None
+    await index.stop()
+
+
+@pytest.mark.asyncio
+async def test_redirects_use_index_until_link_changes(client, auth_headers, session_factory, tmp_path):
+    code = await _create(client)
+    index = LinkIndex(tmp_path / "index.bin", refresh_interval=60, session_factory=session_factory)
+    await index.run_once()
+    assert index.stats()["entries"] == 1
+
+    link = index.get(code)
+    assert (link.short_code, link.original_url, link.is_active) == (code, "https://example.com/page", True)
+    assert index.get("missing") is None
+
+    index.mark_dirty([code])
+    assert index.get(code) is None
+
+    # A file built after the change clears it
+    await client.patch(f"/links/{code}", json={"expires_at": "2031-01-01T00:00:00Z"}, headers=auth_headers)
+    await index.run_once()
+    assert index.get(code).expires_at == datetime(2031, 1, 1)
+
+    # Missed changes make every file built before unusable
+    index.mark_dirty(None)
+    assert index.get(code) is None
+    index.reload()
+    assert index.get(code) is None
+    await index.stop()
+
+
+@pytest.mark.asyncio
+async def test_redirect_served_from_index(client, auth_headers, session_factory, tmp_path, monkeypatch):
+    from app.link_index import link_index
+
+    code = await _create(client)
+    monkeypatch.setattr(link_index, "path", tmp_path / "index.bin")
+    monkeypatch.setattr(link_index, "_session_factory", session_factory)
+    await link_index.run_once()
+
+    response = await client.get(f"/{code}", follow_redirects=False)
+    assert response.status_code == 302
+    assert response.headers["location"] == "https://example.com/page"
+    assert link_index.hits == 1
+
+    # Deleting publishes the code, so the stale entry is skipped
+    await client.delete(f"/links/{code}", headers=auth_headers)
+    assert (await client.get(f"/{code}", follow_redirects=False)).status_code == 410
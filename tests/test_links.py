@@ -1,4 +1,7 @@
 import pytest
+from sqlalchemy import text, update
+
+from app.models import Link
 
 
 @pytest.mark.asyncio
@@ -134,3 +137,328 @@ async def test_delete_link(client, auth_headers):
     # Verify soft-deleted
     get_resp = await client.get(f"/links/{code}", headers=auth_headers)
     assert get_resp.json()["is_active"] is False
+
+
+@pytest.mark.asyncio
+async def test_list_links_cursor_pagination(client, auth_headers):
+    for i in range(5):
+        await client.post("/links", json={"url": f"https://example{i}.com"})
+
+    seen = []
+    response = await client.get("/links?per_page=2", headers=auth_headers)
+    data = response.json()
+    assert data["total"] == 5
+    seen += [link["short_code"] for link in data["links"]]
+
+    while data["next_cursor"]:
+        response = await client.get(
+            f"/links?per_page=2&cursor={data['next_cursor']}", headers=auth_headers
+        )
+        data = response.json()
+        assert data["total"] is None
+        seen += [link["short_code"] for link in data["links"]]
+
+    assert len(seen) == 5
+    assert len(set(seen)) == 5
+
+
+@pytest.mark.asyncio
+async def test_list_links_cursor_with_total(client, auth_headers):
+    for i in range(3):
+        await client.post("/links", json={"url": f"https://example{i}.com"})
+    first = (await client.get("/links?per_page=1", headers=auth_headers)).json()
+
+    response = await client.get(
+        f"/links?per_page=1&cursor={first['next_cursor']}&include_total=true",
+        headers=auth_headers,
+    )
+    assert response.json()["total"] == 3
+
+
+@pytest.mark.asyncio
+async def test_list_links_invalid_cursor(client, auth_headers):
+    response = await client.get("/links?cursor=not-a-cursor", headers=auth_headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_list_links_cursor_same_timestamp(client, auth_headers, session_factory):
+    from datetime import datetime, timezone
+
+    from app.models import Link
+
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    async with session_factory() as session:
+        session.add_all([
+            Link(short_code=f"tie{i}", original_url="https://example.com/", created_at=created_at)
+            for i in range(3)
+        ])
+        await session.commit()
+
+    first = (await client.get("/links?per_page=2", headers=auth_headers)).json()
+    second = (await client.get(
+        f"/links?per_page=2&cursor={first['next_cursor']}", headers=auth_headers
+    )).json()
+    codes = [link["short_code"] for link in first["links"] + second["links"]]
+    assert codes == ["tie2", "tie1", "tie0"]
+    assert second["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_bulk_qr_zip(client, auth_headers):
+    import io
+    import zipfile
+
+    codes = []
+    for i in range(3):
+        resp = await client.post("/links", json={"url": f"https://example{i}.com"})
+        codes.append(resp.json()["short_code"])
+
+    response = await client.post(
+        "/links/qr",
+        json={"short_codes": codes + ["missing-code"], "format": "svg", "box_size": 5},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    names = set(archive.namelist())
+    assert names == {f"{code}.svg" for code in codes} | {"missing.txt"}
+    assert archive.read(f"{codes[0]}.svg").startswith(b"<?xml")
+    assert archive.read("missing.txt").decode().strip() == "missing-code"
+
+
+@pytest.mark.asyncio
+async def test_bulk_qr_png(client, auth_headers):
+    import io
+    import zipfile
+
+    resp = await client.post("/links", json={"url": "https://example.com"})
+    code = resp.json()["short_code"]
+
+    response = await client.post("/links/qr", json={"short_codes": [code]}, headers=auth_headers)
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.read(f"{code}.png")[:8] == b"\x89PNG\r\n\x1a\n"
+
+
+@pytest.mark.asyncio
+async def test_bulk_qr_requires_auth(client):
+    response = await client.post("/links/qr", json={"short_codes": ["abc"]})
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_links(client, auth_headers):
+    await client.post("/links", json={"url": "https://example.com", "custom_slug": "taken"})
+
+    response = await client.post("/links/bulk", headers=auth_headers, json=[
+        {"url": "https://one.com"},
+        {"url": "https://two.com", "custom_slug": "two-slug"},
+        {"url": "not a url"},
+        {"url": "https://three.com", "custom_slug": "taken"},
+        {"url": "https://four.com", "custom_slug": "two-slug"},
+    ])
+    assert response.status_code == 200
+    data = response.json()
+    assert data["created"] == 2
+    assert data["failed"] == 3
+    statuses = [r["status"] for r in data["results"]]
+    assert statuses == ["created", "created", "error", "error", "error"]
+    assert data["results"][1]["short_code"] == "two-slug"
+    assert "already taken" in data["results"][3]["error"]
+    assert "more than once" in data["results"][4]["error"]
+    assert data["results"][0]["qr_code_base64"] is None
+
+    code = data["results"][0]["short_code"]
+    redirect = await client.get(f"/{code}", follow_redirects=False)
+    assert redirect.headers["location"] == "https://one.com/"
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_links_ndjson_with_qr(client, auth_headers):
+    body = '{"url": "https://one.com"}\nnot json\n{"url": "https://two.com"}\n'
+    response = await client.post(
+        "/links/bulk?include_qr=true",
+        content=body,
+        headers={**auth_headers, "content-type": "application/x-ndjson"},
+    )
+    data = response.json()
+    assert data["created"] == 2
+    assert data["results"][1]["error"] == "Invalid JSON"
+    assert data["results"][0]["qr_code_base64"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_links_batches(client, auth_headers, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "BULK_CREATE_BATCH_SIZE", 2)
+    items = [{"url": f"https://example{i}.com"} for i in range(5)]
+    response = await client.post("/links/bulk", headers=auth_headers, json=items)
+    assert response.json()["created"] == 5
+
+    listing = await client.get("/links", headers=auth_headers)
+    assert listing.json()["total"] == 5
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_links_rejects_bad_body(client, auth_headers):
+    response = await client.post("/links/bulk", headers=auth_headers, json={"url": "https://x.com"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_links_rejects_oversized_body_early(client, auth_headers, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "BULK_CREATE_MAX_ITEMS", 2)
+    monkeypatch.setattr(settings, "BULK_CREATE_MAX_BYTES", 1000)
+    response = await client.post("/links/bulk", headers=auth_headers, content=b"[" + b" " * 2000 + b"]")
+    assert response.status_code == 413
+
+    # NDJSON stops reading once it has too many items, whatever the body size
+    sent = []
+
+    async def lines():
+        for i in range(100):
+            sent.append(i)
+            yield b'{"url": "https://example.com"}\n'
+
+    monkeypatch.setattr(settings, "BULK_CREATE_MAX_BYTES", 10 ** 6)
+    response = await client.post(
+        "/links/bulk",
+        headers={**auth_headers, "Content-Type": "application/x-ndjson"},
+        content=lines(),
+    )
+    assert response.status_code == 413
+    assert len(sent) < 100
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_links_requires_auth(client):
+    response = await client.post("/links/bulk", json=[])
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_links_recovers_from_conflicting_batch(client, auth_headers, monkeypatch):
+    from app.allocator import short_code_allocator
+
+    await client.post("/links", json={"url": "https://example.com", "custom_slug": "clash123"})
+
+    async def allocate_clashing(engine, count):
+        return ["clash123"] * count
+
+    monkeypatch.setattr(short_code_allocator, "allocate_many", allocate_clashing)
+    response = await client.post("/links/bulk", headers=auth_headers, json=[
+        {"url": "https://one.com"},
+        {"url": "https://two.com", "custom_slug": "fresh-slug"},
+    ])
+    data = response.json()
+    assert data["created"] == 2
+    assert data["results"][0]["short_code"] not in ("clash123", None)
+    assert data["results"][1]["short_code"] == "fresh-slug"
+
+
+async def _codes(client, auth_headers, query: str) -> list[str]:
+    response = await client.get(f"/links?{query}", headers=auth_headers)
+    assert response.status_code == 200, response.text
+    return [link["short_code"] for link in response.json()["links"]]
+
+
+@pytest.mark.asyncio
+async def test_list_links_search(client, auth_headers):
+    for slug, url in (
+        ("docs-home", "https://www.Example.com/Docs/index.html"),
+        ("blog", "https://blog.example.com/posts/42"),
+        ("other", "https://other.org/docs"),
+    ):
+        await client.post("/links", json={"url": url, "custom_slug": slug})
+
+    assert await _codes(client, auth_headers, "q=docs&sort=created_at") == ["docs-home", "other"]
+    assert await _codes(client, auth_headers, "q=POSTS/4") == ["blog"]
+    # Too short for the trigram index, still a substring match
+    assert await _codes(client, auth_headers, "q=42") == ["blog"]
+    assert await _codes(client, auth_headers, 'q="quoted"') == []
+
+    assert await _codes(client, auth_headers, "domain=example.com") == ["docs-home"]
+    assert await _codes(client, auth_headers, "domain=https://WWW.example.com/") == ["docs-home"]
+    assert await _codes(client, auth_headers, "domain=blog.example.com&q=docs") == []
+
+    response = await client.get("/links?q=example", headers=auth_headers)
+    assert response.json()["total"] == 2
+
+
+@pytest.mark.asyncio
+async def test_list_links_search_follows_updates(client, auth_headers, session_factory):
+    await client.post("/links", json={"url": "https://example.com/before", "custom_slug": "moved"})
+    async with session_factory() as session:
+        await session.execute(update(Link).values(original_url="https://example.com/after"))
+        await session.commit()
+    assert await _codes(client, auth_headers, "q=before") == []
+    assert await _codes(client, auth_headers, "q=after") == ["moved"]
+
+
+@pytest.mark.asyncio
+async def test_list_links_filters(client, auth_headers):
+    await client.post("/links", json={"url": "https://example.com", "custom_slug": "vanity"})
+    await client.post("/links", json={"url": "https://example.com", "custom_slug": "gone"})
+    await client.delete("/links/gone", headers=auth_headers)
+    expired = (await client.post(
+        "/links", json={"url": "https://example.com", "expires_at": "2020-01-01T00:00:00Z"}
+    )).json()["short_code"]
+    plain = (await client.post("/links", json={"url": "https://example.com"})).json()["short_code"]
+
+    assert set(await _codes(client, auth_headers, "is_vanity=true")) == {"vanity", "gone"}
+    assert await _codes(client, auth_headers, "active=false") == ["gone"]
+    assert await _codes(client, auth_headers, "expired=true") == [expired]
+    assert expired not in await _codes(client, auth_headers, "expired=false")
+    assert await _codes(client, auth_headers, "created_after=2999-01-01T00:00:00Z") == []
+    assert len(await _codes(client, auth_headers, "created_before=2999-01-01T00:00:00Z")) == 4
+
+    await client.get(f"/{plain}", follow_redirects=False)
+    assert await _codes(client, auth_headers, "min_clicks=1") == [plain]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("condition,index", [
+    ("is_active = 0", "ix_links_is_active_created_at_id"),
+    ("is_vanity = 1", "ix_links_is_vanity_created_at_id"),
+    ("domain = 'example.com'", "ix_links_domain_created_at_id"),
+])
+async def test_list_links_filters_use_indexes(session_factory, condition, index):
+    async with session_factory() as session:
+        plan = (await session.execute(text(
+            f"EXPLAIN QUERY PLAN SELECT * FROM links WHERE {condition} "
+            "ORDER BY created_at DESC, id DESC LIMIT 21"
+        ))).all()
+    details = " ".join(row[-1] for row in plan)
+    assert index in details
+    assert "TEMP B-TREE" not in details
+
+
+@pytest.mark.asyncio
+async def test_list_links_sorted_by_clicks_with_cursor(client, auth_headers):
+    codes = []
+    for clicks in (2, 0, 3, 2):
+        code = (await client.post("/links", json={"url": "https://example.com"})).json()["short_code"]
+        for _ in range(clicks):
+            await client.get(f"/{code}", follow_redirects=False)
+        codes.append(code)
+
+    seen = []
+    data = (await client.get("/links?sort=-total_clicks&per_page=2", headers=auth_headers)).json()
+    seen += [(link["short_code"], link["total_clicks"]) for link in data["links"]]
+    while data["next_cursor"]:
+        data = (await client.get(
+            f"/links?sort=-total_clicks&per_page=2&cursor={data['next_cursor']}", headers=auth_headers
+        )).json()
+        seen += [(link["short_code"], link["total_clicks"]) for link in data["links"]]
+
+    assert seen == [(codes[2], 3), (codes[3], 2), (codes[0], 2), (codes[1], 0)]
+
+    # A created_at cursor doesn't fit the clicks sort
+    first = (await client.get("/links?per_page=1", headers=auth_headers)).json()
+    response = await client.get(f"/links?sort=total_clicks&cursor={first['next_cursor']}", headers=auth_headers)
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+import pytest
+
+from app.metrics import (
+    Counter,
+    Histogram,
+    clicks_written,
+    db_queries_per_request,
+    http_requests,
+    rate_limit_rejections,
+)
+
+
+def test_counter_and_histogram_exposition():
+    counter = Counter("things_total", "Things.", ("kind",))
+    counter.inc("a")
+    counter.inc("a", amount=2)
+    assert counter.render()[2] == 'things_total{kind="a"} 3'
+
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    assert histogram.render()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_requests_are_labelled_by_route_template(client):
+    code = (await client.post("/links", json={"url": "https://example.com"})).json()["short_code"]
+    before = http_requests.value("GET", "/{short_code}", "302")
+    queries_before = db_queries_per_request.count("/{short_code}")
+
+    await client.get(f"/{code}", follow_redirects=False)
+    await client.get("/nothing/here/at/all")
+
+    assert http_requests.value("GET", "/{short_code}", "302") == before + 1
+    assert http_requests.value("GET", "unmatched", "404") >= 1
+    assert db_queries_per_request.count("/{short_code}") == queries_before + 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client):
+    written = clicks_written.value()
+    code = (await client.post("/links", json={"url": "https://example.com"})).json()["short_code"]
+    await client.get(f"/{code}", follow_redirects=False)
+    assert clicks_written.value() == written + 1
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_requests_total{method="POST",route="/links",status="201"}' in body
+    assert 'db_query_duration_seconds_count{engine="test"}' in body
+    assert "clicks_written_total" in body
+    assert 'cache_hits_total{cache="links"}' in body
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_rejections_are_counted(client):
+    before = rate_limit_rejections.value("create_link")
+    for _ in range(6):
+        await client.post("/links", json={"url": "https://example.com"})
+    assert rate_limit_rejections.value("create_link") == before + 1
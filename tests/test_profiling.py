@@ -0,0 +1,59 @@
+import logging
+
+import pytest
+
+from app.config import settings
+from app.main import app
+from app.profiling import TimedRoute
+
+
+@pytest.mark.asyncio
+async def test_admin_can_request_server_timing(client, auth_headers):
+    response = await client.get("/links", headers={**auth_headers, "X-Profile": "1"})
+    timing = response.headers["server-timing"]
+    for name in ("db;dur=", "qr;dur=", "serialize;dur=", "total;dur="):
+        assert name in timing
+
+
+@pytest.mark.asyncio
+async def test_profile_header_ignored_without_admin_token(client):
+    response = await client.get("/links/anything/stats/public", headers={"X-Profile": "1"})
+    assert "server-timing" not in response.headers
+
+    response = await client.get(
+        "/links/anything/stats/public",
+        headers={"X-Profile": "1", "Authorization": "Bearer not-a-token"},
+    )
+    assert "server-timing" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_sampled_requests_get_server_timing(client, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 1.0)
+    response = await client.post("/links", json={"url": "https://example.com"})
+    assert 'desc="' in response.headers["server-timing"]
+
+
+@pytest.mark.asyncio
+async def test_slow_queries_are_logged_with_plan(client, monkeypatch, caplog):
+    code = (await client.post("/links", json={"url": "https://example.com"})).json()["short_code"]
+    monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD_MS", 1e-9)
+    with caplog.at_level(logging.WARNING, logger="app.slow_queries"):
+        await client.get(f"/{code}", follow_redirects=False)
+    messages = [r.getMessage() for r in caplog.records if r.name == "app.slow_queries"]
+    lookup = next(m for m in messages if "FROM links" in m and "WHERE links.short_code" in m)
+    assert "SEARCH links USING INDEX" in lookup
+
+
+@pytest.mark.asyncio
+async def test_timed_routes_keep_openapi_schema(client):
+    schema = (await client.get("/openapi.json")).json()
+    assert "/links/{short_code}" in schema["paths"]
+    assert schema["paths"]["/links"]["post"]["operationId"] == "create_link_links_post"
+
+
+def test_routes_are_timed_once():
+    routes = [route for route in app.routes if isinstance(route, TimedRoute)]
+    assert {"/links", "/{short_code}", "/auth/login"} <= {route.path for route in routes}
+    for route in routes:
+        assert not hasattr(route.endpoint.__wrapped__, "__wrapped__"), route.path
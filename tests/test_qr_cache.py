@@ -0,0 +1,38 @@
+import pytest
+
+from app.qr_cache import QRCache
+
+
+@pytest.mark.asyncio
+async def test_qr_cache_memory_hit():
+    cache = QRCache(max_entries=10, directory=None)
+    png, etag = await cache.get("https://example.com/abc")
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    assert await cache.get("https://example.com/abc") == (png, etag)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_qr_cache_key_depends_on_options():
+    assert QRCache.key("https://example.com/a") != QRCache.key("https://example.com/b")
+    assert QRCache.key("https://example.com/a") != QRCache.key("https://example.com/a", box_size=5)
+
+
+@pytest.mark.asyncio
+async def test_qr_cache_bounded():
+    cache = QRCache(max_entries=2, directory=None)
+    for code in ("a", "b", "c"):
+        await cache.get(f"https://example.com/{code}")
+    assert cache.stats()["size"] == 2
+
+
+@pytest.mark.asyncio
+async def test_qr_cache_disk_layer(tmp_path):
+    first = QRCache(max_entries=10, directory=str(tmp_path))
+    png, etag = await first.get("https://example.com/abc")
+
+    # A fresh cache (e.g. after a restart) reads the image back from disk
+    second = QRCache(max_entries=10, directory=str(tmp_path))
+    assert await second.get("https://example.com/abc") == (png, etag)
+    assert second.stats()["disk_hits"] == 1
+    assert second.stats()["misses"] == 0
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.config import settings
+from app.metrics import rate_limit_rejections
+from app.rate_limit import MemoryBackend, RateLimiter, SQLiteBackend, _slide
+
+
+def test_slide_within_window():
+    state = None
+    for _ in range(3):
+        allowed, state = _slide(state, 100.0, limit=3, window=60)
+        assert allowed
+    allowed, state = _slide(state, 100.0, limit=3, window=60)
+    assert not allowed
+
+
+def test_slide_weights_previous_window():
+    _, state = _slide(None, 60.0, limit=10, window=60)
+    for _ in range(9):
+        _, state = _slide(state, 60.0, limit=10, window=60)
+    # Half way through the next window, half of the previous 10 still count
+    allowed, state = _slide(state, 150.0, limit=6, window=60)
+    assert allowed
+    allowed, state = _slide(state, 150.0, limit=6, window=60)
+    assert not allowed
+    # Two windows later the old requests are forgotten entirely
+    allowed, _ = _slide(state, 300.0, limit=1, window=60)
+    assert allowed
+
+
+def test_memory_backend_bounded():
+    backend = MemoryBackend(max_keys=10)
+    for i in range(50):
+        backend.hit(f"ip{i}", limit=5, window=60)
+    assert len(backend) == 10
+
+
+def test_memory_backend_evicts_idle_keys(monkeypatch):
+    backend = MemoryBackend(max_keys=100)
+    backend.hit("idle", limit=5, window=60)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 600)
+    backend.hit("active", limit=5, window=60)
+    assert len(backend) == 1
+
+
+def test_sqlite_backend_shared(tmp_path):
+    path = str(tmp_path / "limits.sqlite3")
+    worker_a, worker_b = SQLiteBackend(path), SQLiteBackend(path)
+    assert worker_a.hit("ip", limit=2, window=60)
+    assert worker_b.hit("ip", limit=2, window=60)
+    assert not worker_a.hit("ip", limit=2, window=60)
+    assert worker_b.hit("other", limit=2, window=60)
+    worker_a.reset()
+    assert worker_b.hit("ip", limit=2, window=60)
+
+
+def test_route_limit_override(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ROUTES", {"bulk": "2/30"})
+    assert RateLimiter("bulk").limits() == (2, 30)
+    assert RateLimiter("other").limits() == (
+        settings.RATE_LIMIT_REQUESTS,
+        settings.RATE_LIMIT_WINDOW_SECONDS,
+    )
+    assert RateLimiter("bulk", requests=7, window_seconds=10).limits() == (7, 10)
+
+
+@pytest.mark.asyncio
+async def test_create_link_rate_limited(client):
+    for i in range(settings.RATE_LIMIT_REQUESTS):
+        response = await client.post("/links", json={"url": f"https://example{i}.com"})
+        assert response.status_code == 201
+    response = await client.post("/links", json={"url": "https://example.com"})
+    assert response.status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_concurrent_rejections_are_all_counted():
+    limiter = RateLimiter("concurrent", requests=1, window_seconds=60)
+    request = Request({"type": "http", "client": ("10.0.0.1", 1234), "headers": []})
+    before = rate_limit_rejections.value("concurrent")
+    results = await asyncio.gather(*(limiter(request) for _ in range(50)), return_exceptions=True)
+    assert sum(isinstance(r, HTTPException) for r in results) == 49
+    assert rate_limit_rejections.value("concurrent") == before + 49
@@ -1,5 +1,10 @@
+import asyncio
+
 import pytest
 
+from app.cache import CachedLink
+from app.routes.redirect import GONE, link_error
+
 
 @pytest.mark.asyncio
 async def test_redirect(client):
@@ -69,6 +74,25 @@ async def test_redirect_max_clicks_reached(client, auth_headers):
     assert resp2.status_code == 410
 
 
+@pytest.mark.asyncio
+async def test_max_clicks_must_be_positive(client, auth_headers):
+    response = await client.post("/links", json={"url": "https://example.com", "max_clicks": 0})
+    assert response.status_code == 422
+
+    code = (await client.post("/links", json={"url": "https://example.com"})).json()["short_code"]
+    response = await client.patch(f"/links/{code}", json={"max_clicks": 0}, headers=auth_headers)
+    assert response.status_code == 422
+
+
+def test_zero_max_clicks_is_exhausted():
+    # Same predicate as the click claim and the expiry sweeper, for rows stored before validation
+    link = CachedLink(
+        id=1, short_code="abc", original_url="https://example.com/", is_active=True,
+        expires_at=None, max_clicks=0, total_clicks=0,
+    )
+    assert link_error(link) == GONE["click_limit"]
+
+
 @pytest.mark.asyncio
 async def test_qr_code(client):
     create_resp = await client.post("/links", json={"url": "https://example.com"})
@@ -89,3 +113,64 @@ async def test_qr_code_deleted_link(client, auth_headers):
 
     response = await client.get(f"/{code}/qr")
     assert response.status_code == 410
+
+
+@pytest.mark.asyncio
+async def test_redirect_cache_invalidated_on_update(client, auth_headers):
+    create_resp = await client.post("/links", json={"url": "https://example.com"})
+    code = create_resp.json()["short_code"]
+
+    # Populate the link cache
+    resp1 = await client.get(f"/{code}", follow_redirects=False)
+    assert resp1.status_code == 302
+
+    await client.patch(
+        f"/links/{code}",
+        json={"expires_at": "2020-01-01T00:00:00Z"},
+        headers=auth_headers,
+    )
+
+    resp2 = await client.get(f"/{code}", follow_redirects=False)
+    assert resp2.status_code == 410
+
+
+@pytest.mark.asyncio
+async def test_redirect_cache_invalidated_on_delete(client, auth_headers):
+    create_resp = await client.post("/links", json={"url": "https://example.com"})
+    code = create_resp.json()["short_code"]
+
+    await client.get(f"/{code}", follow_redirects=False)
+    await client.delete(f"/links/{code}", headers=auth_headers)
+
+    response = await client.get(f"/{code}", follow_redirects=False)
+    assert response.status_code == 410
+
+
+@pytest.mark.asyncio
+async def test_qr_code_conditional_request(client):
+    create_resp = await client.post("/links", json={"url": "https://example.com"})
+    code = create_resp.json()["short_code"]
+
+    response = await client.get(f"/{code}/qr")
+    etag = response.headers["etag"]
+    assert "max-age" in response.headers["cache-control"]
+
+    cached = await client.get(f"/{code}/qr", headers={"if-none-match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert cached.content == b""
+
+    stale = await client.get(f"/{code}/qr", headers={"if-none-match": '"other"'})
+    assert stale.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_concurrent_redirects_respect_max_clicks(client):
+    create_resp = await client.post("/links", json={"url": "https://example.com", "max_clicks": 3})
+    code = create_resp.json()["short_code"]
+
+    responses = await asyncio.gather(*(client.get(f"/{code}", follow_redirects=False) for _ in range(20)))
+    assert sorted(r.status_code for r in responses) == [302] * 3 + [410] * 17
+    assert {r.json()["detail"] for r in responses if r.status_code == 410} == {
+        "This link has reached its click limit"
+    }
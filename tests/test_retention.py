@@ -0,0 +1,200 @@
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select, update
+
+from app.config import settings
+from app.models import Click, Link
+from app.retention import (
+    ArchivedClick,
+    _link_members,
+    _write_batch,
+    archive_clicks,
+    archived_months,
+    archived_page,
+    load_manifest,
+    read_archived_clicks,
+)
+from app.rollups import backfill_rollups, get_rollups
+
+OLD = datetime(2024, 1, 15, 12, 0)
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CLICK_ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+async def _link_with_clicks(client, old: int, recent: int, session_factory) -> str:
+    code = (await client.post("/links", json={"url": "https://example.com"})).json()["short_code"]
+    for i in range(old + recent):
+        await client.get(f"/{code}", follow_redirects=False)
+    async with session_factory() as session:
+        ids = (await session.execute(select(Click.id).order_by(Click.id))).scalars().all()
+        for i, click_id in enumerate(ids):
+            # One visitor per click, the first ``old`` of them months ago
+            values = {"ip_hash": f"visitor-{i}"}
+            if i < old:
+                values["clicked_at"] = OLD + timedelta(days=i * 30)
+            await session.execute(update(Click).where(Click.id == click_id).values(**values))
+        await session.commit()
+    return code
+
+
+async def _click_count(session_factory) -> int:
+    async with session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(Click))).scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_archive_moves_old_clicks(client, session_factory, archive_dir):
+    await _link_with_clicks(client, old=3, recent=2, session_factory=session_factory)
+
+    async with session_factory() as session:
+        moved = await archive_clicks(session, archive_dir, datetime.now(timezone.utc) - timedelta(days=90), 2)
+    assert moved == 3
+    assert await _click_count(session_factory) == 2
+
+    manifest = load_manifest(archive_dir)
+    # Finished batches collapse into per-month sizes
+    assert manifest["batches"] == 2 and manifest["pending"] == []
+    assert archived_months(archive_dir) == {"2024-01": 1, "2024-02": 1, "2024-03": 1}
+
+    with gzip.open(archive_dir / manifest["months"]["2024-01"]["file"], "rt") as f:
+        row = json.loads(f.readline())
+    assert row["clicked_at"] == OLD.isoformat()
+
+    rows = [r for month in read_archived_clicks(archive_dir) for r in month]
+    assert [r.clicked_at for r in rows] == [OLD, OLD + timedelta(days=30), OLD + timedelta(days=60)]
+
+    # Nothing left to archive
+    async with session_factory() as session:
+        assert await archive_clicks(session, archive_dir, datetime.now(timezone.utc) - timedelta(days=90)) == 0
+
+
+@pytest.mark.asyncio
+async def test_archive_finishes_interrupted_batch(client, session_factory, archive_dir, monkeypatch):
+    await _link_with_clicks(client, old=2, recent=1, session_factory=session_factory)
+    older_than = datetime.now(timezone.utc) - timedelta(days=90)
+
+    # Crash after the batch is written but before its rows are deleted
+    def crash(*args):
+        raise RuntimeError("crash")
+
+    with monkeypatch.context() as m:
+        m.setattr("app.retention._mark_deleted", crash)
+        async with session_factory() as session:
+            with pytest.raises(RuntimeError):
+                await archive_clicks(session, archive_dir, older_than)
+    assert [b["rows"] for b in load_manifest(archive_dir)["pending"]] == [2]
+
+    async with session_factory() as session:
+        assert await archive_clicks(session, archive_dir, older_than) == 0
+    manifest = load_manifest(archive_dir)
+    assert manifest["batches"] == 1 and manifest["pending"] == []
+    assert await _click_count(session_factory) == 1
+    assert sum(archived_months(archive_dir).values()) == 2
+
+
+@pytest.mark.asyncio
+async def test_stats_include_archived(client, auth_headers, session_factory, archive_dir):
+    code = await _link_with_clicks(client, old=3, recent=2, session_factory=session_factory)
+    async with session_factory() as session:
+        rollups_before = await get_rollups(session, 1)
+        await archive_clicks(session, archive_dir, datetime.now(timezone.utc) - timedelta(days=90))
+        # Aggregates are untouched by archival
+        assert await get_rollups(session, 1) == rollups_before
+        assert (await session.get(Link, 1)).total_clicks == 5
+
+    hot = (await client.get(f"/links/{code}/stats?exact=true", headers=auth_headers)).json()
+    assert hot["total_clicks"] == 5
+    assert len(hot["clicks"]) == 2
+    assert hot["unique_clicks"] == 2
+
+    data = (await client.get(
+        f"/links/{code}/stats?exact=true&include_archived=true&limit=3", headers=auth_headers
+    )).json()
+    assert data["unique_clicks"] == 5
+    assert len(data["clicks"]) == 3
+    assert data["clicks"][2]["clicked_at"].startswith((OLD + timedelta(days=60)).isoformat())
+
+    rest = (await client.get(
+        f"/links/{code}/stats?include_archived=true&limit=3&cursor={data['next_cursor']}", headers=auth_headers
+    )).json()
+    assert [c["clicked_at"][:10] for c in rest["clicks"]] == ["2024-02-14", "2024-01-15"]
+    assert rest["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_export_include_archived(client, auth_headers, session_factory, archive_dir):
+    code = await _link_with_clicks(client, old=3, recent=2, session_factory=session_factory)
+    async with session_factory() as session:
+        await archive_clicks(session, archive_dir, datetime.now(timezone.utc) - timedelta(days=90))
+
+    response = await client.get(
+        f"/links/{code}/stats/export?include_archived=true&fields=clicked_at", headers=auth_headers
+    )
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 5
+    assert rows[0]["clicked_at"].startswith(OLD.isoformat())
+
+    response = await client.get(
+        f"/links/{code}/stats/export?include_archived=true&end=2024-02-01T00:00:00Z", headers=auth_headers
+    )
+    assert len(response.text.splitlines()) == 1
+
+
+@pytest.mark.asyncio
+async def test_backfill_reads_archives(client, session_factory, archive_dir):
+    await _link_with_clicks(client, old=3, recent=2, session_factory=session_factory)
+    async with session_factory() as session:
+        await archive_clicks(session, archive_dir, datetime.now(timezone.utc) - timedelta(days=90))
+        assert await backfill_rollups(session, archived=read_archived_clicks(archive_dir)) == 5
+        assert sum((await get_rollups(session, 1))["day"].values()) == 5
+
+
+def _archived(click_id: int, link_id: int, day: int) -> ArchivedClick:
+    return ArchivedClick(click_id, link_id, f"visitor-{click_id}", None, "unknown", OLD + timedelta(days=day))
+
+
+def test_batches_share_one_file_per_month(tmp_path):
+    _write_batch(tmp_path, [_archived(1, 1, 0), _archived(2, 2, 1), _archived(3, 1, 2)], OLD)
+    _write_batch(tmp_path, [_archived(4, 2, 3), _archived(5, 1, 4)], OLD)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "clicks-2024-01.idx", "clicks-2024-01.ndjson.gz", "manifest.json"
+    ]
+    assert archived_months(tmp_path) == {"2024-01": 5}
+    with gzip.open(tmp_path / "clicks-2024-01.ndjson.gz", "rt") as f:
+        assert len(f.readlines()) == 5
+
+    # One member per link per batch, found without reading the other link's
+    size = (tmp_path / "clicks-2024-01.ndjson.gz").stat().st_size
+    assert [m.rows for m in _link_members(tmp_path / "clicks-2024-01.idx", size, 2)] == [1, 1]
+    [rows] = read_archived_clicks(tmp_path, link_id=2)
+    assert [r.id for r in rows] == [2, 4]
+    assert [r.id for r in archived_page(tmp_path, 1, (OLD + timedelta(days=4), 5), 1)] == [3]
+
+
+def test_interrupted_batch_is_ignored_and_overwritten(tmp_path):
+    _write_batch(tmp_path, [_archived(1, 1, 0)], OLD)
+    manifest = load_manifest(tmp_path)
+    # Crash after appending to the month's file and index, before the manifest is written
+    _write_batch(tmp_path, [_archived(2, 1, 1)], OLD)
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+
+    assert [r.id for rows in read_archived_clicks(tmp_path, link_id=1) for r in rows] == [1]
+    assert [r.id for rows in read_archived_clicks(tmp_path) for r in rows] == [1]
+
+    _write_batch(tmp_path, [_archived(3, 1, 2)], OLD)
+    assert [r.id for rows in read_archived_clicks(tmp_path, link_id=1) for r in rows] == [1, 3]
+    with gzip.open(tmp_path / "clicks-2024-01.ndjson.gz", "rt") as f:
+        assert [json.loads(line)["id"] for line in f] == [1, 3]
+
+
+def test_empty_archive(tmp_path):
+    assert archived_months(tmp_path) == {}
+    assert archived_page(tmp_path, 1, None, 10) == []
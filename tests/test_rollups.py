@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.models import Click, ClickRollup, Link
+from app.rollups import backfill_rollups, get_rollups, referrer_domain, rollup_counts
+
+
+def test_referrer_domain():
+    assert referrer_domain(None) == "direct"
+    assert referrer_domain("https://www.google.com/search?q=x") == "www.google.com"
+    assert referrer_domain("not a url") == "unknown"
+
+
+def test_rollup_counts():
+    clicked_at = datetime(2024, 5, 1, 13, 45, tzinfo=timezone.utc)
+    clicks = [
+        Click(link_id=1, ip_hash="a", referrer="https://google.com/", country="US", clicked_at=clicked_at),
+        Click(link_id=1, ip_hash="b", referrer=None, country="US", clicked_at=clicked_at),
+    ]
+    counts = rollup_counts(clicks)
+    assert counts[(1, "hour", "2024-05-01T13:00")] == 2
+    assert counts[(1, "day", "2024-05-01")] == 2
+    assert counts[(1, "country", "US")] == 2
+    assert counts[(1, "referrer", "google.com")] == 1
+    assert counts[(1, "referrer", "direct")] == 1
+
+
+@pytest.mark.asyncio
+async def test_stats_include_rollups(client, auth_headers):
+    create_resp = await client.post("/links", json={"url": "https://example.com"})
+    code = create_resp.json()["short_code"]
+
+    await client.get(f"/{code}", follow_redirects=False,
+                     headers={"referer": "https://google.com/x", "cf-ipcountry": "US"})
+    await client.get(f"/{code}", follow_redirects=False,
+                     headers={"referer": "https://google.com/y", "cf-ipcountry": "DE"})
+    await client.get(f"/{code}", follow_redirects=False)
+
+    for path in (f"/links/{code}/stats", f"/links/{code}/stats/public"):
+        response = await client.get(path, headers=auth_headers)
+        data = response.json()
+        assert data["clicks_by_country"] == {"US": 1, "DE": 1, "unknown": 1}
+        assert data["clicks_by_referrer"] == {"google.com": 2, "direct": 1}
+        assert sum(data["clicks_by_day"].values()) == 3
+        assert sum(data["clicks_by_hour"].values()) == 3
+
+
+@pytest.mark.asyncio
+async def test_backfill_rollups(session_factory):
+    async with session_factory() as session:
+        link = Link(short_code="backfill", original_url="https://example.com/")
+        session.add(link)
+        await session.commit()
+        session.add_all([
+            Click(link_id=link.id, ip_hash="a", country="US"),
+            Click(link_id=link.id, ip_hash="b", country="FR", referrer="https://bing.com/"),
+        ])
+        await session.commit()
+
+        assert (await session.execute(select(ClickRollup))).first() is None
+        assert await backfill_rollups(session) == 2
+
+        rollups = await get_rollups(session, link.id)
+        assert rollups["country"] == {"US": 1, "FR": 1}
+        assert rollups["referrer"] == {"direct": 1, "bing.com": 1}
+
+        # Running it again rebuilds rather than double counts
+        await backfill_rollups(session)
+        assert (await get_rollups(session, link.id))["country"] == {"US": 1, "FR": 1}
@@ -0,0 +1,62 @@
+import gzip
+import os
+
+import pytest
+
+from app.static_pages import StaticPages, _accepted_encodings
+
+
+@pytest.mark.asyncio
+async def test_landing_page_is_gzipped_with_validators(client):
+    response = await client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert "max-age" in response.headers["cache-control"]
+    assert response.headers["etag"].endswith('-gzip"')
+    assert "Last-Modified" in response.headers
+    assert "<html" in response.text.lower()
+
+
+@pytest.mark.asyncio
+async def test_page_identity_when_not_accepted(client):
+    response = await client.get("/admin", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-type"].startswith("text/html")
+
+
+@pytest.mark.asyncio
+async def test_page_conditional_requests(client):
+    first = await client.get("/somecode/stats", headers={"Accept-Encoding": "gzip"})
+    etag = first.headers["etag"]
+
+    response = await client.get(
+        "/somecode/stats", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = await client.get(
+        "/somecode/stats",
+        headers={"Accept-Encoding": "gzip", "If-Modified-Since": first.headers["last-modified"]},
+    )
+    assert response.status_code == 304
+
+
+def test_accepted_encodings_ignores_q_zero():
+    assert _accepted_encodings("gzip;q=0, br") == {"br"}
+    assert _accepted_encodings(None) == set()
+
+
+def test_reload_picks_up_changed_file(tmp_path):
+    path = tmp_path / "page.html"
+    path.write_text("<p>one</p>")
+    pages = StaticPages(tmp_path, max_age=60, reload=True)
+    pages.load_all()
+    assert gzip.decompress(pages.get("page.html").variants["gzip"]) == b"<p>one</p>"
+
+    path.write_text("<p>two</p>")
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert pages.get("page.html").variants[""] == b"<p>two</p>"
@@ -63,3 +63,106 @@ async def test_stats_click_details(client, auth_headers):
     assert click["country"] == "US"
     assert "ip_hash" in click
     assert "clicked_at" in click
+
+
+@pytest.mark.asyncio
+async def test_stats_click_history_cursor(client, auth_headers):
+    create_resp = await client.post("/links", json={"url": "https://example.com"})
+    code = create_resp.json()["short_code"]
+    for _ in range(5):
+        await client.get(f"/{code}", follow_redirects=False)
+
+    response = await client.get(f"/links/{code}/stats?limit=2", headers=auth_headers)
+    data = response.json()
+    timestamps = [c["clicked_at"] for c in data["clicks"]]
+    pages = 1
+    while data["next_cursor"]:
+        response = await client.get(
+            f"/links/{code}/stats?limit=2&cursor={data['next_cursor']}", headers=auth_headers
+        )
+        data = response.json()
+        timestamps += [c["clicked_at"] for c in data["clicks"]]
+        pages += 1
+
+    assert pages == 3
+    assert len(timestamps) == 5
+    assert timestamps == sorted(timestamps, reverse=True)
+
+
+@pytest.mark.asyncio
+async def test_stats_invalid_cursor(client, auth_headers):
+    create_resp = await client.post("/links", json={"url": "https://example.com"})
+    code = create_resp.json()["short_code"]
+    response = await client.get(f"/links/{code}/stats?cursor=bogus", headers=auth_headers)
+    assert response.status_code == 400
+
+
+async def _link_with_clicks(client, count: int) -> str:
+    create_resp = await client.post("/links", json={"url": "https://example.com"})
+    code = create_resp.json()["short_code"]
+    for _ in range(count):
+        await client.get(f"/{code}", follow_redirects=False, headers={"cf-ipcountry": "US"})
+    return code
+
+
+@pytest.mark.asyncio
+async def test_export_requires_auth(client):
+    response = await client.get("/links/somecode/stats/export")
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_export_ndjson(client, auth_headers):
+    import json
+
+    code = await _link_with_clicks(client, 3)
+    response = await client.get(f"/links/{code}/stats/export", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 3
+    assert set(rows[0]) == {"clicked_at", "ip_hash", "referrer", "country"}
+    assert rows[0]["country"] == "US"
+
+
+@pytest.mark.asyncio
+async def test_export_csv_with_fields(client, auth_headers):
+    code = await _link_with_clicks(client, 2)
+    response = await client.get(
+        f"/links/{code}/stats/export?format=csv&fields=country,clicked_at", headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "country,clicked_at"
+    assert len(lines) == 3
+    assert lines[1].startswith("US,")
+
+
+@pytest.mark.asyncio
+async def test_export_date_range(client, auth_headers):
+    code = await _link_with_clicks(client, 2)
+    response = await client.get(
+        f"/links/{code}/stats/export?end=2020-01-01T00:00:00Z", headers=auth_headers
+    )
+    assert response.text == ""
+
+    response = await client.get(
+        f"/links/{code}/stats/export?start=2020-01-01T00:00:00Z", headers=auth_headers
+    )
+    assert len(response.text.splitlines()) == 2
+
+
+@pytest.mark.asyncio
+async def test_export_unknown_field(client, auth_headers):
+    code = await _link_with_clicks(client, 0)
+    response = await client.get(
+        f"/links/{code}/stats/export?fields=password", headers=auth_headers
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_export_not_found(client, auth_headers):
+    response = await client.get("/links/nonexistent/stats/export", headers=auth_headers)
+    assert response.status_code == 404
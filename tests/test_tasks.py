@@ -0,0 +1,33 @@
+import asyncio
+import logging
+
+import pytest
+
+from app.tasks import BackgroundTask
+
+
+class Flaky(BackgroundTask):
+    failure_message = "Flaky run failed"
+
+    def __init__(self):
+        super().__init__(interval=0)
+        self.runs = 0
+
+    async def run_once(self):
+        self.runs += 1
+        if self.runs == 1:
+            raise RuntimeError("boom")
+
+
+@pytest.mark.asyncio
+async def test_background_task_logs_failures_and_keeps_running(caplog):
+    task = Flaky()
+    with caplog.at_level(logging.ERROR):
+        task.start()
+        while task.runs < 3:
+            await asyncio.sleep(0)
+        await task.stop()
+
+    assert not task.running
+    # Logged under the subclass's module
+    assert [(r.name, r.message) for r in caplog.records] == [(__name__, "Flaky run failed")]
@@ -1,22 +1,6 @@
 import pytest
 
-from app.utils import generate_short_code, hash_ip, generate_qr_code_bytes, generate_qr_code_base64, build_short_url
-
-
-def test_generate_short_code_default_length():
-    code = generate_short_code()
-    assert len(code) == 8
-    assert code.isalnum()
-
-
-def test_generate_short_code_custom_length():
-    code = generate_short_code(length=12)
-    assert len(code) == 12
-
-
-def test_generate_short_code_uniqueness():
-    codes = {generate_short_code() for _ in range(100)}
-    assert len(codes) == 100  # All unique (statistically guaranteed for 62^8)
+from app.utils import hash_ip, generate_qr_code_bytes, generate_qr_code_base64, build_short_url
 
 
 def test_hash_ip():
@@ -41,3 +25,24 @@ def test_generate_qr_code_base64():
 def test_build_short_url():
     url = build_short_url("abc123")
     assert url.endswith("/abc123")
+
+
+def test_etag_matches():
+    from app.utils import etag_matches
+
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", "abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"x"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_insert_chunks_stay_under_parameter_limit():
+    from app.utils import SQLITE_MAX_VARIABLES, insert_chunks
+
+    rows = [{"a": i, "b": i, "c": i} for i in range(25000)]
+    chunks = list(insert_chunks(rows))
+    assert [row for chunk in chunks for row in chunk] == rows
+    assert all(len(chunk) * 3 <= SQLITE_MAX_VARIABLES for chunk in chunks)
+    assert list(insert_chunks([])) == []
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.clicks import ClickEvent, write_clicks
+from app.hll import HyperLogLog
+from app.models import Link
+from app.utils import hash_ip
+from app.visitors import estimate_unique, exact_unique
+
+
+def test_hll_empty():
+    assert HyperLogLog().count() == 0
+
+
+def test_hll_estimate_within_error():
+    sketch = HyperLogLog()
+    for i in range(10000):
+        sketch.add(hash_ip(f"10.0.{i // 256}.{i % 256}"))
+    assert abs(sketch.count() - 10000) < 10000 * 0.1
+
+
+def test_hll_duplicates_counted_once():
+    sketch = HyperLogLog()
+    for _ in range(100):
+        sketch.add(hash_ip("127.0.0.1"))
+    assert sketch.count() == 1
+
+
+def test_hll_merge_is_union():
+    a, b = HyperLogLog(), HyperLogLog()
+    for i in range(500):
+        a.add(hash_ip(f"a{i}"))
+        b.add(hash_ip(f"b{i}"))
+    b.add(hash_ip("a1"))
+    a.merge(b)
+    assert abs(a.count() - 1000) < 100
+    assert HyperLogLog(a.to_bytes()).count() == a.count()
+
+
+@pytest.mark.asyncio
+async def test_estimate_unique_windows(session_factory):
+    today = datetime.now(timezone.utc)
+    async with session_factory() as session:
+        link = Link(short_code="visitors", original_url="https://example.com/")
+        session.add(link)
+        await session.commit()
+
+        events = [
+            ClickEvent(link_id=link.id, ip_hash=hash_ip(ip), referrer=None,
+                       country="unknown", clicked_at=clicked_at)
+            for ip, clicked_at in [
+                ("1.1.1.1", today),
+                ("2.2.2.2", today),
+                ("1.1.1.1", today - timedelta(days=10)),
+                ("3.3.3.3", today - timedelta(days=10)),
+            ]
+        ]
+        # Written in two batches to exercise merging with stored registers
+        await write_clicks(session, events[:2])
+        await write_clicks(session, events[2:])
+        await session.commit()
+
+        assert await estimate_unique(session, link.id) == 3
+        assert await exact_unique(session, link.id) == 3
+        assert await estimate_unique(session, link.id, since=today.date()) == 2
+        assert await estimate_unique(
+            session, link.id, until=(today - timedelta(days=1)).date()
+        ) == 2
+
+
+@pytest.mark.asyncio
+async def test_stats_exact_unique(client, auth_headers):
+    create_resp = await client.post("/links", json={"url": "https://example.com"})
+    code = create_resp.json()["short_code"]
+    await client.get(f"/{code}", follow_redirects=False)
+
+    estimated = (await client.get(f"/links/{code}/stats", headers=auth_headers)).json()
+    assert estimated["unique_clicks"] == 1
+    assert estimated["unique_clicks_estimated"] is True
+    assert estimated["unique_clicks_7d"] == 1
+
+    exact = (await client.get(f"/links/{code}/stats?exact=true", headers=auth_headers)).json()
+    assert exact["unique_clicks"] == 1
+    assert exact["unique_clicks_estimated"] is False